@@ -1,4 +1,24 @@
-WITH faixas_com_limites AS (
+-- Parâmetros: @data_inicio e @data_fim (DATE)
+-- Janela de leitura: desde o início do mês ANTERIOR a @data_inicio (lookback para o
+-- acumulado do mês e para o deslocamento seq/seq1, que usa o PL do dia útil anterior)
+-- até o último dia do mês de @data_fim.
+-- PL e dias úteis terminam na MESMA data: seq (quotas) e seq1 (x_variavel/x_minimo) são
+-- numerados a partir do dia mais recente de cada um, então cortar só o calendário
+-- desalinharia o join seq = seq1 - 1 em períodos passados.
+-- @dias_uteis (ARRAY<DATE>): dias úteis da janela, montado por calendario.py.
+-- Filtros opcionais: @fund_ids (ARRAY<INT64>, vazio = todos) e @servico (STRING, NULL = todos).
+-- São aplicados já nas fontes (PL, faixas, carteira) e em cada ramo de `y`; como faixas, seq/seq1
+-- e acumulados são calculados por fundo, o resultado filtrado é igual ao da query completa.
+-- PL: lido uma única vez de finance.pl_diario (ver create_table_pl_diario.sql / pl_diario.py).
+WITH pl_diario AS (
+    SELECT fund_id, reference_dt, net_worth, net_worth_positivo
+    FROM `kanastra-live.finance.pl_diario`
+    WHERE reference_dt >= DATE_SUB(DATE_TRUNC(@data_inicio, MONTH), INTERVAL 1 MONTH)
+    -- Mesmo limite superior de @dias_uteis (calendario.janela_calculadora)
+    AND reference_dt <= LAST_DAY(@data_fim, MONTH)
+    AND (ARRAY_LENGTH(@fund_ids) = 0 OR fund_id IN UNNEST(@fund_ids))
+)
+, faixas_com_limites AS (
     SELECT 
         fv.cliente,
         empresa,
@@ -8,6 +28,7 @@ WITH faixas_com_limites AS (
         fv.fee_variavel, 
         fv.servico
     FROM finance.fee_variavel fv
+    WHERE (@servico IS NULL OR CASE WHEN fv.servico LIKE '%Admini%' THEN 'Administração' ELSE fv.servico END = @servico)
 )
 , faixas_com_limites_minimo AS ( 
     SELECT 
@@ -19,6 +40,7 @@ WITH faixas_com_limites AS (
         fm.fee_min, 
         fm.servico
     FROM finance.fee_minimo fm 
+    WHERE (@servico IS NULL OR CASE WHEN fm.servico LIKE '%Admini%' THEN 'Administração' ELSE fm.servico END = @servico)
 ),
 soma_diaria_pl AS (
     SELECT
@@ -27,20 +49,8 @@ soma_diaria_pl AS (
         q.reference_dt AS dia,
         SUM(q.net_worth) AS pl_total_diario
     FROM hub.funds i 
-    LEFT JOIN 
-    ( SELECT fund_id, reference_dt, net_worth
-    from investment.quotas WHERE  fund_id NOT in (302,76)
-    UNION ALL
-    select 
-fund_id,
-reference_dt,
-sum(market_value) as pl
-from investment.wallet
-where external_id = 11301
-and fund_id in (302,76)
-group by 1,2
-    )
-    q ON i.id = q.fund_id 
+    LEFT JOIN pl_diario q ON i.id = q.fund_id 
+    WHERE (ARRAY_LENGTH(@fund_ids) = 0 OR i.id IN UNNEST(@fund_ids))
     GROUP BY q.fund_id, q.reference_dt, i.name
 )
 ,faixa_variavel AS (
@@ -99,26 +109,13 @@ LEFT JOIN faixas_com_limites_minimo fm
     GROUP BY s.fund_id, s.dia, fm.servico, s.pl_total_diario, fm.fee_min, empresa    
     -- order by  s.dia desc
 ),
-BusinessDaysCount AS (
-    SELECT
-        DATE_TRUNC(DATE, MONTH) AS month_start,
-        COUNT(*) AS business_days_in_month
-    FROM investment.calendar
-    WHERE is_business_day_br IS TRUE
-    AND DATE >= DATE('2024-01-01')
-    AND DATE <= DATE('2026-01-01') 
-    GROUP BY DATE_TRUNC(DATE, MONTH)
-),
+-- Dias úteis vêm do calendário em cache (calendario.py) como @dias_uteis (ARRAY<DATE>),
+-- cobrindo meses inteiros do início do mês anterior a @data_inicio até o fim do mês de @data_fim
 dias_uteis AS (
     SELECT
-        c.date,
-
-        b.business_days_in_month
-    FROM investment.calendar c
-    JOIN BusinessDaysCount b ON DATE_TRUNC(DATE, MONTH) = b.month_start
-    WHERE c.is_business_day_br IS TRUE
-    AND c.DATE >= DATE('2024-01-01') 
-    AND c.DATE <= DATE('2026-01-01')
+        date,
+        COUNT(*) OVER (PARTITION BY DATE_TRUNC(date, MONTH)) AS business_days_in_month
+    FROM UNNEST(@dias_uteis) AS date
 )
 , taxas AS (
 SELECT 
@@ -155,22 +152,10 @@ GROUP BY 1,2,3,4,5
 SELECT 
     fund_id, 
     reference_dt, 
-    SUM(net_worth) AS pl, 
+    net_worth_positivo AS pl, 
     ROW_NUMBER() OVER (PARTITION BY fund_id ORDER BY reference_dt desc) AS seq
-FROM     ( SELECT fund_id, reference_dt, net_worth
-    from investment.quotas WHERE  fund_id NOT in (302,76)
-    UNION ALL
-    select 
-fund_id,
-reference_dt,
-sum(market_value) as pl
-from investment.wallet
-where external_id = 11301
-and fund_id in (302,76)
-group by 1,2
-    )
-where net_worth > 0
-GROUP BY fund_id, reference_dt
+FROM pl_diario
+where net_worth_positivo IS NOT NULL
 
 )
 
@@ -202,18 +187,7 @@ SELECT
 FROM taxas 
 INNER JOIN hub.funds f ON id_fundo = id
 INNER JOIN dias_uteis du ON du.date = dia
-LEFT JOIN (SELECT fund_id, reference_dt, sum(net_worth) net_worth from     ( SELECT fund_id, reference_dt, net_worth
-    from investment.quotas WHERE  fund_id NOT in (302,76)
-    UNION ALL
-    select 
-fund_id,
-reference_dt,
-sum(market_value) as pl
-from investment.wallet
-where external_id = 11301
-and fund_id in (302,76)
-group by 1,2
-    ) where net_worth > 0 group by 1,2) q ON q.fund_id = id_fundo and  dia = reference_dt
+LEFT JOIN (SELECT fund_id, reference_dt, net_worth_positivo AS net_worth FROM pl_diario WHERE net_worth_positivo IS NOT NULL) q ON q.fund_id = id_fundo and  dia = reference_dt
 where net_worth > 0
 GROUP BY dia, id_fundo, f.name, government_id, net_worth
 )
@@ -282,18 +256,7 @@ END) AS fee_min_diario_gestao,
 FROM taxas 
 INNER JOIN hub.funds f ON id_fundo = id
 INNER JOIN dias_uteis du ON du.date = dia
-LEFT JOIN (SELECT fund_id, reference_dt, sum(net_worth) net_worth from     ( SELECT fund_id, reference_dt, net_worth
-    from investment.quotas WHERE  fund_id NOT in (302,76)
-    UNION ALL
-    select 
-fund_id,
-reference_dt,
-sum(market_value) as pl
-from investment.wallet
-where external_id = 11301
-and fund_id in (302,76)
-group by 1,2
-    )group by 1,2) q ON q.fund_id = id_fundo and  dia = reference_dt
+LEFT JOIN pl_diario q ON q.fund_id = id_fundo and  dia = reference_dt
 -- LEFT JOIN correcoes c ON id_fundo = id_fundo  
 
 GROUP BY dia, id_fundo, f.name, government_id, net_worth, business_days_in_month
@@ -354,84 +317,18 @@ LEFT JOIN dias_uteis du on du.date =  q.reference_dt
         kanastra-live.hub.funds AS f
     CROSS JOIN 
         dias_uteis AS d
+    WHERE (ARRAY_LENGTH(@fund_ids) = 0 OR f.id IN UNNEST(@fund_ids))
 )
 
-, indices AS (
-SELECT
-    f.fund_id, 
-    DATE_TRUNC(f.inicio_fundo, month) AS data_inicio,
-    i.ref_date,
-    DATE_DIFF(i.ref_date, DATE_TRUNC(f.inicio_fundo, month), MONTH) AS dif_meses,
-    DIV(DATE_DIFF(i.ref_date, DATE_TRUNC(f.inicio_fundo, month), MONTH), 12) * 12 AS mes_corretor,
-    i.igpm,
-    CASE 
-        WHEN f.indice_correcao = 'igpm' 
-            THEN EXP(SUM(LOG(1 + COALESCE(i.igpm, 0) / 100)) 
-                     OVER (PARTITION BY f.fund_id, DIV(DATE_DIFF(i.ref_date, DATE_TRUNC( DATE_ADD(f.inicio_fundo, INTERVAL 1 MONTH) , month), MONTH), 12)
-                           ORDER BY i.ref_date))
-        WHEN f.indice_correcao = 'ipca' 
-            THEN EXP(SUM(LOG(1 + COALESCE(i.ipca, 0) / 100)) 
-                     OVER (PARTITION BY f.fund_id, DIV(DATE_DIFF(i.ref_date, DATE_TRUNC( DATE_ADD(f.inicio_fundo, INTERVAL 1 MONTH) , month), MONTH), 12)
-                           ORDER BY i.ref_date))
-        WHEN f.indice_correcao = 'ipc_fipe' 
-            THEN EXP(SUM(LOG(1 + COALESCE(i.ipc_fipe, 0) / 100)) 
-                     OVER (PARTITION BY f.fund_id, DIV(DATE_DIFF(i.ref_date, DATE_TRUNC( DATE_ADD(f.inicio_fundo, INTERVAL 1 MONTH) , month), MONTH), 12)
-                           ORDER BY i.ref_date))
-    END AS fator_correcao_mes
-FROM
-    kanastra-live.finance.correcao_aux_v3 f
-LEFT JOIN
-    kanastra-live.finance.indices_v3 i 
-        ON i.ref_date >= DATE_TRUNC( DATE_ADD(f.inicio_fundo, INTERVAL 1 MONTH) , month)
-)
-, fatores_marco as (
-
-SELECT 
-fund_id,
-data_inicio,
-ref_date,	
-dif_meses,	
-mes_corretor,	
-CASE WHEN fator_correcao_mes < 1 THEN 1 ELSE fator_correcao_mes END AS fator_correcao_marco
-FROM indices 
-where dif_meses IN (12,24,36,48,60,72,84)
-)
-, fatores1 as (
-SELECT
-  i.fund_id,
-  i.data_inicio,
-  i.ref_date,
-  i.dif_meses,
-  i.mes_corretor,
-  COALESCE(f.fator_correcao_marco, 1) AS fator_correcao
-FROM indices i
-LEFT JOIN fatores_marco f
-  ON f.fund_id = i.fund_id
- AND f.mes_corretor = i.mes_corretor
--- opcional: limitar até 5 anos
--- WHERE i.dif_meses < 60
-ORDER BY i.ref_date
-
-)
-, multiplicadores1 as (
-
-  SELECT
-    fund_id,
-    data_inicio,
-    dif_meses,
-    DATE_ADD(ref_date, INTERVAL 1 MONTH) AS mes_seguinte,
-    CASE WHEN fator_correcao < 1 THEN 1 ELSE fator_correcao END AS fator_correcao1
-  FROM fatores1
---   WHERE fund_id = 116
-)
-
+-- Fator de correção anual (IGPM/IPCA/IPC-FIPE) materializado por fatores_correcao.py
+-- (cadeia indices → fatores_marco → fatores1 → multiplicadores)
 , multiplicadores as (
 SELECT
-  *,
-  EXP(SUM(LN(CASE WHEN MOD(dif_meses,12)=0 THEN fator_correcao1 ELSE 1 END)) 
-      OVER (PARTITION BY fund_id ORDER BY dif_meses ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
-     ) AS fator_correcao
-FROM multiplicadores1
+  fund_id,
+  mes AS mes_seguinte,
+  fator_correcao
+FROM `kanastra-live.finance.fatores_correcao`
+WHERE (ARRAY_LENGTH(@fund_ids) = 0 OR fund_id IN UNNEST(@fund_ids))
 )
 
 
@@ -538,6 +435,7 @@ FROM (
             WHEN servico = 'Custódia Kanastra' AND COALESCE(gross,0) > 0 THEN 'Consultoria'
         END AS serv_name
     FROM kanastra-live.finance.gross_up
+    WHERE (ARRAY_LENGTH(@fund_ids) = 0 OR fund_id IN UNNEST(@fund_ids))
 ) t
 -- WHERE serv_name IS NOT NULL
 GROUP BY fund_id
@@ -616,6 +514,8 @@ SELECT
 FROM kanastra-live.investment.wallet
 WHERE account_name_1 = 'passivo'
   AND account_name_2 = 'provisao'
+  AND reference_dt BETWEEN @data_inicio AND @data_fim
+  AND (ARRAY_LENGTH(@fund_ids) = 0 OR fund_id IN UNNEST(@fund_ids))
 GROUP BY reference_dt, fund_id
 
 )
@@ -641,6 +541,7 @@ SELECT
     null as is_missing
 FROM tabela3 t
 LEFT JOIN carteira C ON c.fund_id = t.fund_id AND c.reference_dt = date_ref
+WHERE (@servico IS NULL OR @servico = 'Administração')
 
 UNION ALL
 
@@ -664,6 +565,7 @@ SELECT
     null as is_missing
 FROM tabela3 t
 LEFT JOIN carteira C ON c.fund_id = t.fund_id AND c.reference_dt = date_ref
+WHERE (@servico IS NULL OR @servico = 'Gestão')
 
 UNION ALL
 
@@ -688,6 +590,7 @@ SELECT
     null as is_missing
 FROM tabela3 t
 LEFT JOIN carteira C ON c.fund_id = t.fund_id AND c.reference_dt = date_ref
+WHERE (@servico IS NULL OR @servico = 'Custódia')
 
 UNION ALL
 
@@ -711,6 +614,7 @@ SELECT
     null as is_missing
 FROM tabela3 t
 LEFT JOIN carteira C ON c.fund_id = t.fund_id AND c.reference_dt = date_ref
+WHERE (@servico IS NULL OR @servico = 'Custódia Kanastra')
 )
 , sinqia as (
 
@@ -734,4 +638,5 @@ inner join kanastra-live.hub.funds f on f.id = fund_id
 LEFT JOIN sinqia s on s.fund_id = y.fund_id
 
 where acumulado > 0
+and date_ref BETWEEN @data_inicio AND @data_fim
 -- and fund_id =101
\ No newline at end of file
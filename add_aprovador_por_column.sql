@@ -0,0 +1,8 @@
+-- Adicionar coluna de aprovador nas alterações pendentes
+-- Aplicado por migracoes.py (antes era um ALTER TABLE a cada atualização de status)
+
+ALTER TABLE `kanastra-live.finance.alteracoes_pendentes`
+ADD COLUMN IF NOT EXISTS aprovador_por STRING;
+
+-- Comentários:
+-- aprovador_por: Nome do aprovador que aprovou/rejeitou a solicitação (motor_aprovacao.py)
@@ -0,0 +1,127 @@
+"""
+Atualização em Segundo Plano - Calculadora 5.0
+Stale-while-revalidate sobre o cache em disco: enquanto um resultado vencido continua
+sendo exibido (com a sua idade), uma thread recalcula e publica a versão nova, que é
+trocada de forma atômica pelo manifesto do cache
+"""
+import fcntl
+import os
+import random
+import threading
+import time
+
+# Idade a partir da qual um resultado é recalculado em segundo plano (segundos)
+TTL_RESULTADO = 600
+
+# Fração aleatória somada ao TTL em cada verificação, para que sessões e processos não
+# vençam o mesmo resultado no mesmo instante
+JITTER = 0.2
+
+
+class AtualizadorResultados:
+    """Recalcula resultados vencidos em segundo plano, um por chave
+
+    A guarda de atualização única vale dentro do processo (conjunto de chaves em
+    andamento) e entre processos (`flock` não bloqueante em um arquivo por chave no
+    diretório do cache): só quem obtém a trava dispara o recálculo. O arquivo da trava
+    é apagado ao final do recálculo, para não acumular um por chave no diretório.
+
+    Args:
+        cache: CacheResultados onde a versão nova é publicada
+        ttl: Idade máxima antes de recalcular (segundos)
+        jitter: Fração aleatória somada ao TTL em cada verificação
+    """
+
+    def __init__(self, cache, ttl=TTL_RESULTADO, jitter=JITTER):
+        self.cache = cache
+        self.ttl = ttl
+        self.jitter = jitter
+        self.erros = {}
+        self._em_andamento = set()
+        self._trava = threading.Lock()
+
+    def idade(self, chave):
+        """Segundos desde a publicação da versão atual (None se a chave não estiver em cache)"""
+        entrada = self.cache.informacoes(chave)
+        return time.time() - entrada['criado_em'] if entrada else None
+
+    def vencido(self, chave):
+        """True se a versão atual passou do TTL (com jitter)"""
+        idade = self.idade(chave)
+        return idade is not None and idade > self.ttl * (1 + random.uniform(0, self.jitter))
+
+    def em_andamento(self, chave):
+        with self._trava:
+            return chave in self._em_andamento
+
+    def agendar(self, chave, calcular):
+        """Dispara o recálculo da chave em uma thread, se ninguém já estiver recalculando
+
+        Args:
+            calcular: Função sem argumentos que devolve (DataFrame, metadados); não pode
+                usar a API do Streamlit (roda fora do script da sessão)
+
+        Returns:
+            True se esta chamada disparou o recálculo
+        """
+        with self._trava:
+            if chave in self._em_andamento:
+                return False
+            trava_arquivo = self._travar_arquivo(chave)
+            if trava_arquivo is None:
+                return False
+            self._em_andamento.add(chave)
+
+        threading.Thread(
+            target=self._executar, args=(chave, calcular, trava_arquivo), daemon=True
+        ).start()
+        return True
+
+    def _caminho_trava(self, chave):
+        return os.path.join(self.cache.diretorio, f"{chave}.atualizacao.lock")
+
+    def _travar_arquivo(self, chave):
+        """Trava exclusiva entre processos (None se outro processo já está recalculando)
+
+        Quem libera a trava apaga o arquivo antes de soltá-la; um processo que abriu o
+        arquivo antigo pode obter a trava depois disso, então a trava só vale se o arquivo
+        travado ainda for o que está no caminho (mesmo inode). Senão, tenta de novo.
+        """
+        caminho = self._caminho_trava(chave)
+        while True:
+            arquivo = open(caminho, 'a')
+            try:
+                fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                arquivo.close()
+                return None
+            try:
+                valida = os.stat(caminho).st_ino == os.fstat(arquivo.fileno()).st_ino
+            except FileNotFoundError:
+                valida = False
+            if valida:
+                return arquivo
+            fcntl.flock(arquivo, fcntl.LOCK_UN)
+            arquivo.close()
+
+    def _liberar_arquivo(self, chave, arquivo):
+        """Apaga o arquivo da trava (ainda travado) e solta a trava"""
+        try:
+            os.remove(self._caminho_trava(chave))
+        except FileNotFoundError:
+            pass
+        fcntl.flock(arquivo, fcntl.LOCK_UN)
+        arquivo.close()
+
+    def _executar(self, chave, calcular, trava_arquivo):
+        try:
+            df, metadados = calcular()
+            self.cache.gravar(chave, df, metadados)
+            self.erros.pop(chave, None)
+        except Exception as e:
+            # Mantém a versão anterior em exibição; o erro fica disponível para a tela
+            self.erros[chave] = str(e)
+        finally:
+            self._liberar_arquivo(chave, trava_arquivo)
+            with self._trava:
+                self._em_andamento.discard(chave)
@@ -0,0 +1,264 @@
+"""
+Cache de Resultados em Disco - Calculadora 5.0
+Guarda o resultado das queries em arquivos Arrow IPC com um manifesto JSON, compartilhado
+por todos os processos do servidor: um restart ou deploy volta a exibir o último resultado
+sem reexecutar a query no BigQuery, e cada processo abre o arquivo com memory map
+"""
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date
+import pandas as pd
+import pyarrow as pa
+
+# Diretório compartilhado pelos processos (configurável por variável de ambiente)
+DIRETORIO_PADRAO = os.environ.get(
+    'CALCULADORA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'calculadora_cache')
+)
+
+# Orçamento de disco (MB); os resultados menos usados recentemente são removidos primeiro
+LIMITE_MB_PADRAO = int(os.environ.get('CALCULADORA_CACHE_MB', '2048'))
+
+ARQUIVO_MANIFESTO = 'manifesto.json'
+ARQUIVO_TRAVA = 'manifesto.lock'
+
+# Textos lidos como string[pyarrow] para apontarem direto para o arquivo mapeado
+_TIPOS_ZERO_COPIA = {pa.string(): pd.StringDtype('pyarrow'), pa.large_string(): pd.StringDtype('pyarrow')}
+
+_instancias = {}
+
+
+def token_diario():
+    """Token de frescor padrão: as fontes da calculadora são carregadas uma vez por dia"""
+    return date.today().isoformat()
+
+
+def chave_resultado(query, parametros=None, token_fonte=None):
+    """Hash do texto SQL, dos parâmetros e do token de frescor das fontes"""
+    conteudo = json.dumps(
+        {'query': query, 'parametros': parametros or {}, 'token_fonte': token_fonte},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+class CacheResultados:
+    """Resultados (DataFrames) em Arrow IPC com manifesto e remoção LRU
+
+    O manifesto guarda, por chave: arquivo e versão publicados, tamanho, criação e
+    metadados livres (ex.: MB processados pela query original). Consultas travam o
+    manifesto com `flock` compartilhado e não o regravam; alterações usam a trava
+    exclusiva e publicam o manifesto com `os.replace` (atômico) só quando algo mudou.
+    O último acesso (LRU) fica no mtime do arquivo de dados, atualizado com `os.utime`
+    sem passar pelo manifesto.
+
+    Args:
+        diretorio: Diretório do cache (padrão: CALCULADORA_CACHE_DIR)
+        limite_bytes: Orçamento de disco (padrão: CALCULADORA_CACHE_MB)
+    """
+
+    def __init__(self, diretorio=None, limite_bytes=None):
+        self.diretorio = diretorio or DIRETORIO_PADRAO
+        self.limite_bytes = limite_bytes if limite_bytes is not None else LIMITE_MB_PADRAO * 1024 * 1024
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._caminho_manifesto = os.path.join(self.diretorio, ARQUIVO_MANIFESTO)
+        self._caminho_trava = os.path.join(self.diretorio, ARQUIVO_TRAVA)
+
+    @contextmanager
+    def _manifesto(self):
+        """Manifesto com trava exclusiva; regravado ao sair do bloco se tiver sido alterado"""
+        with open(self._caminho_trava, 'a') as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+            try:
+                manifesto = self._ler_manifesto()
+                original = json.dumps(manifesto, sort_keys=True)
+                yield manifesto
+                if json.dumps(manifesto, sort_keys=True) != original:
+                    self._gravar_manifesto(manifesto)
+            finally:
+                fcntl.flock(trava, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _manifesto_leitura(self):
+        """Manifesto com trava compartilhada (leitores simultâneos), somente consulta"""
+        with open(self._caminho_trava, 'a') as trava:
+            fcntl.flock(trava, fcntl.LOCK_SH)
+            try:
+                yield self._ler_manifesto()
+            finally:
+                fcntl.flock(trava, fcntl.LOCK_UN)
+
+    def _ler_manifesto(self):
+        try:
+            with open(self._caminho_manifesto, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # Manifesto ausente ou corrompido: recomeça vazio (arquivos órfãos são sobrescritos)
+            return {}
+
+    def _gravar_manifesto(self, manifesto):
+        temporario = f"{self._caminho_manifesto}.{uuid.uuid4().hex}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f)
+        os.replace(temporario, self._caminho_manifesto)
+
+    def _caminho(self, arquivo):
+        return os.path.join(self.diretorio, arquivo)
+
+    def ler(self, chave):
+        """Retorna (DataFrame, metadados) ou None se a chave não estiver em cache
+
+        O arquivo é aberto com memory map: colunas numéricas, datas e textos do DataFrame
+        apontam para as páginas do arquivo (cache de páginas do SO, compartilhado entre
+        processos), sem cópia. O mapeamento é aberto com o manifesto travado (trava
+        compartilhada), então uma versão nova publicada em seguida não invalida a leitura
+        em andamento.
+        """
+        with self._manifesto_leitura() as manifesto:
+            entrada = manifesto.get(chave)
+            if entrada is None:
+                return None
+            try:
+                mapa = pa.memory_map(self._caminho(entrada['arquivo']), 'r')
+            except (FileNotFoundError, OSError):
+                mapa = None
+            else:
+                self._registrar_acesso(entrada['arquivo'])
+
+        if mapa is None:
+            self._remover_versao(chave, entrada.get('versao'))
+            return None
+        try:
+            tabela = pa.ipc.open_file(mapa).read_all()
+        except pa.ArrowInvalid:
+            # Arquivo ilegível (gravação interrompida): tratado como ausência
+            self._remover_versao(chave, entrada.get('versao'))
+            return None
+        df = tabela.to_pandas(split_blocks=True, types_mapper=_TIPOS_ZERO_COPIA.get)
+        return df, dict(entrada.get('metadados', {}), versao=entrada.get('versao'), criado_em=entrada['criado_em'])
+
+    def gravar(self, chave, df, metadados=None):
+        """Publica uma nova versão do resultado e aplica o orçamento de disco (LRU)
+
+        Cada versão vai para um arquivo próprio; a troca de versão é a gravação atômica
+        do manifesto. O arquivo anterior é apagado, mas processos que já o mapearam
+        continuam lendo a versão antiga até recarregar.
+        """
+        versao = uuid.uuid4().hex
+        arquivo = f"{chave}.{versao}.arrow"
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        try:
+            # Sem compressão: o memory map só evita cópias com buffers gravados como estão
+            with pa.OSFile(self._caminho(arquivo), 'wb') as destino:
+                with pa.ipc.new_file(destino, tabela.schema) as escritor:
+                    escritor.write_table(tabela)
+        except Exception:
+            self._remover_arquivo(arquivo)
+            raise
+        tamanho = os.path.getsize(self._caminho(arquivo))
+
+        with self._manifesto() as manifesto:
+            anterior = manifesto.get(chave)
+            manifesto[chave] = {
+                'arquivo': arquivo,
+                'versao': versao,
+                'bytes': tamanho,
+                'criado_em': time.time(),
+                'metadados': metadados or {},
+            }
+            if anterior:
+                self._remover_arquivo(anterior['arquivo'])
+            self._aplicar_limite(manifesto, preservar=chave)
+        return versao
+
+    def informacoes(self, chave):
+        """Entrada do manifesto (arquivo, versão, criação, último acesso, metadados) sem ler os dados"""
+        with self._manifesto_leitura() as manifesto:
+            entrada = manifesto.get(chave)
+            if not entrada:
+                return None
+            return dict(entrada, ultimo_acesso=self._ultimo_acesso(entrada))
+
+    def versao_atual(self, chave):
+        """Versão publicada da chave (None se ausente), sem ler os dados"""
+        with self._manifesto_leitura() as manifesto:
+            entrada = manifesto.get(chave)
+            return entrada.get('versao') if entrada else None
+
+    def _registrar_acesso(self, arquivo):
+        """Marca o acesso no mtime do arquivo de dados (sem regravar o manifesto)"""
+        try:
+            os.utime(self._caminho(arquivo))
+        except OSError:
+            pass
+
+    def _ultimo_acesso(self, entrada):
+        """Último acesso da entrada: mtime do arquivo de dados (criação, se indisponível)"""
+        try:
+            return os.path.getmtime(self._caminho(entrada['arquivo']))
+        except OSError:
+            return entrada['criado_em']
+
+    def _aplicar_limite(self, manifesto, preservar=None):
+        """Remove as entradas menos usadas até caber no orçamento"""
+        total = sum(entrada['bytes'] for entrada in manifesto.values())
+        if total <= self.limite_bytes:
+            return
+        acessos = {chave: self._ultimo_acesso(entrada) for chave, entrada in manifesto.items()}
+        for chave in sorted(manifesto, key=acessos.get):
+            if total <= self.limite_bytes:
+                break
+            if chave == preservar:
+                continue
+            total -= manifesto[chave]['bytes']
+            self._remover_arquivo(manifesto.pop(chave)['arquivo'])
+
+    def _remover_arquivo(self, arquivo):
+        try:
+            os.remove(self._caminho(arquivo))
+        except FileNotFoundError:
+            pass
+
+    def remover(self, chave):
+        """Remove uma entrada do cache"""
+        with self._manifesto() as manifesto:
+            entrada = manifesto.pop(chave, None)
+            if entrada:
+                self._remover_arquivo(entrada['arquivo'])
+
+    def _remover_versao(self, chave, versao):
+        """Remove a entrada só se ainda estiver na versão lida (outra pode ter sido publicada)"""
+        with self._manifesto() as manifesto:
+            entrada = manifesto.get(chave)
+            if entrada and entrada.get('versao') == versao:
+                del manifesto[chave]
+                self._remover_arquivo(entrada['arquivo'])
+
+    def limpar(self):
+        """Remove todas as entradas do cache"""
+        with self._manifesto() as manifesto:
+            for entrada in manifesto.values():
+                self._remover_arquivo(entrada['arquivo'])
+            manifesto.clear()
+
+    def estatisticas(self):
+        """Quantidade de entradas e bytes ocupados"""
+        with self._manifesto_leitura() as manifesto:
+            return {
+                'entradas': len(manifesto),
+                'bytes': sum(entrada['bytes'] for entrada in manifesto.values()),
+                'limite_bytes': self.limite_bytes,
+            }
+
+
+def obter_cache(diretorio=None):
+    """Instância do cache por diretório (reaproveitada dentro do processo)"""
+    diretorio = diretorio or DIRETORIO_PADRAO
+    if diretorio not in _instancias:
+        _instancias[diretorio] = CacheResultados(diretorio)
+    return _instancias[diretorio]
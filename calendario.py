@@ -0,0 +1,154 @@
+"""
+Calendário de Dias Úteis - Calculadora 5.0
+Carrega `investment.calendar` (is_business_day_br) uma vez, mantém em cache por
+processo e oferece consultas vetorizadas sobre arrays de datas
+"""
+import time
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from google.cloud import bigquery
+
+# Início da janela carregada (primeira data usada pela calculadora)
+DATA_INICIO_PADRAO = date(2024, 1, 1)
+
+# A janela é estendida até pelo menos hoje + esta folga (dias)
+FOLGA_FUTURO_DIAS = 400
+
+# Validade do cache em memória (segundos)
+TTL_CALENDARIO = 24 * 3600
+
+QUERY_CALENDARIO = """
+SELECT date
+FROM `kanastra-live.investment.calendar`
+WHERE is_business_day_br IS TRUE
+  AND date BETWEEN @data_inicio AND @data_fim
+ORDER BY date
+"""
+
+_cache = {'calendario': None, 'carregado_em': 0.0}
+
+
+def _para_dias(datas):
+    """Converte datas (date, Timestamp, string ou arrays) para numpy datetime64[D]"""
+    return np.asarray(pd.to_datetime(datas), dtype='datetime64[D]')
+
+
+class CalendarioUteis:
+    """Dias úteis ordenados com consultas vetorizadas (busca binária)
+
+    Args:
+        dias_uteis: Datas com is_business_day_br = TRUE
+        data_inicio, data_fim: Janela coberta (padrão: primeiro e último dia útil)
+    """
+
+    def __init__(self, dias_uteis, data_inicio=None, data_fim=None):
+        dias = np.unique(_para_dias(pd.Series(dias_uteis)))
+        self.dias = dias
+        self.data_inicio = _para_dias([data_inicio])[0] if data_inicio is not None else (dias[0] if len(dias) else None)
+        self.data_fim = _para_dias([data_fim])[0] if data_fim is not None else (dias[-1] if len(dias) else None)
+
+        # Mês de cada dia útil e contagem de dias úteis por mês
+        meses = dias.astype('datetime64[M]')
+        self._meses, self._qtd_mes = np.unique(meses, return_counts=True)
+
+    def cobre(self, data_inicio, data_fim):
+        """True se a janela carregada contém [data_inicio, data_fim]"""
+        inicio, fim = _para_dias([data_inicio, data_fim])
+        return self.data_inicio is not None and self.data_inicio <= inicio and fim <= self.data_fim
+
+    def eh_dia_util(self, datas):
+        """Array booleano: a data é dia útil"""
+        datas = _para_dias(datas)
+        pos = np.searchsorted(self.dias, datas)
+        pos_valida = np.minimum(pos, len(self.dias) - 1)
+        return (pos < len(self.dias)) & (self.dias[pos_valida] == datas)
+
+    def dias_uteis_no_mes(self, datas):
+        """Quantidade de dias úteis do mês de cada data (0 se o mês não tiver nenhum)"""
+        meses = _para_dias(datas).astype('datetime64[M]')
+        pos = np.searchsorted(self._meses, meses)
+        pos_valida = np.minimum(pos, len(self._meses) - 1)
+        encontrado = (pos < len(self._meses)) & (self._meses[pos_valida] == meses)
+        return np.where(encontrado, self._qtd_mes[pos_valida], 0)
+
+    def ordinal_no_mes(self, datas):
+        """Posição do dia útil dentro do mês (1 = primeiro); dias não úteis recebem
+        a posição do último dia útil anterior no mesmo mês (0 se não houver)"""
+        datas = _para_dias(datas)
+        ate_data = np.searchsorted(self.dias, datas, side='right')
+        antes_do_mes = np.searchsorted(self.dias, datas.astype('datetime64[M]').astype('datetime64[D]'), side='left')
+        return ate_data - antes_do_mes
+
+    def proximo_dia_util(self, datas):
+        """Primeiro dia útil estritamente posterior (NaT além da janela)"""
+        pos = np.searchsorted(self.dias, _para_dias(datas), side='right')
+        return self._dia_na_posicao(pos)
+
+    def dia_util_anterior(self, datas):
+        """Último dia útil estritamente anterior (NaT antes da janela)"""
+        pos = np.searchsorted(self.dias, _para_dias(datas), side='left') - 1
+        return self._dia_na_posicao(pos)
+
+    def dias_uteis_entre(self, data_inicio, data_fim):
+        """Dias úteis em [data_inicio, data_fim]"""
+        inicio, fim = _para_dias([data_inicio, data_fim])
+        return self.dias[np.searchsorted(self.dias, inicio):np.searchsorted(self.dias, fim, side='right')]
+
+    def _dia_na_posicao(self, pos):
+        valido = (pos >= 0) & (pos < len(self.dias))
+        resultado = np.full(pos.shape, np.datetime64('NaT'), dtype='datetime64[D]')
+        resultado[valido] = self.dias[pos[valido]]
+        return resultado
+
+
+def carregar_calendario(client, data_inicio, data_fim):
+    """Lê os dias úteis de `investment.calendar` na janela informada"""
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter('data_inicio', 'DATE', data_inicio),
+            bigquery.ScalarQueryParameter('data_fim', 'DATE', data_fim),
+        ]
+    )
+    df = client.query(QUERY_CALENDARIO, job_config=job_config).to_dataframe()
+    return CalendarioUteis(df['date'], data_inicio=data_inicio, data_fim=data_fim)
+
+
+def obter_calendario(client, data_inicio=None, data_fim=None):
+    """Calendário em cache, recarregado quando expira ou quando a janela pedida não é coberta
+
+    A janela carregada vai de DATA_INICIO_PADRAO (ou antes, se pedido) até pelo menos
+    hoje + FOLGA_FUTURO_DIAS, então cresce sozinha com o passar do tempo.
+    """
+    inicio = min(pd.Timestamp(data_inicio).date(), DATA_INICIO_PADRAO) if data_inicio else DATA_INICIO_PADRAO
+    fim_minimo = date.today() + timedelta(days=FOLGA_FUTURO_DIAS)
+    fim = max(pd.Timestamp(data_fim).date(), fim_minimo) if data_fim else fim_minimo
+
+    calendario = _cache['calendario']
+    expirado = time.time() - _cache['carregado_em'] > TTL_CALENDARIO
+    if calendario is None or expirado or not calendario.cobre(inicio, data_fim or date.today()):
+        calendario = carregar_calendario(client, inicio, fim)
+        _cache['calendario'] = calendario
+        _cache['carregado_em'] = time.time()
+    return calendario
+
+
+def janela_calculadora(data_inicio, data_fim):
+    """Meses inteiros lidos pela Calculadora 5.0: do início do mês anterior a
+    data_inicio até o último dia do mês de data_fim"""
+    inicio = (pd.Timestamp(data_inicio).to_period('M') - 1).to_timestamp().date()
+    fim = pd.Timestamp(data_fim).to_period('M').to_timestamp(how='end').date()
+    return inicio, fim
+
+
+def parametro_dias_uteis(client, data_inicio, data_fim):
+    """Parâmetro @dias_uteis (ARRAY<DATE>) da Calculadora 5.0 para o período"""
+    inicio, fim = janela_calculadora(data_inicio, data_fim)
+    dias = obter_calendario(client, inicio, fim).dias_uteis_entre(inicio, fim)
+    return bigquery.ArrayQueryParameter('dias_uteis', 'DATE', dias.tolist())
+
+
+def limpar_cache():
+    """Descarta o calendário em memória (próxima chamada recarrega do BigQuery)"""
+    _cache['calendario'] = None
+    _cache['carregado_em'] = 0.0
@@ -0,0 +1,102 @@
+"""
+Chamada Única - Calculadora 5.0
+Coalescência de chamadas idênticas (single-flight): sessões que pedem a mesma chave
+enquanto um job está em andamento aguardam esse job e recebem o mesmo resultado, em vez
+de disparar outra query no BigQuery
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads que executam os jobs compartilhados
+MAX_TRABALHADORES = 8
+
+
+class _Voo:
+    """Job em andamento de uma chave"""
+
+    def __init__(self):
+        self.futuro = None
+        self.aguardando = 0
+        self.progresso = None
+
+
+class ChamadasUnicas:
+    """Executa no máximo um job por chave; chamadores concorrentes compartilham o resultado
+
+    O job roda em uma thread própria (não na thread da sessão que o disparou): se uma
+    sessão é interrompida enquanto aguarda (rerun, aba fechada), apenas ela deixa de
+    esperar e o job segue para os demais. Exceções do job são repassadas a todos.
+
+    Args:
+        max_trabalhadores: Jobs compartilhados simultâneos
+    """
+
+    def __init__(self, max_trabalhadores=MAX_TRABALHADORES):
+        self._executor = ThreadPoolExecutor(max_workers=max_trabalhadores, thread_name_prefix='chamada_unica')
+        self._voos = {}
+        self._trava = threading.Lock()
+        self._metricas = {'chamadas': 0, 'executadas': 0, 'coalescidas': 0, 'erros': 0, 'desistencias': 0}
+
+    def executar(self, chave, funcao, ao_aguardar=None, intervalo=0.2):
+        """Resultado de `funcao` para a chave, reaproveitando um job em andamento
+
+        Args:
+            chave: Identifica chamadas equivalentes (ex.: hash do SQL e parâmetros)
+            funcao: Recebe um callback `progresso(*args)` e devolve o resultado; roda fora
+                da thread da sessão, então não pode usar a API do Streamlit
+            ao_aguardar: Chamado na thread do chamador, a cada `intervalo`, com o último
+                progresso informado pelo job (ex.: atualizar uma barra de progresso)
+        """
+        with self._trava:
+            self._metricas['chamadas'] += 1
+            voo = self._voos.get(chave)
+            if voo is None:
+                voo = _Voo()
+                voo.futuro = self._executor.submit(self._rodar, chave, voo, funcao)
+                self._voos[chave] = voo
+                self._metricas['executadas'] += 1
+            else:
+                self._metricas['coalescidas'] += 1
+            voo.aguardando += 1
+
+        try:
+            while not voo.futuro.done():
+                if ao_aguardar is not None:
+                    ao_aguardar(voo.progresso)
+                time.sleep(intervalo)
+            return voo.futuro.result()
+        except BaseException:
+            if not voo.futuro.done():
+                # Chamador interrompido: o job compartilhado continua para os demais
+                with self._trava:
+                    self._metricas['desistencias'] += 1
+            raise
+        finally:
+            with self._trava:
+                voo.aguardando -= 1
+
+    def _rodar(self, chave, voo, funcao):
+        def progresso(*args):
+            voo.progresso = args
+        try:
+            return funcao(progresso)
+        except Exception:
+            with self._trava:
+                self._metricas['erros'] += 1
+            raise
+        finally:
+            # Chamadas a partir daqui disparam um job novo (resultado atual, não o anterior)
+            with self._trava:
+                if self._voos.get(chave) is voo:
+                    del self._voos[chave]
+
+    def metricas(self):
+        """Contadores de chamadas, jobs executados, chamadas coalescidas, erros,
+        desistências e jobs em andamento (com quantos chamadores aguardam cada um)"""
+        with self._trava:
+            return dict(
+                self._metricas,
+                em_andamento=len(self._voos),
+                aguardando=sum(voo.aguardando for voo in self._voos.values()),
+            )
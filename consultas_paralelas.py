@@ -0,0 +1,85 @@
+"""
+Consultas Paralelas - Calculadora 5.0
+Executa ao mesmo tempo as consultas independentes de cada rerun do dashboard
+(timestamp de modificação, ajustes ativos, pendências) e reúne os resultados antes de
+renderizar, com timeout por consulta e falhas parciais que não derrubam a página
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TempoEsgotado
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # Fora do Streamlit: threads sem contexto de sessão
+    add_script_run_ctx = get_script_run_ctx = None
+
+# Threads compartilhadas pelas sessões do processo
+MAX_TRABALHADORES = 8
+
+# Timeout padrão por consulta (segundos)
+TIMEOUT_PADRAO = 30
+
+
+class ExecutorConsultas:
+    """Pool de threads para consultas independentes
+
+    As funções rodam com o contexto da sessão que as disparou (podem usar `st.cache_data`
+    e `st.session_state`), mas devem deixar a renderização para a thread do script, que
+    recebe valor, erro e tempo de cada consulta em `coletar`.
+
+    Args:
+        max_trabalhadores: Consultas simultâneas
+    """
+
+    def __init__(self, max_trabalhadores=MAX_TRABALHADORES):
+        self._executor = ThreadPoolExecutor(max_workers=max_trabalhadores, thread_name_prefix='consulta')
+
+    def iniciar(self, consultas, timeouts=None, padroes=None):
+        """Dispara as consultas e retorna o lote para `coletar`
+
+        Args:
+            consultas: {nome: função sem argumentos}
+            timeouts: {nome: segundos} (padrão: TIMEOUT_PADRAO), contados a partir daqui
+            padroes: {nome: valor usado se a consulta falhar ou passar do timeout}
+        """
+        contexto = get_script_run_ctx() if get_script_run_ctx else None
+        agora = time.monotonic()
+        lote = {}
+        for nome, funcao in consultas.items():
+            lote[nome] = {
+                'futuro': self._executor.submit(self._rodar, funcao, contexto),
+                'prazo': agora + (timeouts or {}).get(nome, TIMEOUT_PADRAO),
+                'padrao': (padroes or {}).get(nome),
+            }
+        return lote
+
+    @staticmethod
+    def _rodar(funcao, contexto):
+        if contexto is not None:
+            add_script_run_ctx(threading.current_thread(), contexto)
+        inicio = time.monotonic()
+        valor = funcao()
+        return valor, time.monotonic() - inicio
+
+    def coletar(self, lote):
+        """Aguarda cada consulta até o seu prazo
+
+        Returns:
+            {nome: {'valor', 'erro' (None se ok), 'tempo_s'}}; consultas que falharam ou
+            estouraram o prazo recebem o valor padrão (a thread segue, o resultado é descartado)
+        """
+        resultados = {}
+        for nome, item in lote.items():
+            restante = max(item['prazo'] - time.monotonic(), 0)
+            try:
+                valor, tempo = item['futuro'].result(timeout=restante)
+                resultados[nome] = {'valor': valor, 'erro': None, 'tempo_s': tempo}
+            except TempoEsgotado:
+                resultados[nome] = {'valor': item['padrao'], 'erro': 'timeout', 'tempo_s': None}
+            except Exception as e:
+                resultados[nome] = {'valor': item['padrao'], 'erro': str(e), 'tempo_s': None}
+        return resultados
+
+    def executar(self, consultas, timeouts=None, padroes=None):
+        """`iniciar` + `coletar`"""
+        return self.coletar(self.iniciar(consultas, timeouts, padroes))
@@ -37,18 +37,19 @@ CREATE TABLE IF NOT EXISTS `kanastra-live.finance.descontos` (
   documento_referencia STRING  -- Número do processo, contrato (para descontos)
 );
 
--- Índices para melhor performance
-CREATE INDEX IF NOT EXISTS idx_descontos_fund_id_data 
-ON `kanastra-live.finance.descontos`(fund_id, data_inicio, data_fim);
-
-CREATE INDEX IF NOT EXISTS idx_descontos_fund_name_data 
-ON `kanastra-live.finance.descontos`(fund_name, data_inicio, data_fim);
-
-CREATE INDEX IF NOT EXISTS idx_descontos_categoria 
-ON `kanastra-live.finance.descontos`(categoria, data_inicio);
-
-CREATE INDEX IF NOT EXISTS idx_descontos_origem 
-ON `kanastra-live.finance.descontos`(origem, data_inicio);
+-- Índices: o BigQuery não tem CREATE INDEX (índices secundários); os comandos abaixo
+-- ficam comentados para que o arquivo rode como migração (migracoes.py)
+-- CREATE INDEX IF NOT EXISTS idx_descontos_fund_id_data 
+-- ON `kanastra-live.finance.descontos`(fund_id, data_inicio, data_fim);
+--
+-- CREATE INDEX IF NOT EXISTS idx_descontos_fund_name_data 
+-- ON `kanastra-live.finance.descontos`(fund_name, data_inicio, data_fim);
+--
+-- CREATE INDEX IF NOT EXISTS idx_descontos_categoria 
+-- ON `kanastra-live.finance.descontos`(categoria, data_inicio);
+--
+-- CREATE INDEX IF NOT EXISTS idx_descontos_origem 
+-- ON `kanastra-live.finance.descontos`(origem, data_inicio);
 
 -- Comentários:
 -- id: UUID único do ajuste
@@ -0,0 +1,20 @@
+-- Criar tabela de fatores de correção anual das taxas mínimas (IGPM/IPCA/IPC-FIPE)
+-- Materializa a cadeia indices → fatores_marco → fatores1 → multiplicadores da Calculadora 5.0.
+-- Alimentada por fatores_correcao.py: só fundos com aniversário em um índice recém-publicado
+-- (ou com cadastro alterado em correcao_aux_v3) são recalculados
+
+CREATE TABLE IF NOT EXISTS `kanastra-live.finance.fatores_correcao` (
+  fund_id INT64 NOT NULL,  -- ID do fundo
+  mes DATE NOT NULL,  -- Mês de aplicação (mês seguinte ao índice: mes_seguinte)
+  fator_correcao FLOAT64,  -- Fator acumulado dos aniversários até o mês
+  inicio_fundo DATE,  -- Cópia de correcao_aux_v3 (detecta alterações no cadastro)
+  indice_correcao STRING,  -- Cópia de correcao_aux_v3: igpm, ipca ou ipc_fipe
+  atualizado_em TIMESTAMP  -- Quando a linha foi (re)calculada
+)
+CLUSTER BY fund_id;
+
+-- Comentários:
+-- Chave lógica: (fund_id, mes)
+-- Meses sem aniversário repetem o fator anterior; por isso um índice novo só muda o fator
+-- dos fundos que completam 12, 24, 36... meses naquele mês.
+-- Índice revisado em finance.indices_v3: usar reconstruir=True.
@@ -0,0 +1,12 @@
+-- Criar tabela de migrações de esquema aplicadas (Calculadora 5.0)
+-- Uma linha por arquivo .sql aplicado por migracoes.py; a maior versão indica o esquema atual
+
+CREATE TABLE IF NOT EXISTS `kanastra-live.finance.migracoes_aplicadas` (
+  versao INT64 NOT NULL,  -- Número da migração (ordem de aplicação em migracoes.MIGRACOES)
+  arquivo STRING NOT NULL,  -- Arquivo .sql executado
+  aplicada_em TIMESTAMP  -- Quando foi aplicada
+);
+
+-- Comentários:
+-- As migrações usam IF NOT EXISTS: aplicar duas vezes (dois processos ao mesmo tempo) não
+-- tem efeito; a linha da versão é gravada com MERGE
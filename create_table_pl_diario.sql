@@ -0,0 +1,19 @@
+-- Criar tabela de PL diário por fundo (etapa intermediária da Calculadora 5.0)
+-- Substitui o subselect investment.quotas UNION ALL investment.wallet que a calculadora
+-- repetia em soma_diaria_pl, quotas, x_variavel e x_minimo. Alimentada por pl_diario.py
+
+CREATE TABLE IF NOT EXISTS `kanastra-live.finance.pl_diario` (
+  fund_id INT64 NOT NULL,  -- ID do fundo
+  reference_dt DATE NOT NULL,  -- Data de referência do PL
+  net_worth FLOAT64,  -- Soma de todas as linhas (soma_diaria_pl / x_minimo)
+  net_worth_positivo FLOAT64,  -- Soma apenas das linhas > 0 (quotas / x_variavel); NULL se nenhuma
+  atualizado_em TIMESTAMP  -- Quando a linha foi (re)calculada
+)
+PARTITION BY DATE_TRUNC(reference_dt, MONTH)
+CLUSTER BY fund_id;
+
+-- Comentários:
+-- Chave lógica: (fund_id, reference_dt)
+-- Fundos 302 e 76: PL = SUM(market_value) de investment.wallet com external_id = 11301
+-- Demais fundos: PL = investment.quotas.net_worth (uma linha por cota/classe)
+-- Atualização incremental: reprocessa os últimos dias a partir da maior reference_dt (MERGE)
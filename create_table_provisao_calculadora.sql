@@ -0,0 +1,33 @@
+-- Criar tabela de provisões calculadas (resultado `y` da Calculadora 5.0 persistido)
+-- Alimentada por provisao_incremental.py: só os dias novos de cada fundo são recalculados
+
+CREATE TABLE IF NOT EXISTS `kanastra-live.finance.provisao_calculadora` (
+  date_ref DATE NOT NULL,  -- Data de referência
+  fund_id INT64 NOT NULL,  -- ID do fundo
+  Service STRING NOT NULL,  -- Administração, Gestão, Custódia, Custódia Kanastra
+  fund_name STRING,
+  cnpj STRING,
+  net_worth FLOAT64,
+  business_days_in_month INT64,
+  gross_up STRING,  -- `Gross Up` na saída da calculadora
+  taxa_variavel FLOAT64,
+  fee_min FLOAT64,
+  fee_variavel_diario FLOAT64,
+  fee_min_diario FLOAT64,
+  acumulado FLOAT64,  -- Acumulado do mês (acumulado_*_mes)
+  provisao_carteira FLOAT64,
+  diferenca FLOAT64,
+  calculado_em TIMESTAMP  -- Quando a linha foi (re)calculada
+)
+PARTITION BY DATE_TRUNC(date_ref, MONTH)
+CLUSTER BY fund_id, Service;
+
+-- Staging: cada atualização incremental carrega os dias recalculados numa tabela própria
+-- (`provisao_calculadora_stage_<uuid>`, criada pelo load job) e a apaga ao final, para que
+-- atualizações simultâneas não sobrescrevam o staging uma da outra
+
+-- Comentários:
+-- Chave lógica: (fund_id, Service, date_ref)
+-- Marca d'água por fundo: MAX(date_ref). A atualização recalcula a partir do primeiro dia
+-- do mês da marca d'água, pois acumulado_*_mes reinicia mensalmente.
+-- Reconstrução completa (reconstruir=True): usar quando uma taxa for alterada retroativamente.
@@ -0,0 +1,15 @@
+-- Criar tabela de versão de alterações (invalidação de cache da Calculadora 5.0)
+-- Uma linha por escopo, incrementada por toda escrita do dashboard de gestão
+-- (alterações pendentes, aprovações, status). Mantida por versao_alteracoes.py
+
+CREATE TABLE IF NOT EXISTS `kanastra-live.finance.versao_alteracoes` (
+  escopo STRING NOT NULL,  -- Conjunto de tabelas versionado ('alteracoes')
+  versao INT64 NOT NULL,  -- Incrementada a cada escrita
+  atualizado_em TIMESTAMP,  -- Quando a versão foi incrementada
+  origem STRING  -- Escrita que gerou a versão (alteracao_pendente, aprovacao, status)
+);
+
+-- Comentários:
+-- Os leitores não consultam a tabela: comparam o lastModifiedTime dela (metadado),
+-- que muda a cada MERGE, em vez de agregar MAX() sobre descontos e alteracoes_pendentes
+-- Sem esta tabela, o dashboard usa o lastModifiedTime de descontos e alteracoes_pendentes
@@ -9,6 +9,17 @@ from google.cloud import bigquery
 from google.oauth2 import service_account
 import uuid
 import json
+import download_arrow
+import versao_alteracoes
+import frescor_fontes
+import registro_cache
+import motor_aprovacao
+import migracoes
+import tabelas_taxas
+
+# Copy-on-write: as tabelas de taxas compartilhadas entre sessões nunca são alteradas
+# pelos filtros e cópias de cada sessão
+pd.set_option('mode.copy_on_write', True)
 
 # Configuração da página
 st.set_page_config(
@@ -285,10 +296,6 @@ USUARIOS = {
 APROVADORES = {k: v for k, v in USUARIOS.items() if v.get("perfil") == "aprovador"}
 
 # Inicializar session_state
-if 'dados_originais' not in st.session_state:
-    st.session_state.dados_originais = None
-if 'dados_editados' not in st.session_state:
-    st.session_state.dados_editados = None
 if 'alteracoes_pendentes' not in st.session_state:
     st.session_state.alteracoes_pendentes = []
 if 'usuario_logado' not in st.session_state:
@@ -300,6 +307,9 @@ if 'usuario_aprovador' not in st.session_state:  # Manter compatibilidade
 if 'tabela_selecionada' not in st.session_state:
     st.session_state.tabela_selecionada = None
 
+# Caches com tags (tabelas de origem): invalidação por tabela em vez de st.cache_data.clear()
+registro_caches = registro_cache.obter_registro()
+
 # Função para criar cliente BigQuery
 @st.cache_resource
 def get_bigquery_client():
@@ -317,8 +327,28 @@ def get_bigquery_client():
         st.error(f"❌ Erro ao criar cliente BigQuery: {e}")
         return None
 
-# Função para carregar dados
-@st.cache_data(ttl=300)
+# Migrações de esquema aplicadas uma vez por processo + mapa de colunas por tabela
+@st.cache_resource
+def obter_esquema():
+    client = get_bigquery_client()
+    return migracoes.preparar_esquema(client) if client is not None else None
+
+# Cliente da Storage Read API (download Arrow; None = API REST)
+@st.cache_resource
+def get_bigquery_read_client():
+    client = get_bigquery_client()
+    return download_arrow.criar_cliente_leitura(client) if client is not None else None
+
+# Frescor das tabelas (metadados, relidos a cada INTERVALO_VERIFICACAO segundos)
+@registro_caches.cache_data(registro_cache.TAG_METADADOS, ttl=frescor_fontes.INTERVALO_VERIFICACAO)
+def obter_token_frescor(*tabelas):
+    """Token que muda quando alguma das tabelas é carregada ou alterada"""
+    client = get_bigquery_client()
+    if client is None:
+        return None
+    return frescor_fontes.verificar_frescor(client, tabelas)['token']
+
+# Função para carregar dados (sem cache próprio: a cópia fica em obter_repositorio_taxas)
 def carregar_dados_bigquery(tabela):
     client = get_bigquery_client()
     if client is None:
@@ -350,14 +380,24 @@ def carregar_dados_bigquery(tabela):
             ORDER BY `fund id`, faixa
             """
         
-        df = client.query(query).to_dataframe()
+        df, _, _ = download_arrow.baixar_dataframe(client.query(query), get_bigquery_read_client())
         return df
     except Exception as e:
         st.error(f"❌ Erro ao carregar dados: {e}")
         return None
 
-@st.cache_data(ttl=3600)
-def carregar_fundos_completos():
+# Tabelas de taxas: uma cópia por processo, indexada e compartilhada entre as sessões
+@st.cache_resource
+def obter_repositorio_taxas():
+    return tabelas_taxas.RepositorioTaxas()
+
+def obter_tabela_taxas(tabela):
+    """Visão somente leitura da tabela; relida só quando o modified muda ou após uma aprovação"""
+    token = obter_token_frescor(f'kanastra-live.finance.{tabela}')
+    return obter_repositorio_taxas().obter(tabela, token, carregar_dados_bigquery)
+
+@registro_caches.cache_data('hub.funds', max_entries=4)  # Sem TTL: a chave inclui o token de frescor de hub.funds
+def carregar_fundos_completos(token_frescor=None):
     """Carrega lista de fundos com ID, nome, CNPJ e cliente para criação de taxas"""
     try:
         client = get_bigquery_client()
@@ -374,180 +414,272 @@ def carregar_fundos_completos():
         WHERE name IS NOT NULL 
         ORDER BY name
         """
-        df = client.query(query).to_dataframe()
+        df, _, _ = download_arrow.baixar_dataframe(client.query(query), get_bigquery_read_client())
         return df
     except Exception as e:
         st.error(f"❌ Erro ao carregar fundos completos: {e}")
         return pd.DataFrame()
 
 # Funções para persistência de alterações pendentes
-def salvar_alteracao_pendente(tipo_alteracao, tabela, dados, usuario="usuario_kanastra", solicitacao_id=None, tipo_categoria=None, origem=None):
+def _categoria_alteracao(tabela):
+    """tipo_alteracao_categoria padrão de cada tabela"""
+    if tabela == 'fee_minimo':
+        return 'taxa_minima'
+    elif tabela == 'fee_variavel':
+        return 'taxa_variavel'
+    elif tabela == 'waiver':
+        return 'waiver'
+    return 'desconto'
+
+# Linhas por parâmetro ARRAY<STRUCT> (mantém cada statement bem abaixo do limite de tamanho da query)
+LINHAS_POR_LOTE = 500
+
+QUERY_INSERIR_ALTERACOES = """
+INSERT INTO `kanastra-live.finance.alteracoes_pendentes`
+(id, usuario, timestamp, tipo_alteracao, tipo_alteracao_categoria, origem, tabela, dados, status, solicitacao_id)
+SELECT
+    l.id,
+    @usuario,
+    @timestamp,
+    l.tipo_alteracao,
+    l.tipo_alteracao_categoria,
+    l.origem,
+    l.tabela,
+    PARSE_JSON(l.dados),
+    'PENDENTE',
+    @solicitacao_id
+FROM UNNEST(@linhas) AS l
+"""
+
+def salvar_alteracoes_pendentes(linhas, usuario="usuario_kanastra", solicitacao_id=None, progresso=None):
     """
-    Salva uma alteração pendente no BigQuery
+    Salva as linhas de uma solicitação no BigQuery de uma só vez (tudo ou nada)
+    
+    Até LINHAS_POR_LOTE linhas vão em um único INSERT ... SELECT FROM UNNEST(@linhas).
+    Acima disso, um INSERT por lote dentro de uma transação de sessão: nenhuma linha é
+    gravada se um lote falhar.
     
     Args:
-        tipo_alteracao: INSERT, UPDATE ou DELETE (tipo de operação)
-        tabela: Nome da tabela (fee_minimo, fee_variavel, waiver, desconto)
-        dados: Dict com os dados da alteração
+        linhas: Lista de dicts com tipo_alteracao, tabela, dados e, opcionalmente,
+            tipo_categoria e origem (mesmos significados de salvar_alteracao_pendente)
         usuario: Nome do usuário que criou
-        solicitacao_id: UUID para agrupar linhas relacionadas
-        tipo_categoria: Categoria (taxa_minima, taxa_variavel, waiver, desconto)
-        origem: Para descontos - 'juridico' ou 'comercial'
+        solicitacao_id: UUID que agrupa as linhas (None = novo)
+        progresso: Função chamada com (linhas gravadas, total de linhas) a cada lote
+    
+    Returns:
+        (sucesso, solicitacao_id); (False, "nenhuma linha") se `linhas` estiver vazia
     """
+    # Sem linhas não há solicitação: nada é gravado e a versão de alterações não muda
+    if not linhas:
+        return False, "nenhuma linha"
+    
     client = get_bigquery_client()
     if client is None:
         st.error("❌ Erro ao conectar com BigQuery")
         return False, None
     
+    if solicitacao_id is None:
+        solicitacao_id = str(uuid.uuid4())
+    
     try:
-        alteracao_id = str(uuid.uuid4())
-        timestamp_now = datetime.now().isoformat()
-        
-        # Se não foi passado um solicitacao_id, criar um novo (para agrupar linhas relacionadas)
-        if solicitacao_id is None:
-            solicitacao_id = str(uuid.uuid4())
-        
-        # Determinar tipo_categoria se não especificado
-        if not tipo_categoria:
-            if tabela == 'fee_minimo':
-                tipo_categoria = 'taxa_minima'
-            elif tabela == 'fee_variavel':
-                tipo_categoria = 'taxa_variavel'
-            elif tabela == 'waiver':
-                tipo_categoria = 'waiver'
-            else:
-                tipo_categoria = 'desconto'
-        
-        # Converter dados para JSON string
-        dados_json = json.dumps(dados, ensure_ascii=False)
-        
-        # Query com suporte a tipo_alteracao_categoria e origem
-        if origem:  # Para descontos
-            query = f"""
-            INSERT INTO `kanastra-live.finance.alteracoes_pendentes` 
-            (id, usuario, timestamp, tipo_alteracao, tipo_alteracao_categoria, origem, tabela, dados, status, solicitacao_id)
-            VALUES (
-                '{alteracao_id}',
-                '{usuario}',
-                TIMESTAMP('{timestamp_now}'),
-                '{tipo_alteracao}',
-                '{tipo_categoria}',
-                '{origem}',
-                '{tabela}',
-                JSON '{dados_json}',
-                'PENDENTE',
-                '{solicitacao_id}'
+        structs = [
+            bigquery.StructQueryParameter(
+                None,
+                bigquery.ScalarQueryParameter('id', 'STRING', str(uuid.uuid4())),
+                bigquery.ScalarQueryParameter('tipo_alteracao', 'STRING', linha['tipo_alteracao']),
+                bigquery.ScalarQueryParameter(
+                    'tipo_alteracao_categoria', 'STRING',
+                    linha.get('tipo_categoria') or _categoria_alteracao(linha['tabela'])
+                ),
+                bigquery.ScalarQueryParameter('origem', 'STRING', linha.get('origem')),
+                bigquery.ScalarQueryParameter('tabela', 'STRING', linha['tabela']),
+                bigquery.ScalarQueryParameter('dados', 'STRING', json.dumps(linha['dados'], ensure_ascii=False)),
             )
-            """
-        else:  # Para taxas e waivers
-            query = f"""
-            INSERT INTO `kanastra-live.finance.alteracoes_pendentes` 
-            (id, usuario, timestamp, tipo_alteracao, tipo_alteracao_categoria, tabela, dados, status, solicitacao_id)
-            VALUES (
-                '{alteracao_id}',
-                '{usuario}',
-                TIMESTAMP('{timestamp_now}'),
-                '{tipo_alteracao}',
-                '{tipo_categoria}',
-                '{tabela}',
-                JSON '{dados_json}',
-                'PENDENTE',
-                '{solicitacao_id}'
+            for linha in linhas
+        ]
+        lotes = [structs[i:i + LINHAS_POR_LOTE] for i in range(0, len(structs), LINHAS_POR_LOTE)]
+        parametros_comuns = [
+            bigquery.ScalarQueryParameter('usuario', 'STRING', usuario),
+            bigquery.ScalarQueryParameter('timestamp', 'TIMESTAMP', datetime.now()),
+            bigquery.ScalarQueryParameter('solicitacao_id', 'STRING', solicitacao_id),
+        ]
+        
+        def config_lote(lote, **opcoes):
+            return bigquery.QueryJobConfig(
+                query_parameters=parametros_comuns + [bigquery.ArrayQueryParameter('linhas', 'STRUCT', lote)],
+                **opcoes
             )
-            """
         
-        client.query(query).result()
+        if len(lotes) == 1:
+            client.query(QUERY_INSERIR_ALTERACOES, job_config=config_lote(lotes[0])).result()
+        else:
+            # Vários lotes: transação em uma sessão (um job por lote, commit só no final)
+            inicio = client.query("BEGIN TRANSACTION", job_config=bigquery.QueryJobConfig(create_session=True))
+            inicio.result()
+            sessao = [bigquery.ConnectionProperty('session_id', inicio.session_info.session_id)]
+            try:
+                gravadas = 0
+                for lote in lotes:
+                    client.query(
+                        QUERY_INSERIR_ALTERACOES, job_config=config_lote(lote, connection_properties=sessao)
+                    ).result()
+                    gravadas += len(lote)
+                    if progresso:
+                        progresso(gravadas, len(structs))
+                client.query(
+                    "COMMIT TRANSACTION", job_config=bigquery.QueryJobConfig(connection_properties=sessao)
+                ).result()
+            except Exception:
+                try:
+                    client.query(
+                        "ROLLBACK TRANSACTION", job_config=bigquery.QueryJobConfig(connection_properties=sessao)
+                    ).result()
+                except Exception:
+                    pass  # Transação já abortada pelo BigQuery
+                raise
+            finally:
+                try:
+                    client.query(
+                        "CALL BQ.ABORT_SESSION()", job_config=bigquery.QueryJobConfig(connection_properties=sessao)
+                    ).result()
+                except Exception:
+                    pass
+        
+        if progresso and len(lotes) == 1:
+            progresso(len(structs), len(structs))
+        versao_alteracoes.incrementar_versao(client, origem='alteracao_pendente')
+        invalidar_alteracoes_pendentes()
         return True, solicitacao_id
     except Exception as e:
         st.error(f"❌ Erro ao salvar alteração: {e}")
         return False, None
 
-def carregar_alteracoes_pendentes():
-    """Carrega todas as alterações pendentes do BigQuery agrupadas por solicitacao_id"""
+def salvar_alteracao_pendente(tipo_alteracao, tabela, dados, usuario="usuario_kanastra", solicitacao_id=None, tipo_categoria=None, origem=None):
+    """
+    Salva uma alteração pendente no BigQuery
+    
+    Args:
+        tipo_alteracao: INSERT, UPDATE ou DELETE (tipo de operação)
+        tabela: Nome da tabela (fee_minimo, fee_variavel, waiver, desconto)
+        dados: Dict com os dados da alteração
+        usuario: Nome do usuário que criou
+        solicitacao_id: UUID para agrupar linhas relacionadas
+        tipo_categoria: Categoria (taxa_minima, taxa_variavel, waiver, desconto)
+        origem: Para descontos - 'juridico' ou 'comercial'
+    """
+    linha = {
+        'tipo_alteracao': tipo_alteracao,
+        'tabela': tabela,
+        'dados': dados,
+        'tipo_categoria': tipo_categoria,
+        'origem': origem,
+    }
+    return salvar_alteracoes_pendentes([linha], usuario, solicitacao_id)
+
+# Solicitações por página no painel de aprovação
+SOLICITACOES_POR_PAGINA = 10
+
+TABELAS_PENDENTES = (
+    versao_alteracoes.TABELA_VERSAO,
+    'kanastra-live.finance.alteracoes_pendentes',
+)
+
+def _coluna_solicitacao():
+    """Expressão que agrupa as linhas de uma solicitação (id se solicitacao_id não existir)
+
+    Linhas antigas sem solicitacao_id (NULL) formam cada uma a sua solicitação, pelo id:
+    o mesmo valor vale no GROUP BY do resumo e no filtro de `carregar_linhas_solicitacao`.
+    """
+    # Coluna criada pelas migrações; o mapa de colunas é lido uma vez por processo
+    esquema = obter_esquema()
+    if esquema is not None and migracoes.tem_coluna(esquema, 'alteracoes_pendentes', 'solicitacao_id'):
+        return 'COALESCE(solicitacao_id, id)'
+    return 'id'
+
+def token_alteracoes_pendentes():
+    """Token que muda a cada escrita em finance.alteracoes_pendentes"""
+    return obter_token_frescor(*TABELAS_PENDENTES)
+
+@registro_caches.cache_data('finance.alteracoes_pendentes', max_entries=4)  # Sem TTL: a chave inclui o token de frescor
+def carregar_resumo_solicitacoes(token_frescor=None):
+    """Resumo das solicitações pendentes (uma linha por solicitacao_id, sem o JSON)
+    
+    O agrupamento é feito no BigQuery: o JSON das linhas só é lido quando a
+    solicitação é aberta (`carregar_linhas_solicitacao`).
+    
+    Returns:
+        DataFrame com solicitacao_id, usuario, timestamp, tipo_alteracao, tabela e
+        linhas, ordenado pela solicitação mais antiga
+    """
     client = get_bigquery_client()
     if client is None:
-        return []
+        return pd.DataFrame()
     
+    coluna = _coluna_solicitacao()
+    query = f"""
+    SELECT
+        {coluna} AS solicitacao_id,
+        ARRAY_AGG(usuario ORDER BY timestamp LIMIT 1)[OFFSET(0)] AS usuario,
+        MIN(timestamp) AS timestamp,
+        ARRAY_AGG(tipo_alteracao ORDER BY timestamp LIMIT 1)[OFFSET(0)] AS tipo_alteracao,
+        ARRAY_AGG(tabela ORDER BY timestamp LIMIT 1)[OFFSET(0)] AS tabela,
+        COUNT(*) AS linhas
+    FROM `kanastra-live.finance.alteracoes_pendentes`
+    WHERE status = 'PENDENTE'
+    GROUP BY solicitacao_id
+    ORDER BY timestamp ASC, solicitacao_id
+    """
     try:
-        # Primeiro, tentar adicionar a coluna solicitacao_id se não existir
-        try:
-            alter_query = """
-            ALTER TABLE `kanastra-live.finance.alteracoes_pendentes`
-            ADD COLUMN IF NOT EXISTS solicitacao_id STRING
-            """
-            client.query(alter_query).result()
-        except:
-            pass  # Coluna já existe ou erro ao adicionar
-        
-        # Verificar se a coluna existe antes de consultar
-        check_query = """
-        SELECT column_name 
-        FROM `kanastra-live.finance.INFORMATION_SCHEMA.COLUMNS`
-        WHERE table_name = 'alteracoes_pendentes'
-        """
-        columns_df = client.query(check_query).to_dataframe()
-        has_solicitacao_id = 'solicitacao_id' in columns_df['column_name'].values
-        
-        # Montar query baseado na existência da coluna
-        if has_solicitacao_id:
-            query = """
-            SELECT 
-                id,
-                usuario,
-                timestamp,
-                tipo_alteracao,
-                tabela,
-                dados,
-                status,
-                solicitacao_id
-            FROM `kanastra-live.finance.alteracoes_pendentes`
-            WHERE status = 'PENDENTE'
-            ORDER BY timestamp ASC, solicitacao_id
-            """
-        else:
-            # Fallback: usar id como solicitacao_id se a coluna não existir
-            query = """
-            SELECT 
-                id,
-                usuario,
-                timestamp,
-                tipo_alteracao,
-                tabela,
-                dados,
-                status,
-                id as solicitacao_id
-            FROM `kanastra-live.finance.alteracoes_pendentes`
-            WHERE status = 'PENDENTE'
-            ORDER BY timestamp ASC
-            """
-        
-        df = client.query(query).to_dataframe()
-        
-        # Agrupar alterações por solicitacao_id
-        solicitacoes = {}
-        for _, row in df.iterrows():
-            solicitacao_id = row.get('solicitacao_id', row['id'])  # Fallback para id se não tiver solicitacao_id
-            
-            alteracao = {
-                'id': row['id'],
-                'usuario': row['usuario'],
-                'timestamp': row['timestamp'],
-                'tipo_alteracao': row['tipo_alteracao'],
-                'tabela': row['tabela'],
-                'dados': json.loads(row['dados']),
-                'status': row['status'],
-                'solicitacao_id': solicitacao_id
-            }
-            
-            if solicitacao_id not in solicitacoes:
-                solicitacoes[solicitacao_id] = []
-            solicitacoes[solicitacao_id].append(alteracao)
-        
-        # Retornar lista de solicitações agrupadas
-        return list(solicitacoes.values())
+        return client.query(query).to_dataframe()
     except Exception as e:
         st.error(f"❌ Erro ao carregar alterações pendentes: {e}")
+        return pd.DataFrame()
+
+@registro_caches.cache_data('finance.alteracoes_pendentes', max_entries=32)  # Sem TTL: a chave inclui o token de frescor
+def carregar_linhas_solicitacao(solicitacao_id, token_frescor=None):
+    """Linhas pendentes de uma solicitação, no formato esperado por motor_aprovacao
+    
+    Returns:
+        Lista de dicts (id, usuario, timestamp, tipo_alteracao, tabela, dados, status,
+        solicitacao_id), com 'dados' já convertido do JSON
+    """
+    client = get_bigquery_client()
+    if client is None:
         return []
+    
+    coluna = _coluna_solicitacao()
+    query = f"""
+    SELECT
+        id,
+        usuario,
+        timestamp,
+        tipo_alteracao,
+        tabela,
+        dados,
+        status,
+        {coluna} AS solicitacao_id
+    FROM `kanastra-live.finance.alteracoes_pendentes`
+    WHERE status = 'PENDENTE' AND {coluna} = @solicitacao_id
+    ORDER BY timestamp ASC
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter('solicitacao_id', 'STRING', solicitacao_id)]
+    )
+    try:
+        df = client.query(query, job_config=job_config).to_dataframe()
+    except Exception as e:
+        st.error(f"❌ Erro ao carregar linhas da solicitação: {e}")
+        return []
+    if df.empty:
+        return []
+    
+    # Um único json.loads para a coluna inteira, em vez de um por linha
+    dados = json.loads('[' + ','.join(df['dados'].astype(str)) + ']')
+    return df.assign(dados=dados).to_dict('records')
+
+def invalidar_alteracoes_pendentes():
+    """Descarta resumo e linhas em cache após uma escrita deste processo"""
+    registro_caches.invalidar('finance.alteracoes_pendentes')
 
 def carregar_historico_alteracoes(limit=100):
     """Carrega histórico de alterações já aprovadas (waivers e descontos da tabela descontos)"""
@@ -583,43 +715,9 @@ def carregar_historico_alteracoes(limit=100):
         st.warning(f"⚠️ Erro ao carregar histórico: {e}")
         return pd.DataFrame()
 
-def atualizar_status_alteracao(alteracao_id, novo_status, aprovador=None):
-    """Atualiza o status de uma alteração (APROVADO/REJEITADO) e registra quem aprovou"""
-    client = get_bigquery_client()
-    if client is None:
-        return False
-    
-    try:
-        # Tentar adicionar a coluna aprovador_por se não existir (ignora erro se já existir)
-        try:
-            alter_query = """
-            ALTER TABLE `kanastra-live.finance.alteracoes_pendentes`
-            ADD COLUMN IF NOT EXISTS aprovador_por STRING
-            """
-            client.query(alter_query).result()
-        except:
-            pass  # Coluna já existe
-        
-        # Atualizar status e aprovador
-        if aprovador:
-            query = f"""
-            UPDATE `kanastra-live.finance.alteracoes_pendentes`
-            SET status = '{novo_status}',
-                aprovador_por = '{aprovador}'
-            WHERE id = '{alteracao_id}'
-            """
-        else:
-            query = f"""
-            UPDATE `kanastra-live.finance.alteracoes_pendentes`
-            SET status = '{novo_status}'
-            WHERE id = '{alteracao_id}'
-            """
-        
-        client.query(query).result()
-        return True
-    except Exception as e:
-        st.error(f"❌ Erro ao atualizar status: {e}")
-        return False
+# FUNÇÃO REMOVIDA: atualizar_status_alteracao
+# Aprovação e rejeição atualizam o status de todas as linhas da solicitação num único
+# UPDATE (motor_aprovacao.py), dentro da mesma transação que aplica as alterações
 
 # FUNÇÃO REMOVIDA: salvar_historico_alteracao
 # A tabela finance.historico_alteracoes não existe mais
@@ -663,8 +761,8 @@ if not st.session_state.usuario_logado:
     st.info("🔒 **Faça login para acessar o dashboard de gestão de taxas**")
     
     # Mostrar contador de alterações pendentes mesmo sem login
-    alteracoes_nao_logado = carregar_alteracoes_pendentes()
-    if alteracoes_nao_logado:
+    alteracoes_nao_logado = carregar_resumo_solicitacoes(token_alteracoes_pendentes())
+    if not alteracoes_nao_logado.empty:
         st.warning(f"⏳ {len(alteracoes_nao_logado)} alteração(ões) aguardando aprovação. Faça login para revisar.")
     
     st.stop()  # PARAR AQUI - NÃO MOSTRAR MAIS NADA
@@ -739,10 +837,11 @@ with st.sidebar:
     st.markdown("### 📊 Status Rápido")
     
     # Verificar alterações pendentes
-    solicitacoes_pendentes_sidebar = carregar_alteracoes_pendentes()
+    solicitacoes_pendentes_sidebar = carregar_resumo_solicitacoes(token_alteracoes_pendentes())
     if perfil == "editor":
-        minhas_solicitacoes = [s for s in solicitacoes_pendentes_sidebar if s[0].get('usuario') == st.session_state.usuario_logado]
-        total_minhas = len(minhas_solicitacoes)
+        total_minhas = 0
+        if not solicitacoes_pendentes_sidebar.empty:
+            total_minhas = int((solicitacoes_pendentes_sidebar['usuario'] == st.session_state.usuario_logado).sum())
         if total_minhas > 0:
             st.warning(f"⏳ {total_minhas} suas solicitações pendentes")
         else:
@@ -771,6 +870,18 @@ with st.sidebar:
     - Jurídico
     - Comercial
     """)
+    
+    # Administração dos caches com tags (apenas aprovadores)
+    if perfil == "aprovador":
+        st.markdown("---")
+        with st.expander("🗄️ Caches"):
+            registro_cache.mostrar_painel(registro_caches)
+        try:
+            esquema = obter_esquema()
+            if esquema and esquema['erro']:
+                st.warning(f"⚠️ Migrações de esquema não aplicadas: {esquema['erro'][:100]}")
+        except Exception as e:
+            st.warning(f"⚠️ Esquema não verificado: {str(e)[:100]}")
 
 # =======================
 # NAVEGAÇÃO POR ABAS
@@ -818,19 +929,15 @@ with tab1:
 
     with col2:
         if st.button("📊 Carregar Dados", width='stretch', type="primary"):
-            # Limpar cache antes de carregar novos dados
-            carregar_dados_bigquery.clear()
-            
+            # A tabela compartilhada só é relida se mudou desde a última leitura
             with st.spinner("Carregando..."):
-                df = carregar_dados_bigquery(tabela)
-                if df is not None and not df.empty:
-                    st.session_state.dados_originais = df.copy()
-                    st.session_state.dados_editados = df.copy()
+                taxas = obter_tabela_taxas(tabela)
+                if taxas is not None and not taxas.vazia:
                     st.session_state.tabela_selecionada = tabela
-                    st.success(f"✅ {len(df)} registros carregados!")
+                    st.success(f"✅ {len(taxas.df)} registros carregados!")
                     
 
-                elif df is not None:
+                elif taxas is not None:
                     st.warning("⚠️ Tabela vazia")
                 else:
                     st.error("❌ Erro ao carregar")
@@ -841,7 +948,7 @@ with tab1:
     # SEÇÃO 2: ESCOLHA DA AÇÃO E FORMULÁRIOS
     # =======================
 
-    if st.session_state.dados_editados is not None:
+    if st.session_state.tabela_selecionada is not None:
         # VALIDAÇÃO CRÍTICA: Verificar se a tabela selecionada corresponde aos dados carregados
         if st.session_state.tabela_selecionada != tabela:
             st.error("❌ **ATENÇÃO: Incompatibilidade detectada!**")
@@ -850,16 +957,19 @@ with tab1:
             
             # Botão para forçar recarga
             if st.button("🔄 Recarregar Dados Corretos", type="primary"):
-                carregar_dados_bigquery.clear()
-                df = carregar_dados_bigquery(tabela)
-                if df is not None and not df.empty:
-                    st.session_state.dados_originais = df.copy()
-                    st.session_state.dados_editados = df.copy()
+                taxas = obter_tabela_taxas(tabela)
+                if taxas is not None and not taxas.vazia:
                     st.session_state.tabela_selecionada = tabela
-                    st.success(f"✅ {len(df)} registros de {tabela_display} carregados!")
+                    st.success(f"✅ {len(taxas.df)} registros de {tabela_display} carregados!")
                     st.rerun()
             st.stop()  # NÃO MOSTRAR MAIS NADA ATÉ CORRIGIR
         
+        # Visão da tabela compartilhada (a mesma para todas as sessões; não alterar no lugar)
+        taxas = obter_tabela_taxas(st.session_state.tabela_selecionada)
+        if taxas is None:
+            st.error("❌ Erro ao carregar")
+            st.stop()
+        
         st.subheader("🔧 Escolha a Ação")
         
         acao = st.radio(
@@ -884,7 +994,7 @@ with tab1:
                 st.info("ℹ️ A taxa mínima será aplicada independente do PL. Serão criadas automaticamente 2 linhas (faixa 0 e faixa máxima).")
                 
                 # Carregar fundos do BigQuery
-                df_fundos = carregar_fundos_completos()
+                df_fundos = carregar_fundos_completos(obter_token_frescor('kanastra-live.hub.funds'))
                 
                 col1, col2 = st.columns(2)
                 
@@ -935,10 +1045,13 @@ with tab1:
                     # Salvar no BigQuery (com usuário logado)
                     usuario_atual = st.session_state.get('usuario_logado', 'usuario_kanastra')
                     solicitacao_id = str(uuid.uuid4())  # Mesmo ID para agrupar as 2 linhas
-                    sucesso_1, _ = salvar_alteracao_pendente("INSERT", "fee_minimo", taxa_faixa_0, usuario_atual, solicitacao_id)
-                    sucesso_2, _ = salvar_alteracao_pendente("INSERT", "fee_minimo", taxa_faixa_max, usuario_atual, solicitacao_id)
+                    sucesso, _ = salvar_alteracoes_pendentes(
+                        [{"tipo_alteracao": "INSERT", "tabela": "fee_minimo", "dados": taxa}
+                         for taxa in (taxa_faixa_0, taxa_faixa_max)],
+                        usuario_atual, solicitacao_id
+                    )
                     
-                    if sucesso_1 and sucesso_2:
+                    if sucesso:
                         st.success(f"✅ Taxa mínima criada! Cliente: {cliente} - {servico} - 2 linhas adicionadas (faixa 0 e máxima)")
                         st.info("⏳ Aguardando aprovação de um aprovador")
                         st.rerun()
@@ -957,8 +1070,7 @@ with tab1:
             
                 with col1:
                     # Listar todos os clientes disponíveis
-                    df = st.session_state.dados_editados
-                    clientes_disponiveis = sorted(df['cliente'].unique())
+                    clientes_disponiveis = taxas.clientes()
                     cliente_edit = st.selectbox(
                         "Selecione o Cliente",
                         options=clientes_disponiveis
@@ -976,9 +1088,8 @@ with tab1:
                 submitted_edit = st.form_submit_button("💾 Salvar Novo Valor", width='stretch', type="primary")
             
                 if submitted_edit:
-                    # Buscar o registro pelo cliente e serviço
-                    df = st.session_state.dados_editados
-                    registro = df[(df['cliente'] == cliente_edit) & (df['servico'] == servico_edit)]
+                    # Buscar o registro pelo cliente e serviço (índice da tabela compartilhada)
+                    registro = taxas.registros(cliente_edit, servico_edit)
                 
                     if not registro.empty:
                         reg_data = registro.iloc[0]
@@ -1017,7 +1128,7 @@ with tab1:
                 st.markdown("### 📝 Informações básicas")
                 
                 # Carregar fundos do BigQuery
-                df_fundos_var = carregar_fundos_completos()
+                df_fundos_var = carregar_fundos_completos(obter_token_frescor('kanastra-live.hub.funds'))
             
                 col1, col2 = st.columns(2)
             
@@ -1086,7 +1197,7 @@ with tab1:
                     # Criar uma linha para cada faixa com mesmo solicitacao_id
                     usuario_atual = st.session_state.get('usuario_logado', 'usuario_kanastra')
                     solicitacao_id = str(uuid.uuid4())  # Mesmo ID para agrupar todas as faixas
-                    sucesso = True
+                    linhas = []
                 
                     for faixa in faixas_data:
                         nova_taxa = {
@@ -1097,11 +1208,10 @@ with tab1:
                             "faixa": faixa["faixa"],
                             "fee_variavel": faixa["fee_variavel"]
                         }
+                        linhas.append({"tipo_alteracao": "INSERT", "tabela": "fee_variavel", "dados": nova_taxa})
                     
-                        resultado, _ = salvar_alteracao_pendente("INSERT", "fee_variavel", nova_taxa, usuario_atual, solicitacao_id)
-                        if not resultado:
-                            sucesso = False
-                            break
+                    # Todas as faixas em um único INSERT (tudo ou nada)
+                    sucesso, _ = salvar_alteracoes_pendentes(linhas, usuario_atual, solicitacao_id)
                 
                     if sucesso:
                         st.success(f"✅ {len(faixas_data)} faixa(s) de taxa variável criada(s)! Cliente: {cliente_var} - {servico_var}")
@@ -1121,8 +1231,7 @@ with tab1:
             
                 with col1:
                     # Listar todos os clientes disponíveis
-                    df = st.session_state.dados_editados
-                    clientes_disponiveis_var = sorted(df['cliente'].unique())
+                    clientes_disponiveis_var = taxas.clientes()
                     cliente_edit_var = st.selectbox(
                         "Selecione o Cliente",
                         options=clientes_disponiveis_var,
@@ -1139,10 +1248,8 @@ with tab1:
                 submitted_buscar = st.form_submit_button("🔍 Carregar Faixas para Edição", width='stretch', type="primary")
             
                 if submitted_buscar:
-                    df = st.session_state.dados_editados
-                
-                    # Buscar todas as faixas deste cliente+serviço
-                    registros = df[(df['cliente'] == cliente_edit_var) & (df['servico'] == servico_edit_var)]
+                    # Buscar todas as faixas deste cliente+serviço (índice da tabela compartilhada)
+                    registros = taxas.registros(cliente_edit_var, servico_edit_var)
                 
                     if not registros.empty:
                         # Ordenar por faixa
@@ -1210,15 +1317,15 @@ with tab1:
                 
                     if submitted_update:
                         # Salvar todas as faixas editadas no BigQuery com mesmo solicitacao_id
-                        sucesso = True
                         usuario_atual = st.session_state.get('usuario_logado', 'usuario_kanastra')
                         solicitacao_id = str(uuid.uuid4())  # Mesmo ID para agrupar todas as edições
                     
-                        for faixa_edit in faixas_editadas:
-                            resultado, _ = salvar_alteracao_pendente("UPDATE", "fee_variavel", faixa_edit, usuario_atual, solicitacao_id)
-                            if not resultado:
-                                sucesso = False
-                                break
+                        # Todas as edições em um único INSERT (tudo ou nada)
+                        sucesso, _ = salvar_alteracoes_pendentes(
+                            [{"tipo_alteracao": "UPDATE", "tabela": "fee_variavel", "dados": faixa_edit}
+                             for faixa_edit in faixas_editadas],
+                            usuario_atual, solicitacao_id
+                        )
                     
                         if sucesso:
                             st.success(f"✅ {len(faixas_editadas)} faixa(s) atualizada(s)! Cliente: {faixas_editadas[0]['cliente']}")
@@ -1245,13 +1352,13 @@ with tab1:
     
         with col_filtro1:
             # Filtro por cliente
-            clientes_unicos = ["Todos"] + sorted(st.session_state.dados_editados['cliente'].unique().tolist())
+            clientes_unicos = ["Todos"] + taxas.clientes()
             cliente_filtro = st.selectbox("🔍 Filtrar por Cliente", clientes_unicos, key="filtro_cliente")
     
         with col_filtro2:
             # Filtro por serviço
-            if 'servico' in st.session_state.dados_editados.columns:
-                servicos_unicos = ["Todos"] + sorted(st.session_state.dados_editados['servico'].unique().tolist())
+            if 'servico' in taxas.df.columns:
+                servicos_unicos = ["Todos"] + sorted(taxas.df['servico'].unique().tolist())
                 servico_filtro = st.selectbox("🔍 Filtrar por Serviço", servicos_unicos, key="filtro_servico")
             else:
                 servico_filtro = "Todos"
@@ -1262,15 +1369,16 @@ with tab1:
                 st.rerun()
     
         # Aplicar filtros
-        df_filtrado = st.session_state.dados_editados.copy()
+        df_filtrado = taxas.df
     
-        if cliente_filtro != "Todos":
+        if cliente_filtro != "Todos" and servico_filtro != "Todos":
+            df_filtrado = taxas.registros(cliente_filtro, servico_filtro)
+        elif cliente_filtro != "Todos":
             df_filtrado = df_filtrado[df_filtrado['cliente'] == cliente_filtro]
-    
-        if servico_filtro != "Todos":
+        elif servico_filtro != "Todos":
             df_filtrado = df_filtrado[df_filtrado['servico'] == servico_filtro]
     
-        st.info(f"**{len(df_filtrado)}** de **{len(st.session_state.dados_editados)}** registros exibidos")
+        st.info(f"**{len(df_filtrado)}** de **{len(taxas.df)}** registros exibidos")
     
         # Planilha sempre visível com filtros aplicados
         st.dataframe(
@@ -1295,8 +1403,8 @@ with tab2:
     st.markdown("---")
     
     # Carregar lista de fundos do BigQuery
-    @st.cache_data(ttl=3600)
-    def carregar_fundos_disponiveis():
+    @registro_caches.cache_data('hub.funds', max_entries=4)  # Sem TTL: a chave inclui o token de frescor de hub.funds
+    def carregar_fundos_disponiveis(token_frescor=None):
         """Carrega lista de fundos disponíveis - apenas nomes"""
         try:
             client = get_bigquery_client()
@@ -1318,7 +1426,7 @@ with tab2:
     st.info("💡 **Waivers Progressivos**: Configure múltiplas fases com percentuais diferentes. Ex: Meses 1-2 = 100% waiver (não cobra), Mês 3-4 = 50% waiver (cobra metade), Mês 5+ = 0% (cobra full)")
     
     # Carregar fundos FORA do formulário
-    fundos_disponiveis = carregar_fundos_disponiveis()
+    fundos_disponiveis = carregar_fundos_disponiveis(obter_token_frescor('kanastra-live.hub.funds'))
     
     # Serviços disponíveis
     SERVICOS_DISPONIVEIS = ["Administração", "Gestão", "Custódia", "Agente Monitoramento", "Performance"]
@@ -1504,8 +1612,7 @@ with tab2:
                     # Criar waivers para cada combinação: fundo × fase × serviço
                     usuario_atual = st.session_state.get('usuario_logado', 'usuario_kanastra')
                     solicitacao_id = str(uuid.uuid4())  # Mesmo ID para agrupar todos
-                    sucesso = True
-                    total_waivers = 0
+                    linhas = []
                     
                     servicos_para_criar = servicos_selecionados if servicos_selecionados else [None]
                     
@@ -1532,18 +1639,18 @@ with tab2:
                                     "observacao": f"{observacao_waiver or 'Waiver progressivo'} - Fase {idx}/{len(fases_config)}"
                                 }
                                 
-                                resultado, _ = salvar_alteracao_pendente("INSERT", "waiver", dados_waiver, usuario_atual, solicitacao_id)
-                                if resultado:
-                                    total_waivers += 1
-                                else:
-                                    sucesso = False
-                                    break
-                            
-                            if not sucesso:
-                                break
-                        
-                        if not sucesso:
-                            break
+                                linhas.append({"tipo_alteracao": "INSERT", "tabela": "waiver", "dados": dados_waiver})
+                    
+                    # Todas as combinações em lotes dentro de uma transação (tudo ou nada)
+                    barra = st.progress(0.0, text=f"💾 Salvando {len(linhas):,} waiver(s)...")
+                    sucesso, _ = salvar_alteracoes_pendentes(
+                        linhas, usuario_atual, solicitacao_id,
+                        progresso=lambda gravadas, total: barra.progress(
+                            gravadas / total, text=f"💾 {gravadas:,} de {total:,} waiver(s) salvos"
+                        )
+                    )
+                    barra.empty()
+                    total_waivers = len(linhas) if sucesso else 0
                     
                     if sucesso:
                         st.success(f"✅ {total_waivers} waiver(s) criado(s) em {len(fases_config)} fase(s) e enviados para aprovação!")
@@ -1559,7 +1666,7 @@ with tab2:
     # Seção: Histórico de Waivers
     st.subheader("📊 Histórico de Waivers Aprovados")
     
-    @st.cache_data(ttl=300)
+    @registro_caches.cache_data('finance.descontos', ttl=300)
     def carregar_historico_waivers():
         """Carrega histórico de waivers do BigQuery (tabela finance.descontos)"""
         try:
@@ -1662,7 +1769,7 @@ with tab3:
     st.subheader("➕ Criar Novo Desconto")
     
     # Carregar fundos completos (ID + Nome + CNPJ)
-    fundos_completos = carregar_fundos_completos()
+    fundos_completos = carregar_fundos_completos(obter_token_frescor('kanastra-live.hub.funds'))
     
     if fundos_completos.empty:
         st.warning("⚠️ Nenhum fundo disponível no sistema")
@@ -1881,7 +1988,7 @@ with tab3:
                         # Se nenhum serviço foi selecionado, cria UMA solicitação com servico=NULL
                         usuario_atual = st.session_state.get('usuario_logado', 'usuario_kanastra')
                         solicitacao_id = str(uuid.uuid4())
-                        sucesso = True
+                        linhas = []
                         
                         servicos_para_criar = servicos_selecionados if servicos_selecionados else [None]
                         
@@ -1900,19 +2007,16 @@ with tab3:
                                 "documento_referencia": documento_referencia
                             }
                             
-                            resultado, _ = salvar_alteracao_pendente(
-                                "INSERT", 
-                                "desconto", 
-                                dados_desconto, 
-                                usuario_atual, 
-                                solicitacao_id,
-                                tipo_categoria="desconto",
-                                origem=origem_desconto
-                            )
-                            
-                            if not resultado:
-                                sucesso = False
-                                break
+                            linhas.append({
+                                "tipo_alteracao": "INSERT",
+                                "tabela": "desconto",
+                                "dados": dados_desconto,
+                                "tipo_categoria": "desconto",
+                                "origem": origem_desconto
+                            })
+                        
+                        # Um serviço por linha, todas em um único INSERT (tudo ou nada)
+                        sucesso, _ = salvar_alteracoes_pendentes(linhas, usuario_atual, solicitacao_id)
                         
                         if sucesso:
                             qtd_servicos = len(servicos_para_criar)
@@ -1942,49 +2046,74 @@ st.markdown("---")
 # PAINEL DE APROVAÇÃO (apenas para aprovadores)
 if perfil == "aprovador":
     st.subheader("👑 Painel de Aprovação")
+    
+    # Última aprovação desta sessão: SQL da transação e tempo de ponta a ponta x orçamento
+    ultima_aprovacao = st.session_state.pop('ultima_aprovacao', None)
+    if ultima_aprovacao:
+        linhas_aplicadas = ', '.join(f"{tabela_destino}: {qtd}" for tabela_destino, qtd in ultima_aprovacao['linhas'].items())
+        mensagem_tempo = f"⏱️ Última aprovação em {ultima_aprovacao['tempo_s']:.1f}s ({linhas_aplicadas})"
+        if ultima_aprovacao['dentro_orcamento']:
+            st.caption(mensagem_tempo)
+        else:
+            st.warning(f"{mensagem_tempo} — acima do orçamento de {ultima_aprovacao['orcamento_s']:.0f}s")
+        with st.expander("📜 Ver SQL executado"):
+            st.code(ultima_aprovacao['sql'], language="sql")
 else:
     st.subheader("📊 Suas Alterações Pendentes")
 
-# Carregar alterações pendentes do BigQuery (agrupadas por solicitacao_id)
-solicitacoes_pendentes = carregar_alteracoes_pendentes()
+# Resumo das solicitações pendentes (as linhas só são lidas quando a solicitação é aberta)
+token_pendentes = token_alteracoes_pendentes()
+solicitacoes_pendentes = carregar_resumo_solicitacoes(token_pendentes)
 
 # Filtrar solicitações conforme perfil
-if perfil == "editor":
+if perfil == "editor" and not solicitacoes_pendentes.empty:
     # Editores veem apenas suas próprias solicitações
-    solicitacoes_filtradas = [s for s in solicitacoes_pendentes if s[0].get('usuario') == st.session_state.usuario_logado]
+    solicitacoes_filtradas = solicitacoes_pendentes[solicitacoes_pendentes['usuario'] == st.session_state.usuario_logado]
 else:
     # Aprovadores veem todas as solicitações
     solicitacoes_filtradas = solicitacoes_pendentes
 
-if solicitacoes_filtradas:
+if not solicitacoes_filtradas.empty:
     st.markdown("---")
     
     total_solicitacoes = len(solicitacoes_filtradas)
-    total_linhas = sum(len(s) for s in solicitacoes_filtradas)
+    total_linhas = int(solicitacoes_filtradas['linhas'].sum())
     
     if perfil == "aprovador":
         st.subheader(f"⏳ Solicitações Pendentes: {total_solicitacoes} ({total_linhas} linhas)")
     else:
         st.subheader(f"⏳ Suas Solicitações Pendentes: {total_solicitacoes} ({total_linhas} linhas)")
     
-    # Processar cada solicitação (grupo de alterações)
-    for idx, solicitacao in enumerate(solicitacoes_filtradas):
-        # Primeira linha da solicitação tem os dados gerais
-        primeira_linha = solicitacao[0]
-        usuario_alteracao = primeira_linha.get('usuario', 'N/A')
-        timestamp = primeira_linha['timestamp']
-        tipo_alteracao = primeira_linha['tipo_alteracao']
-        tabela = primeira_linha['tabela']
+    # Paginação da lista de solicitações
+    total_paginas = (total_solicitacoes - 1) // SOLICITACOES_POR_PAGINA + 1
+    if total_paginas > 1:
+        pagina = st.number_input(
+            f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, value=1, step=1,
+            key="pagina_solicitacoes"
+        )
+    else:
+        pagina = 1
+    inicio_pagina = (int(pagina) - 1) * SOLICITACOES_POR_PAGINA
+    pagina_solicitacoes = solicitacoes_filtradas.iloc[inicio_pagina:inicio_pagina + SOLICITACOES_POR_PAGINA]
+    
+    # Processar cada solicitação da página (grupo de alterações)
+    for idx, resumo in enumerate(pagina_solicitacoes.itertuples(index=False), start=inicio_pagina):
+        solicitacao_id = resumo.solicitacao_id
+        usuario_alteracao = resumo.usuario or 'N/A'
+        timestamp = resumo.timestamp
+        tipo_alteracao = resumo.tipo_alteracao
+        tabela = resumo.tabela
+        total_linhas_solicitacao = int(resumo.linhas)
         
         # Cor de fundo diferente se for solicitação de outro usuário (para aprovadores)
         if perfil == "aprovador" and usuario_alteracao != st.session_state.usuario_logado:
             st.markdown(f"""
             <div style='background-color: #fffbea; padding: 15px; border-radius: 8px; border-left: 4px solid #f59e0b; margin-bottom: 15px;'>
-                <strong>📦 Solicitação #{idx + 1}</strong> - <em>Por: {usuario_alteracao}</em> - <em>{len(solicitacao)} linha(s)</em>
+                <strong>📦 Solicitação #{idx + 1}</strong> - <em>Por: {usuario_alteracao}</em> - <em>{total_linhas_solicitacao} linha(s)</em>
             </div>
             """, unsafe_allow_html=True)
         else:
-            st.markdown(f"### 📦 Solicitação #{idx + 1} - {len(solicitacao)} linha(s)")
+            st.markdown(f"### 📦 Solicitação #{idx + 1} - {total_linhas_solicitacao} linha(s)")
         
         # Exibir informações gerais da solicitação
         col_info1, col_info2, col_info3, col_info4 = st.columns(4)
@@ -1995,219 +2124,57 @@ if solicitacoes_filtradas:
         with col_info3:
             st.info(f"**Tabela:** {tabela}")
         with col_info4:
-            st.info(f"**Linhas:** {len(solicitacao)}")
+            st.info(f"**Linhas:** {total_linhas_solicitacao}")
         
-        # Mostrar todas as linhas da solicitação como tabela expandida
-        with st.expander(f"📋 Ver {len(solicitacao)} linha(s) desta solicitação", expanded=True):
-            # Criar DataFrame com todas as linhas
-            dados_todas_linhas = [alteracao['dados'] for alteracao in solicitacao]
-            df_solicitacao = pd.DataFrame(dados_todas_linhas)
+        # Linhas da solicitação: lidas do BigQuery só quando o usuário abre a solicitação
+        if st.toggle(f"📋 Ver {total_linhas_solicitacao} linha(s) desta solicitação", key=f"abrir_solicitacao_{solicitacao_id}"):
+            solicitacao = carregar_linhas_solicitacao(solicitacao_id, token_pendentes)
+            df_solicitacao = pd.DataFrame([alteracao['dados'] for alteracao in solicitacao])
             st.dataframe(df_solicitacao, width='stretch', hide_index=True)
         
         # Botões de aprovação/rejeição EM BLOCO (APENAS PARA APROVADORES)
         if perfil == "aprovador":
             col_btn1, col_btn2 = st.columns(2)
             with col_btn1:
-                if st.button(f"✅ Aprovar Solicitação Completa", key=f"aprovar_solicitacao_{idx}", width='stretch', type="primary"):
-                    # Executar todas as alterações da solicitação
+                if st.button(f"✅ Aprovar Solicitação Completa", key=f"aprovar_solicitacao_{solicitacao_id}", width='stretch', type="primary"):
+                    # Solicitação inteira numa única transação: um INSERT/MERGE por tabela + status
                     try:
                         client = get_bigquery_client()
-                        erros = []
-                        queries_executadas = []
+                        aprovador = st.session_state.usuario_logado
+                        solicitacao = carregar_linhas_solicitacao(solicitacao_id, token_pendentes)
+                        if not solicitacao:
+                            raise ValueError("Solicitação sem linhas pendentes")
+                        resultado = motor_aprovacao.aprovar_solicitacao(client, solicitacao, aprovador)
                         
-                        # Processar cada linha da solicitação
-                        for alteracao in solicitacao:
-                            tabela_alt = alteracao['tabela']
-                            dados = alteracao['dados']
-                            tipo_alt = alteracao['tipo_alteracao']
-                            
-                            try:
-                                # WAIVER - Insere em finance.descontos com categoria='waiver'
-                                if tabela_alt == "waiver":
-                                    waiver_id = str(uuid.uuid4())
-                                    data_aplicacao = datetime.now().isoformat()
-                                    usuario_criador = alteracao.get('usuario', 'usuario_kanastra')
-                                    
-                                    # tipo_waiver vem como 'Provisionado' ou 'Nao_Provisionado'
-                                    forma_aplicacao = dados['tipo_waiver']
-                                    
-                                    # Verificar se tem tipo_desconto (waivers novos) ou usar padrão (waivers antigos)
-                                    tipo_desconto = dados.get('tipo_desconto', 'Fixo')
-                                    percentual_desconto = dados.get('percentual_desconto')
-                                    valor_desconto = dados.get('valor_waiver', 0.0)
-                                    servico = dados.get('servico')
-                                    
-                                    sql = f"""
-                                    INSERT INTO `kanastra-live.finance.descontos` 
-                                    (id, data_aplicacao, usuario, fund_id, fund_name, categoria,
-                                     valor_desconto, tipo_desconto, percentual_desconto, forma_aplicacao, origem,
-                                     data_inicio, data_fim, servico, observacao, documento_referencia)
-                                    VALUES (
-                                        '{waiver_id}',
-                                        TIMESTAMP('{data_aplicacao}'),
-                                        '{usuario_criador}',
-                                        NULL,
-                                        '{dados['fund_name']}',
-                                        'waiver',
-                                        {valor_desconto},
-                                        '{tipo_desconto}',
-                                        {percentual_desconto if percentual_desconto is not None else 'NULL'},
-                                        '{forma_aplicacao}',
-                                        NULL,
-                                        DATE('{dados['data_inicio']}'),
-                                        DATE('{dados['data_fim']}'),
-                                        {f"'{servico}'" if servico else 'NULL'},
-                                        '{dados.get('observacao', 'Aprovado via Dashboard')}',
-                                        NULL
-                                    )
-                                    """
-                                
-                                # DESCONTO - Inserir na tabela descontos com categoria baseada na origem
-                                elif tabela_alt == "desconto":
-                                    desconto_id = str(uuid.uuid4())
-                                    data_aplicacao = datetime.now().isoformat()
-                                    usuario_aprovador = st.session_state.usuario_logado
-                                    
-                                    # Obter origem da alteração (juridico ou comercial)
-                                    origem_desconto = alteracao.get('origem', 'comercial')
-                                    categoria_desconto = f'desconto_{origem_desconto}'  # 'desconto_juridico' ou 'desconto_comercial'
-                                    
-                                    # Forma de aplicação: Provisionado ou Nao_Provisionado
-                                    forma_aplicacao = dados.get('forma_aplicacao', 'Nao_Provisionado')
-                                    
-                                    sql = f"""
-                                    INSERT INTO `kanastra-live.finance.descontos` 
-                                    (id, data_aplicacao, usuario, fund_id, fund_name, categoria,
-                                     valor_desconto, tipo_desconto, percentual_desconto, forma_aplicacao, origem,
-                                     data_inicio, data_fim, servico, observacao, documento_referencia)
-                                    VALUES (
-                                        '{desconto_id}',
-                                        TIMESTAMP('{data_aplicacao}'),
-                                        '{usuario_aprovador}',
-                                        {dados.get('fund_id', 0)},
-                                        '{dados.get('fund_name', '')}',
-                                        '{categoria_desconto}',
-                                        {dados.get('valor_desconto', 0)},
-                                        '{dados.get('tipo_desconto', 'Fixo')}',
-                                        {dados.get('percentual_desconto') if dados.get('percentual_desconto') else 'NULL'},
-                                        '{forma_aplicacao}',
-                                        '{origem_desconto}',
-                                        DATE('{dados['data_inicio']}'),
-                                        {"DATE('" + dados['data_fim'] + "')" if dados.get('data_fim') else 'NULL'},
-                                        {f"'{dados['servico']}'" if dados.get('servico') else 'NULL'},
-                                        '{dados.get('observacao', 'Aprovado via Dashboard')}',
-                                        '{dados.get('documento_referencia', '')}'
-                                    )
-                                    """
-                                
-                                elif tipo_alt == "INSERT":
-                                    # Gerar SQL INSERT para taxas
-                                    colunas = [k for k in dados.keys()]
-                                    valores = []
-                                    for k in colunas:
-                                        v = dados[k]
-                                        if v is None:
-                                            valores.append("NULL")
-                                        elif isinstance(v, str):
-                                            valores.append(f"'{v}'")
-                                        elif isinstance(v, (int, float)):
-                                            valores.append(str(v))
-                                        else:
-                                            valores.append(f"'{str(v)}'")
-                                    
-                                    # Mapear fund_id para `fund id` com backticks
-                                    colunas_sql = [f"`fund id`" if c == "fund_id" else c for c in colunas]
-                                    
-                                    sql = f"""
-                                    INSERT INTO `kanastra-live.finance.{tabela_alt}` 
-                                    ({', '.join(colunas_sql)})
-                                    VALUES ({', '.join(valores)})
-                                    """
-                                    
-                                else:  # UPDATE para taxas
-                                    # Gerar SQL UPDATE
-                                    set_clause = []
-                                    for k, v in dados.items():
-                                        if k not in ['fund_id', 'cliente', 'servico', 'empresa', 'original_faixa', 'original_lower']:
-                                            if v is None:
-                                                set_clause.append(f"{k} = NULL")
-                                            elif isinstance(v, str):
-                                                set_clause.append(f"{k} = '{v}'")
-                                            elif isinstance(v, (int, float)):
-                                                set_clause.append(f"{k} = {v}")
-                                            else:
-                                                set_clause.append(f"{k} = '{str(v)}'")
-                                    
-                                    # WHERE clause baseado na tabela
-                                    if tabela_alt == "fee_minimo":
-                                        where = f"`fund id` = {dados['fund_id']} AND servico = '{dados['servico']}' AND faixa = {dados.get('original_lower', dados['faixa'])}"
-                                    else:  # fee_variavel
-                                        original_faixa = dados.get('original_faixa', dados.get('original_lower', dados['faixa']))
-                                        where = f"`fund id` = {dados['fund_id']} AND servico = '{dados['servico']}' AND faixa = {original_faixa}"
-                                    
-                                    sql = f"""
-                                    UPDATE `kanastra-live.finance.{tabela_alt}`
-                                    SET {', '.join(set_clause)}
-                                    WHERE {where}
-                                    """
-                                
-                                # Executar query
-                                queries_executadas.append(sql)
-                                query_job = client.query(sql)
-                                query_job.result()
-                                
-                            except Exception as e:
-                                erros.append(f"Erro em uma das linhas: {str(e)}")
+                        # Limpar só os caches das tabelas alteradas e publicar a versão nova
+                        registro_caches.invalidar(*[f'finance.{tabela_destino}' for tabela_destino in resultado['linhas']])
+                        obter_repositorio_taxas().invalidar(*resultado['linhas'])
+                        invalidar_alteracoes_pendentes()
+                        versao_alteracoes.incrementar_versao(client, origem='aprovacao')
+                        st.session_state.ultima_aprovacao = resultado
                         
-                        # Se todas as queries foram executadas com sucesso
-                        if not erros:
-                            # Mostrar queries executadas
-                            with st.expander("📜 Ver SQL executado"):
-                                for q in queries_executadas:
-                                    st.code(q, language="sql")
-                            
-                            # Limpar cache se for waiver
-                            if tabela == "waiver":
-                                st.cache_data.clear()
-                            
-                            # Atualizar status de TODAS as linhas da solicitação como APROVADO
-                            aprovador = st.session_state.usuario_logado
-                            sucesso_atualizacao = True
-                            
-                            for alteracao in solicitacao:
-                                # Atualizar status
-                                if not atualizar_status_alteracao(alteracao['id'], 'APROVADO', aprovador):
-                                    sucesso_atualizacao = False
-                            
-                            if sucesso_atualizacao:
-                                if tabela == "waiver":
-                                    st.success(f"✅ Solicitação completa aprovada! {len(solicitacao)} waiver(s) registrado(s)!")
-                                else:
-                                    st.success(f"✅ Solicitação completa aprovada! {len(solicitacao)} linha(s) aplicada(s)!")
-                                st.rerun()
-                            else:
-                                st.warning("⚠️ Alterações aplicadas mas houve erro ao atualizar status")
+                        if tabela == "waiver":
+                            st.success(f"✅ Solicitação completa aprovada! {len(solicitacao)} waiver(s) registrado(s)!")
                         else:
-                            st.error("❌ Erros ao processar solicitação:")
-                            for erro in erros:
-                                st.error(erro)
-                        
+                            st.success(f"✅ Solicitação completa aprovada! {len(solicitacao)} linha(s) aplicada(s)!")
+                        st.rerun()
                     except Exception as e:
-                        st.error(f"❌ Erro geral ao processar solicitação: {str(e)}")
+                        # Nada foi aplicado (transação desfeita)
+                        st.error(f"❌ Erro ao processar solicitação (nenhuma linha aplicada): {str(e)}")
             
             with col_btn2:
-                if st.button(f"❌ Rejeitar Solicitação Completa", key=f"rejeitar_solicitacao_{idx}", width='stretch'):
+                if st.button(f"❌ Rejeitar Solicitação Completa", key=f"rejeitar_solicitacao_{solicitacao_id}", width='stretch'):
                     aprovador = st.session_state.usuario_logado
-                    sucesso_rejeicao = True
-                    for alteracao in solicitacao:
-                        if not atualizar_status_alteracao(alteracao['id'], 'REJEITADO', aprovador):
-                            sucesso_rejeicao = False
-                    
-                    if sucesso_rejeicao:
+                    try:
+                        client = get_bigquery_client()
+                        solicitacao = carregar_linhas_solicitacao(solicitacao_id, token_pendentes)
+                        motor_aprovacao.rejeitar_solicitacao(client, solicitacao, aprovador)
+                        invalidar_alteracoes_pendentes()
+                        versao_alteracoes.incrementar_versao(client, origem='status')
                         st.warning(f"⚠️ Solicitação completa rejeitada por {aprovador}! {len(solicitacao)} linha(s) descartada(s).")
                         st.rerun()
-                    else:
-                        st.error("❌ Erro ao rejeitar solicitação")
+                    except Exception as e:
+                        st.error(f"❌ Erro ao rejeitar solicitação: {str(e)}")
         else:
             # Editores apenas visualizam, não podem aprovar
             st.info("⏳ Aguardando aprovação de um aprovador")
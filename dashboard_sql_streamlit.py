@@ -11,6 +11,29 @@ from google.oauth2 import service_account
 import os
 import json
 import uuid
+import provisao_incremental
+import pl_diario
+import fatores_correcao
+import calendario
+import motor_ajustes
+import cache_resultados
+import resultados_compartilhados
+import tipos_compactos
+import download_arrow
+import atualizacao_segundo_plano
+import chamada_unica
+import consultas_paralelas
+import versao_alteracoes
+import frescor_fontes
+import registro_cache
+import migracoes
+
+# Copy-on-write: visões filtradas do resultado compartilhado entre sessões só copiam
+# as colunas que forem alteradas
+pd.set_option('mode.copy_on_write', True)
+
+# Caches com tags (tabelas de origem): invalidação por tabela em vez de st.cache_data.clear()
+registro_caches = registro_cache.obter_registro()
 
 # Configuração da página
 st.set_page_config(
@@ -221,6 +244,25 @@ def get_bigquery_client():
     except Exception as e:
         raise Exception(f"Erro ao criar cliente BigQuery: {str(e)}")
 
+# Cliente da Storage Read API (download Arrow em streams paralelos; None = API REST)
+@st.cache_resource
+def get_bigquery_read_client():
+    return download_arrow.criar_cliente_leitura(get_bigquery_client())
+
+# Migrações de esquema (tabelas intermediárias, versão de alterações) aplicadas uma vez por processo
+@st.cache_resource
+def obter_esquema():
+    return migracoes.preparar_esquema(get_bigquery_client())
+
+# Frescor das fontes (metadados das tabelas, relidos a cada INTERVALO_VERIFICACAO segundos)
+@registro_caches.cache_data(registro_cache.TAG_METADADOS, ttl=frescor_fontes.INTERVALO_VERIFICACAO)
+def obter_frescor(tabelas=frescor_fontes.TABELAS_CALCULADORA):
+    """Token de frescor das tabelas; sem acesso aos metadados, o frescor diário"""
+    try:
+        return frescor_fontes.verificar_frescor(get_bigquery_client(), tabelas)
+    except Exception:
+        return {'token': cache_resultados.token_diario(), 'modificacoes': {}, 'completo': False}
+
 # Sidebar - Logo e Filtros
 st.sidebar.image("https://www.kanastra.design/wordmark-green.svg", width=150)
 st.sidebar.markdown("---")
@@ -289,32 +331,49 @@ st.sidebar.info(f"**{dias_periodo + 1} dias** de {data_inicio.strftime('%d/%m/%Y
 st.sidebar.divider()
 
 # Carregar lista de fundos e serviços do BigQuery para os filtros
-@st.cache_data(ttl=3600)
-def carregar_opcoes_filtros():
-    """Carrega lista de fundos e serviços disponíveis"""
+@registro_caches.cache_data('hub.funds', max_entries=4)  # Sem TTL: a chave muda quando hub.funds é carregada
+def carregar_opcoes_filtros(token_frescor):
+    """Carrega lista de fundos e serviços disponíveis
+    
+    Args:
+        token_frescor: Token de frescor de hub.funds (invalida o cache após uma carga)
+    """
     try:
         client = get_bigquery_client()
         
         # Buscar fundos - ajustando nome da coluna
         query_fundos = """
-        SELECT DISTINCT name as fund_name
+        SELECT id as fund_id, name as fund_name
         FROM `kanastra-live.hub.funds` 
         WHERE name IS NOT NULL 
         ORDER BY name
         """
-        fundos_df = client.query(query_fundos).to_dataframe()
-        fundos = ["Todos"] + fundos_df['fund_name'].tolist()
+        # Lista de fundos também vem do cache em disco após um restart
+        cache_disco = cache_resultados.obter_cache()
+        chave_fundos = cache_resultados.chave_resultado(query_fundos, token_fonte=token_frescor)
+        em_cache = cache_disco.ler(chave_fundos)
+        if em_cache is not None:
+            fundos_df = em_cache[0]
+        else:
+            fundos_df = client.query(query_fundos).to_dataframe()
+            cache_disco.gravar(chave_fundos, fundos_df)
+        fundos = ["Todos"] + fundos_df['fund_name'].drop_duplicates().tolist()
+        
+        # Nome -> IDs (usado para enviar o filtro de fundos à query)
+        ids_por_fundo = fundos_df.groupby('fund_name')['fund_id'].apply(list).to_dict()
         
         # Serviços fixos (podem estar na query)
         servicos = ["Todos", "Administração", "Gestão", "Custódia", "Custódia Kanastra"]
         
-        return fundos, servicos
+        return fundos, servicos, ids_por_fundo
     except Exception as e:
         st.sidebar.warning(f"⚠️ Não foi possível carregar filtros: {str(e)[:100]}")
-        return ["Todos"], ["Todos"]
+        return ["Todos"], ["Todos"], {}
 
 # Carregar opções
-fundos_disponiveis, servicos_disponiveis = carregar_opcoes_filtros()
+fundos_disponiveis, servicos_disponiveis, ids_por_fundo = carregar_opcoes_filtros(
+    obter_frescor(('kanastra-live.hub.funds',))['token']
+)
 
 # Filtro de Fundo (múltiplos)
 st.sidebar.subheader("🏢 Fundos")
@@ -334,6 +393,32 @@ servico_selecionado = st.sidebar.selectbox(
     key="filtro_servico"
 )
 
+# Filtros enviados à query (@fund_ids / @servico). Tupla ordenada para que a mesma
+# seleção, em qualquer ordem, reaproveite o mesmo cache
+fund_ids_filtro = tuple(sorted(
+    int(fund_id) for fundo in fundos_selecionados for fund_id in ids_por_fundo.get(fundo, [])
+))
+servico_filtro = None if servico_selecionado == "Todos" else servico_selecionado
+
+st.sidebar.divider()
+
+# Modo de cálculo: query completa ou provisões incrementais persistidas
+st.sidebar.subheader("⚡ Modo de Cálculo")
+modo_incremental = st.sidebar.checkbox(
+    "Usar provisões incrementais",
+    value=False,
+    key="modo_incremental",
+    help="Recalcula apenas os dias novos e lê de finance.provisao_calculadora"
+)
+reconstruir_provisoes = False
+if modo_incremental:
+    reconstruir_provisoes = st.sidebar.checkbox(
+        "🔁 Reconstrução completa",
+        value=False,
+        key="reconstruir_provisoes",
+        help="Use quando uma taxa for alterada retroativamente"
+    )
+
 st.sidebar.divider()
 
 # Inicializar session_state para executar automaticamente na primeira vez
@@ -342,7 +427,7 @@ if 'auto_executed' not in st.session_state:
     st.session_state['execute_query'] = True
 
 # Função para carregar a query SQL
-@st.cache_data
+@registro_caches.cache_data('arquivo_sql')
 def load_sql_query():
     """Carrega a query SQL do arquivo"""
     sql_file = "Calculadora 5.0.sql"
@@ -356,37 +441,188 @@ def load_sql_query():
     
     return query
 
-# Função para executar query no BigQuery
-@st.cache_data(ttl=600)  # Cache por 10 minutos
-def executar_query_bigquery(_client, query, data_inicio_str, data_fim_str):
-    """Executa a query SQL no BigQuery"""
+# Resultados da calculadora compartilhados entre as sessões do processo
+@st.cache_resource
+def obter_resultados_compartilhados():
+    """Uma cópia de cada resultado por processo, com orçamento de memória"""
+    return resultados_compartilhados.ResultadosCompartilhados()
+
+resultados = obter_resultados_compartilhados()
+
+# Coalescência de queries idênticas entre sessões (um job no BigQuery por chave em andamento)
+@st.cache_resource
+def obter_chamadas_unicas():
+    return chamada_unica.ChamadasUnicas()
+
+chamadas_unicas = obter_chamadas_unicas()
+
+# Consultas independentes de cada rerun executadas em paralelo
+@st.cache_resource
+def obter_executor_consultas():
+    return consultas_paralelas.ExecutorConsultas()
+
+executor_consultas = obter_executor_consultas()
+
+# Prazo (s) das consultas de cada rerun: uma verificação lenta não segura a tabela principal
+TIMEOUTS_CONSULTAS = {'timestamp': 20, 'ajustes': 30, 'pendentes': 10}
+id_sessao = st.session_state.setdefault('id_sessao', uuid.uuid4().hex)
+
+def mostrar_economia_tipos(economia):
+    """Informa na sidebar a memória economizada pelos tipos compactos"""
+    if economia['bytes_antes'] > 0:
+        st.sidebar.info(
+            f"🗜️ Tipos compactos: {economia['bytes_depois'] / 1024 / 1024:.1f} MB "
+            f"({economia['bytes_economizados'] / 1024 / 1024:.1f} MB economizados)"
+        )
+
+# Cálculo da calculadora sem chamadas ao Streamlit (também usado pela atualização em
+# segundo plano, que roda fora do script da sessão)
+def calcular_resultado(client, query, data_inicio_str, data_fim_str, fund_ids=(), servico=None,
+                       cliente_leitura=None, progresso=None):
+    """Executa a Calculadora 5.0 e baixa o resultado compacto
+
+    Returns:
+        (DataFrame, MB processados, economia dos tipos compactos, tempos de query/transferência)
+    """
+    # Período e filtros enviados como parâmetros da query (@data_inicio, @data_fim,
+    # @fund_ids, @servico) para que o BigQuery leia apenas o necessário
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter('data_inicio', 'DATE', data_inicio_str),
+            bigquery.ScalarQueryParameter('data_fim', 'DATE', data_fim_str),
+            bigquery.ArrayQueryParameter('fund_ids', 'INT64', list(fund_ids)),
+            bigquery.ScalarQueryParameter('servico', 'STRING', servico),
+            # Dias úteis do calendário em cache (carregado uma vez por processo)
+            calendario.parametro_dias_uteis(client, data_inicio_str, data_fim_str),
+        ]
+    )
+
+    # Executar query
+    query_job = client.query(query, job_config=job_config)
+    
+    # Baixar em lotes Arrow (Storage Read API quando disponível) e converter para tipos
+    # compactos (categóricos, inteiros mínimos, datetime64)
+    df, economia, tempos = tipos_compactos.carregar_compacto(
+        query_job, cliente_leitura=cliente_leitura, progresso=progresso
+    )
+    
+    # Informações sobre a query
+    bytes_processed = query_job.total_bytes_processed / 1024 / 1024  # MB
+    
+    return df, bytes_processed, economia, tempos
+
+# Recálculo completo em segundo plano: tabelas intermediárias + calculadora
+def recalcular_resultado(client, query, data_inicio_str, data_fim_str, fund_ids=(), servico=None,
+                         cliente_leitura=None):
+    """Usado pelo AtualizadorResultados; devolve (DataFrame, metadados do cache em disco)
+
+    Falhas nas tabelas intermediárias propagam: o resultado seria publicado com o token de
+    frescor novo sobre tabelas antigas e não seria mais recalculado. O AtualizadorResultados
+    registra o erro (aviso na sidebar) e mantém a versão anterior em exibição.
+    """
+    pl_diario.atualizar_pl_diario(client)
+    fatores_correcao.atualizar_fatores(client)
+    df, bytes_mb, _, _ = calcular_resultado(
+        client, query, data_inicio_str, data_fim_str, fund_ids, servico, cliente_leitura
+    )
+    return df, {'bytes_mb': bytes_mb}
+
+# Função para executar query no BigQuery (o resultado é reaproveitado pelo cache em disco
+# mapeado em memória, não por st.cache_data, para não manter uma cópia extra por processo)
+def executar_query_bigquery(_client, query, data_inicio_str, data_fim_str, fund_ids=(), servico=None):
+    """Executa a query SQL no BigQuery
+    
+    Args:
+        fund_ids: Tupla de IDs de fundos (vazia = todos)
+        servico: Nome do serviço (None = todos)
+    """
     
     try:
-        # Substituir parâmetros de data na query (se necessário)
-        # Ajuste conforme sua query usar as datas
-        query_parametrizada = query.replace('CURRENT_DATE()', f"'{data_fim_str}'")
+        # Progresso do download na sidebar (atualizado pela sessão enquanto aguarda o job)
+        barra = st.sidebar.progress(0.0, text="⬇️ Baixando resultado...")
+        def mostrar_progresso(progresso):
+            if progresso:
+                baixadas, total = progresso
+                barra.progress(min(baixadas / total, 1.0) if total else 1.0,
+                               text=f"⬇️ {baixadas:,} de {total:,} linhas")
         
-        # Se sua query tiver parâmetros específicos, adicione aqui
-        # Exemplo: query = query.replace('@data_inicio', f"'{data_inicio_str}'")
-        
-        # Executar query
-        query_job = _client.query(query_parametrizada)
-        
-        # Converter para DataFrame
-        df = query_job.to_dataframe()
-        
-        # Informações sobre a query
-        bytes_processed = query_job.total_bytes_processed / 1024 / 1024  # MB
+        # Sessões que pedem a mesma execução ao mesmo tempo compartilham um único job
+        cliente_leitura = get_bigquery_read_client()
+        df, bytes_processed, economia, tempos = chamadas_unicas.executar(
+            ('calculadora', query, data_inicio_str, data_fim_str, tuple(fund_ids), servico),
+            lambda progresso: calcular_resultado(
+                _client, query, data_inicio_str, data_fim_str, fund_ids, servico,
+                cliente_leitura=cliente_leitura, progresso=progresso
+            ),
+            ao_aguardar=mostrar_progresso
+        )
+        barra.empty()
+        st.session_state['tempos_download'] = tempos
+        mostrar_economia_tipos(economia)
         
         return df, bytes_processed, None
         
     except Exception as e:
         return None, 0, str(e)
 
+# Atualizador compartilhado pelas sessões do processo (stale-while-revalidate)
+@st.cache_resource
+def obter_atualizador():
+    return atualizacao_segundo_plano.AtualizadorResultados(cache_resultados.obter_cache())
+
+# Chave do resultado (memória compartilhada e cache em disco)
+def chave_calculadora(consulta, data_inicio_str, data_fim_str, fund_ids=(), servico=None, token_frescor=None):
+    """Hash do SQL (ou do modo), dos parâmetros e do token de frescor das fontes"""
+    return cache_resultados.chave_resultado(
+        consulta,
+        {'data_inicio': data_inicio_str, 'data_fim': data_fim_str,
+         'fund_ids': list(fund_ids), 'servico': servico},
+        token_frescor
+    )
+
+# Função para atualizar as tabelas intermediárias lidas pela calculadora
+@registro_caches.cache_data('finance.pl_diario', 'finance.fatores_correcao', max_entries=4)  # Sem TTL: só reprocessa quando as fontes mudam
+def atualizar_tabelas_intermediarias(_client, token_frescor):
+    """Reprocessa os dias recentes de finance.pl_diario e os fatores com índice novo
+    
+    Args:
+        token_frescor: Token de frescor de quotas, wallet, correcao_aux_v3 e indices_v3
+    """
+    return {
+        'pl_diario': pl_diario.atualizar_pl_diario(_client),
+        'fatores_correcao': fatores_correcao.atualizar_fatores(_client),
+    }
+
+# Função para executar o modo incremental (atualiza provisões e lê o período)
+def executar_modo_incremental(client, data_inicio_str, data_fim_str, reconstruir, fund_ids=(), servico=None):
+    """Atualiza finance.provisao_calculadora e lê o período (e filtros) selecionado"""
+
+    try:
+        # Sessões que atualizam ao mesmo tempo aguardam a mesma atualização (como na calculadora)
+        resumo = chamadas_unicas.executar(
+            ('provisao_incremental', reconstruir),
+            lambda _: provisao_incremental.atualizar_provisoes(client, reconstruir=reconstruir)
+        )
+        df, bytes_processed = provisao_incremental.ler_provisoes(
+            client, data_inicio_str, data_fim_str, fund_ids=fund_ids, servico=servico
+        )
+        df, economia = tipos_compactos.compactar(df)
+        mostrar_economia_tipos(economia)
+        return df, bytes_processed / 1024 / 1024, resumo, None
+
+    except Exception as e:
+        return None, 0, None, str(e)
+
 # Botão para executar
 if st.sidebar.button("🚀 Executar Query SQL", type="primary", width='stretch'):
     st.session_state['execute_query'] = True
 
+# Filtros de fundo/serviço são aplicados na query: ao mudar a seleção, buscar de novo
+# (seleções já consultadas voltam do cache em disco)
+filtros_query = (fund_ids_filtro, servico_filtro)
+if 'chave_base' in st.session_state and st.session_state.get('filtros_query') != filtros_query:
+    st.session_state['execute_query'] = True
+
 # Executar query automaticamente ou quando solicitado
 if st.session_state.get('execute_query', False) or not st.session_state['auto_executed']:
     
@@ -410,18 +646,83 @@ if st.session_state.get('execute_query', False) or not st.session_state['auto_ex
                 st.sidebar.error(f"❌ Erro ao conectar: {e}")
                 st.stop()
         
+        # Tabelas e colunas esperadas (uma vez por processo; sem permissão de DDL, só avisa)
+        try:
+            esquema = obter_esquema()
+            if esquema['erro']:
+                st.sidebar.warning(f"⚠️ Migrações de esquema não aplicadas: {esquema['erro'][:100]}")
+        except Exception as e:
+            st.sidebar.warning(f"⚠️ Esquema não verificado: {str(e)[:100]}")
+        
         # Executar query
         inicio_execucao = datetime.now()
-        with st.spinner('⚡ Executando query SQL no BigQuery...'):
-            data_inicio_str = data_inicio.strftime('%Y-%m-%d')
-            data_fim_str = data_fim.strftime('%Y-%m-%d')
+        data_inicio_str = data_inicio.strftime('%Y-%m-%d')
+        data_fim_str = data_fim.strftime('%Y-%m-%d')
+
+        # Chave do resultado: SQL/modo, parâmetros e token de frescor das fontes (o resultado
+        # vale enquanto nenhuma fonte for carregada de novo)
+        token_frescor = obter_frescor()['token']
+        chave_base = chave_calculadora(
+            'provisao_incremental' if modo_incremental else sql_query,
+            data_inicio_str, data_fim_str, fund_ids_filtro, servico_filtro, token_frescor
+        )
+
+        versao = None
+        st.session_state.pop('tempos_download', None)
+        # Parâmetros do resultado para o recálculo em segundo plano (só o modo SQL usa o cache em disco)
+        parametros_base = None if modo_incremental else {
+            'data_inicio_str': data_inicio_str, 'data_fim_str': data_fim_str,
+            'fund_ids': fund_ids_filtro, 'servico': servico_filtro,
+        }
+        if modo_incremental:
+            with st.spinner('⚡ Atualizando provisões incrementais...'):
+                df, bytes_mb, resumo_incremental, error = executar_modo_incremental(
+                    client,
+                    data_inicio_str,
+                    data_fim_str,
+                    reconstruir_provisoes,
+                    fund_ids=fund_ids_filtro,
+                    servico=servico_filtro
+                )
+            if resumo_incremental:
+                st.sidebar.info(f"🔁 {resumo_incremental['linhas']:,} linhas recalculadas ({resumo_incremental['modo']})")
+        else:
+            # Cache em disco compartilhado entre processos: um restart/deploy reaproveita o
+            # resultado do dia sem executar a query ("Recarregar Tudo" ignora o cache)
+            cache_disco = cache_resultados.obter_cache()
+            em_cache = None if st.session_state.pop('ignorar_cache_disco', False) else cache_disco.ler(chave_base)
             
-            df, bytes_mb, error = executar_query_bigquery(
-                client, 
-                sql_query, 
-                data_inicio_str, 
-                data_fim_str
-            )
+            if em_cache is not None:
+                df, metadados = em_cache
+                bytes_mb, error, versao = 0, None, metadados['versao']
+                st.sidebar.info(f"💾 Resultado do cache em disco (query original: {metadados.get('bytes_mb', 0):.2f} MB)")
+            else:
+                with st.spinner('📈 Atualizando PL diário e fatores de correção...'):
+                    try:
+                        atualizar_tabelas_intermediarias(
+                            client, obter_frescor(frescor_fontes.TABELAS_INTERMEDIARIAS)['token']
+                        )
+                    except Exception as e:
+                        st.sidebar.warning(f"⚠️ Tabelas intermediárias não atualizadas: {str(e)[:100]}")
+                with st.spinner('⚡ Executando query SQL no BigQuery...'):
+                    df, bytes_mb, error = executar_query_bigquery(
+                        client,
+                        sql_query,
+                        data_inicio_str,
+                        data_fim_str,
+                        fund_ids=fund_ids_filtro,
+                        servico=servico_filtro
+                    )
+                if not error and df is not None:
+                    try:
+                        # Publica a versão no disco e passa a usar o arquivo mapeado: os demais
+                        # processos do servidor leem as mesmas páginas em vez de outra cópia
+                        cache_disco.gravar(chave_base, df, {'bytes_mb': bytes_mb})
+                        em_cache = cache_disco.ler(chave_base)
+                        if em_cache is not None:
+                            df, versao = em_cache[0], em_cache[1]['versao']
+                    except Exception as e:
+                        st.sidebar.warning(f"⚠️ Resultado não gravado no cache em disco: {str(e)[:100]}")
         fim_execucao = datetime.now()
         tempo_execucao = (fim_execucao - inicio_execucao).total_seconds()
         
@@ -432,9 +733,13 @@ if st.session_state.get('execute_query', False) or not st.session_state['auto_ex
             st.stop()
         
         if df is not None and not df.empty:
-            # Salvar DataFrame ORIGINAL (sem filtros) e timestamp
-            st.session_state['df_original'] = df.copy()
-            st.session_state['df'] = df.copy()  # Manter compatibilidade
+            # Publicar o DataFrame ORIGINAL (já filtrado na query por fundo/serviço) uma única
+            # vez por processo; a sessão guarda só a chave
+            resultados.publicar(chave_base, df, id_sessao, versao=versao)
+            st.session_state['chave_base'] = chave_base
+            st.session_state['token_frescor'] = token_frescor
+            st.session_state['parametros_base'] = parametros_base
+            st.session_state['filtros_query'] = filtros_query
             st.session_state['bytes_mb'] = bytes_mb
             st.session_state['ultima_atualizacao'] = fim_execucao
             st.session_state['tempo_execucao'] = tempo_execucao
@@ -443,17 +748,134 @@ if st.session_state.get('execute_query', False) or not st.session_state['auto_ex
             st.sidebar.info(f"📊 {len(df):,} registros carregados")
             st.sidebar.info(f"� {bytes_mb:.2f} MB processados")
             st.sidebar.info(f"⏱️ Tempo: {tempo_execucao:.2f}s")
+            tempos = st.session_state.get('tempos_download')
+            if tempos:
+                via = 'Storage Read API' if tempos['via'] == 'storage' else 'API REST'
+                st.sidebar.info(
+                    f"⏱️ Query: {tempos['query_s']:.2f}s | Transferência: {tempos['transferencia_s']:.2f}s ({via})"
+                )
             st.sidebar.success(f"🕐 Atualizado: {fim_execucao.strftime('%d/%m/%Y %H:%M:%S')}")
         else:
+            st.session_state['filtros_query'] = filtros_query
             st.warning("⚠️ Query retornou 0 registros")
 
+# Métricas da coalescência de queries (processo atual)
+with st.sidebar.expander("📈 Queries coalescidas"):
+    metricas = chamadas_unicas.metricas()
+    st.caption(
+        f"{metricas['chamadas']:,} chamadas | {metricas['executadas']:,} jobs | "
+        f"{metricas['coalescidas']:,} coalescidas | {metricas['desistencias']:,} desistências | "
+        f"{metricas['erros']:,} erros | {metricas['em_andamento']} em andamento"
+    )
+
+# Resultados compartilhados em memória e quanto cada sessão referencia (processo atual)
+with st.sidebar.expander("🧠 Resultados em memória"):
+    estatisticas_resultados = resultados.estatisticas()
+    st.caption(
+        f"{estatisticas_resultados['resultados']:,} resultados ({estatisticas_resultados['resultados_em_uso']:,} em uso) | "
+        f"{estatisticas_resultados['sessoes']:,} sessões | "
+        f"{estatisticas_resultados['bytes'] / 1024 / 1024:,.1f} de "
+        f"{estatisticas_resultados['limite_bytes'] / 1024 / 1024:,.0f} MB"
+    )
+    memoria_sessoes = resultados.memoria_por_sessao()
+    if memoria_sessoes:
+        st.dataframe(
+            pd.DataFrame(
+                [{'Sessão': ('esta' if sessao == id_sessao else sessao[:8]), 'MB': valor / 1024 / 1024}
+                 for sessao, valor in sorted(memoria_sessoes.items(), key=lambda item: -item[1])]
+            ),
+            hide_index=True,
+            width='stretch',
+            column_config={'MB': st.column_config.NumberColumn('MB', format="%.1f")},
+        )
+
+# Painel de administração dos caches com tags (processo atual)
+with st.sidebar.expander("🗄️ Caches"):
+    registro_cache.mostrar_painel(registro_caches)
+
+# Bytes de PL antes/depois de finance.pl_diario para o período e fundos selecionados
+# (dry run: sem custo e sem executar a calculadora)
+with st.sidebar.expander("📉 Bytes de PL"):
+    if st.button("Medir (dry run)", key="medir_bytes_pl"):
+        try:
+            st.session_state['bytes_pl'] = pl_diario.comparar_bytes_processados(
+                get_bigquery_client(), load_sql_query(), data_inicio, data_fim, fund_ids_filtro
+            )
+        except Exception as e:
+            st.warning(f"⚠️ Dry run falhou: {str(e)[:100]}")
+    bytes_pl = st.session_state.get('bytes_pl')
+    if bytes_pl:
+        reducao = f" (−{bytes_pl['reducao']:.0%})" if bytes_pl['reducao'] is not None else ""
+        st.caption(
+            f"PL antes: {bytes_pl['pl_antes'] / 1024 / 1024:,.1f} MB | "
+            f"depois: {bytes_pl['pl_depois'] / 1024 / 1024:,.1f} MB{reducao} | "
+            f"calculadora: {bytes_pl['calculadora'] / 1024 / 1024:,.1f} MB"
+        )
+
 # Mostrar resultados se existirem
-if 'df' in st.session_state:
-    df_original = st.session_state.get('df_original', st.session_state['df'])
+if 'chave_base' in st.session_state:
+    # Versão publicada no cache em disco: se outro processo publicou uma mais nova,
+    # o resultado em memória deixa de valer e é remapeado
+    versao_disco = cache_resultados.obter_cache().versao_atual(st.session_state['chave_base'])
+    df_original = resultados.obter(st.session_state['chave_base'], id_sessao, versao=versao_disco)
+    if df_original is None:
+        # Resultado removido da memória (orçamento) ou versão nova: volta do disco ou reexecuta
+        em_cache = cache_resultados.obter_cache().ler(st.session_state['chave_base'])
+        if em_cache is None:
+            st.session_state['execute_query'] = True
+            st.rerun()
+        df_original = resultados.publicar(
+            st.session_state['chave_base'], em_cache[0], id_sessao, versao=em_cache[1]['versao']
+        )
+        versao_disco = em_cache[1]['versao']
+    
+    # Stale-while-revalidate: o resultado em exibição continua (com a idade) enquanto uma
+    # thread recalcula; a versão nova é publicada no cache em disco e remapeada no rerun.
+    # Recalcula quando o token de frescor muda (carga nas fontes, chave nova) ou, se algum
+    # metadado estiver indisponível, quando o resultado passa do TTL
+    parametros_base = st.session_state.get('parametros_base')
+    if parametros_base is not None:
+        chave_base = st.session_state['chave_base']
+        atualizador = obter_atualizador()
+        frescor = obter_frescor()
+        chave_alvo, versao_alvo = chave_base, versao_disco
+        if frescor['token'] != st.session_state.get('token_frescor'):
+            chave_alvo = chave_calculadora(load_sql_query(), token_frescor=frescor['token'], **parametros_base)
+            versao_alvo = cache_resultados.obter_cache().versao_atual(chave_alvo)
+            if versao_alvo is not None:
+                # Outra sessão ou processo já calculou o resultado com as fontes novas
+                st.session_state['chave_base'] = chave_alvo
+                st.session_state['token_frescor'] = frescor['token']
+                st.rerun()
+        
+        if chave_alvo != chave_base or (not frescor['completo'] and atualizador.vencido(chave_base)):
+            client_atualizacao = get_bigquery_client()
+            sql_atualizacao = load_sql_query()
+            cliente_leitura = get_bigquery_read_client()
+            atualizador.agendar(chave_alvo, lambda: recalcular_resultado(
+                client_atualizacao, sql_atualizacao, cliente_leitura=cliente_leitura, **parametros_base
+            ))
+        
+        idade = atualizador.idade(chave_base)
+        if chave_alvo != chave_base:
+            st.sidebar.caption("💾 Fontes atualizadas desde o cálculo deste resultado")
+        elif idade is not None and idade > atualizador.ttl:
+            st.sidebar.caption(f"💾 Resultado calculado há {int(idade // 60)} min")
+        if chave_alvo in atualizador.erros:
+            st.sidebar.warning(f"⚠️ Falha na atualização em segundo plano: {atualizador.erros[chave_alvo][:100]}")
+        
+        if atualizador.em_andamento(chave_alvo):
+            @st.fragment(run_every=10)
+            def aguardar_versao_nova():
+                """Recarrega a página quando a versão recalculada for publicada"""
+                if cache_resultados.obter_cache().versao_atual(chave_alvo) != versao_alvo:
+                    st.rerun()
+                st.caption("🔄 Atualizando o resultado em segundo plano...")
+            aguardar_versao_nova()
     bytes_mb = st.session_state.get('bytes_mb', 0)
     
-    # Aplicar filtros em tempo real
-    df_filtrado = df_original.copy()
+    # Aplicar filtros em tempo real (visão copy-on-write do resultado compartilhado)
+    df_filtrado = df_original.copy(deep=False)
     
     # Filtro de Fundos (múltiplos)
     if fundos_selecionados and 'fund_name' in df_filtrado.columns:
@@ -471,39 +893,43 @@ if 'df' in st.session_state:
         if not pd.api.types.is_datetime64_any_dtype(df_filtrado['date_ref']):
             df_filtrado['date_ref'] = pd.to_datetime(df_filtrado['date_ref'])
         
+        # Comparação direta em datetime64 (sem converter cada linha para date)
         df_filtrado = df_filtrado[
-            (df_filtrado['date_ref'].dt.date >= data_inicio) & 
-            (df_filtrado['date_ref'].dt.date <= data_fim)
+            (df_filtrado['date_ref'] >= pd.Timestamp(data_inicio)) & 
+            (df_filtrado['date_ref'] < pd.Timestamp(data_fim) + pd.Timedelta(days=1))
         ]
     
     # SISTEMA DE INVALIDAÇÃO DE CACHE INTELIGENTE
-    @st.cache_data(ttl=60)  # Cache de 1 minuto para timestamp (precisa ser rápido para detectar aprovações)
+    @registro_caches.cache_data(registro_cache.TAG_METADADOS, 'finance.descontos', 'finance.alteracoes_pendentes', ttl=60)  # Cache de 1 minuto para timestamp (precisa ser rápido para detectar aprovações)
     def obter_timestamp_ultima_modificacao():
-        """Obtém timestamp da última modificação em alterações pendentes e ajustes"""
+        """Obtém timestamp da última modificação em alterações pendentes e ajustes
+        
+        Lê o metadado da tabela de versão (incrementada por toda escrita do dashboard de
+        gestão) em vez de agregar MAX() sobre descontos e alteracoes_pendentes.
+        """
         try:
             client = get_bigquery_client()
-            query = """
-            SELECT MAX(timestamp_mod) as ultima_modificacao
-            FROM (
-                SELECT MAX(data_aplicacao) as timestamp_mod 
-                FROM `kanastra-live.finance.descontos`
-                UNION ALL
-                SELECT MAX(data_solicitacao) as timestamp_mod 
-                FROM `kanastra-live.finance.alteracoes_pendentes`
-                UNION ALL
-                SELECT MAX(data_aprovacao) as timestamp_mod
-                FROM `kanastra-live.finance.historico_alteracoes`
+            return chamadas_unicas.executar(
+                'versao_alteracoes', lambda _: versao_alteracoes.obter_ultima_modificacao(client)
             )
-            """
-            result = client.query(query).to_dataframe()
-            if not result.empty and pd.notnull(result.iloc[0]['ultima_modificacao']):
-                return result.iloc[0]['ultima_modificacao']
-            return datetime.now()
         except Exception as e:
             return datetime.now()
     
     # VERIFICAR ALTERAÇÕES PENDENTES DE APROVAÇÃO
     # SEM CACHE - sempre consulta valores atuais (query rápida, crítica para bloqueio de exportação)
+    QUERY_PENDENTES = """
+            SELECT 
+                COUNT(*) as total_pendente,
+                COUNT(DISTINCT solicitacao_id) as solicitacoes_pendentes
+            FROM `kanastra-live.finance.alteracoes_pendentes`
+            WHERE status = 'PENDENTE'
+            """
+    
+    def contar_pendentes(result):
+        if not result.empty:
+            return int(result.iloc[0]['total_pendente']), int(result.iloc[0]['solicitacoes_pendentes'])
+        return 0, 0
+    
     def verificar_alteracoes_pendentes():
         """Verifica se existem alterações pendentes de aprovação
         
@@ -511,64 +937,59 @@ if 'df' in st.session_state:
         """
         try:
             client = get_bigquery_client()
-            query = """
-            SELECT 
-                COUNT(*) as total_pendente,
-                COUNT(DISTINCT solicitacao_id) as solicitacoes_pendentes
-            FROM `kanastra-live.finance.alteracoes_pendentes`
-            WHERE status = 'PENDENTE'
-            """
-            result = client.query(query).to_dataframe()
-            
-            if not result.empty:
-                total = int(result.iloc[0]['total_pendente'])
-                solicitacoes = int(result.iloc[0]['solicitacoes_pendentes'])
-                return total, solicitacoes
-            
-            return 0, 0
+            # Coalesce apenas chamadas simultâneas: cada chamada nova consulta o valor atual
+            result = chamadas_unicas.executar(QUERY_PENDENTES, lambda _: client.query(QUERY_PENDENTES).to_dataframe())
+            return contar_pendentes(result)
         except Exception as e:
             return 0, 0
     
+    def reverificar_alteracoes_pendentes():
+        """Re-verificação antes da exportação: job próprio (fora da chamada_unica, para não
+        reaproveitar o resultado da primeira verificação); erros propagam e bloqueiam
+        """
+        client = get_bigquery_client()
+        job = client.query(QUERY_PENDENTES)
+        return contar_pendentes(job.result(timeout=TIMEOUTS_CONSULTAS['pendentes']).to_dataframe())
+    
     # APLICAR WAIVERS E DESCONTOS APROVADOS do BigQuery
-    @st.cache_data(ttl=3600)  # Cache de 1 hora (invalidado por timestamp)
+    @registro_caches.cache_data('finance.descontos', ttl=3600)  # Cache de 1 hora (invalidado por timestamp)
     def carregar_ajustes_ativos(data_inicio_dt, data_fim_dt, cache_key):
         """Carrega waivers e descontos aprovados que se aplicam ao período
         
+        Roda numa thread do executor de consultas: erros propagam (e não entram no cache)
+        e o aviso é exibido pela thread do script ao coletar o lote.
+        
         Args:
             cache_key: Timestamp usado para invalidar cache quando há modificações
+        
+        Returns:
+            (DataFrame, momento da carga no BigQuery); o momento vem junto do cache, então
+            reflete a carga real mesmo quando o resultado é reaproveitado
         """
-        try:
-            client = get_bigquery_client()
-            query = f"""
-            SELECT 
-                fund_id,
-                fund_name,
-                categoria,
-                tipo_desconto,
-                valor_desconto,
-                percentual_desconto,
-                forma_aplicacao,
-                servico,
-                data_inicio,
-                data_fim,
-                observacao,
-                data_aplicacao
-            FROM `kanastra-live.finance.descontos`
-            WHERE data_inicio <= DATE('{data_fim_dt}')
-              AND (data_fim IS NULL OR data_fim >= DATE('{data_inicio_dt}'))
-            ORDER BY categoria, data_inicio
-            """
-            df = client.query(query).to_dataframe()
-            # Armazenar timestamp da carga
-            st.session_state.ultima_carga_ajustes = datetime.now()
-            return df
-        except Exception as e:
-            st.warning(f"⚠️ Não foi possível carregar ajustes (waivers/descontos): {e}")
-            return pd.DataFrame()
+        client = get_bigquery_client()
+        query = f"""
+        SELECT 
+            fund_id,
+            fund_name,
+            categoria,
+            tipo_desconto,
+            valor_desconto,
+            percentual_desconto,
+            forma_aplicacao,
+            servico,
+            data_inicio,
+            data_fim,
+            observacao,
+            data_aplicacao
+        FROM `kanastra-live.finance.descontos`
+        WHERE data_inicio <= DATE('{data_fim_dt}')
+          AND (data_fim IS NULL OR data_fim >= DATE('{data_inicio_dt}'))
+        ORDER BY categoria, data_inicio
+        """
+        df = chamadas_unicas.executar(query, lambda _: client.query(query).to_dataframe())
+        return df, datetime.now()
     
     # Obter timestamp de última modificação (atualiza a cada 1 min, mas força recarga se houver mudanças)
-    timestamp_modificacao = obter_timestamp_ultima_modificacao()
-    
     # Verificar se deve forçar recarga de ajustes (mantém funcionalidade de botão manual)
     force_reload_ajustes = st.session_state.get('force_reload_ajustes', False)
     if force_reload_ajustes:
@@ -576,11 +997,32 @@ if 'df' in st.session_state:
         obter_timestamp_ultima_modificacao.clear()
         st.session_state.force_reload_ajustes = False
     
-    # Carregar dados usando timestamp como cache key (invalida automaticamente quando há alterações)
-    ajustes_ativos = carregar_ajustes_ativos(data_inicio, data_fim, timestamp_modificacao)
-    
-    # Verificar alterações pendentes - SEM CACHE para garantir precisão no bloqueio
-    total_pendente, solicitacoes_pendentes = verificar_alteracoes_pendentes()
+    # Timestamp, ajustes e pendências consultados ao mesmo tempo. Os ajustes usam o timestamp
+    # como cache key (invalida automaticamente quando há alterações); a chamada repetida do
+    # timestamp cai no cache ou no job em andamento (chamada_unica)
+    consultas = executor_consultas.executar(
+        {
+            'timestamp': obter_timestamp_ultima_modificacao,
+            'ajustes': lambda: carregar_ajustes_ativos(data_inicio, data_fim, obter_timestamp_ultima_modificacao()),
+            # SEM CACHE para garantir precisão no bloqueio
+            'pendentes': verificar_alteracoes_pendentes,
+        },
+        timeouts=TIMEOUTS_CONSULTAS,
+        padroes={'timestamp': datetime.now(), 'ajustes': (pd.DataFrame(), None), 'pendentes': (0, 0)},
+    )
+    for nome, consulta in consultas.items():
+        if nome == 'ajustes' and consulta['erro']:
+            st.warning(f"⚠️ Não foi possível carregar ajustes (waivers/descontos): {consulta['erro']}")
+        elif consulta['erro']:
+            st.sidebar.warning(f"⚠️ Consulta '{nome}' indisponível ({consulta['erro'][:80]}); exibindo sem ela")
+    timestamp_modificacao = consultas['timestamp']['valor']
+    ajustes_ativos, carga_ajustes = consultas['ajustes']['valor']
+    # Timestamp da carga gravado pela thread do script (não pela thread da consulta)
+    if carga_ajustes is not None:
+        st.session_state.ultima_carga_ajustes = carga_ajustes
+    total_pendente, solicitacoes_pendentes = consultas['pendentes']['valor']
+    # Sem resposta da verificação de pendências, a exportação fica bloqueada
+    pendencias_desconhecidas = consultas['pendentes']['erro'] is not None
     
     # AVISOS DE ALTERAÇÕES PENDENTES E AJUSTES ATIVOS
     st.divider()
@@ -685,105 +1127,32 @@ if 'df' in st.session_state:
                 break
         
         if col_acumulado:
+            # Aplicação vetorizada (junção por intervalo), mesma semântica do loop por ajuste
+            col_servico = 'Service' if 'Service' in df_filtrado.columns else ('servico' if 'servico' in df_filtrado.columns else None)
+            df_filtrado, resumo_ajustes = motor_ajustes.aplicar_ajustes(df_filtrado, ajustes_ativos, col_acumulado, col_servico)
+            
             ajustes_aplicados = []
-            for _, ajuste in ajustes_ativos.iterrows():
-                # Compatibilidade: waivers usam fund_name, descontos usam fund_id
-                if 'fund_name' in ajuste and pd.notnull(ajuste.get('fund_name')):
-                    fund_identifier = ajuste['fund_name']
-                    mask_campo = 'fund_name'
-                else:
-                    fund_identifier = ajuste.get('fund_id')
-                    mask_campo = 'fund_id'
+            for ajuste in resumo_ajustes.itertuples(index=False):
+                # DEBUG: Mostrar info dos waivers de 100%
+                if ajuste.datas is not None:
+                    datas_str = [pd.Timestamp(d).strftime('%d/%m/%Y') for d in ajuste.datas]
+                    original = ajustes_ativos.iloc[ajuste.indice_ajuste]
+                    st.sidebar.warning(f"""
+                    🔍 **Debug Waiver 100%**
+                    - Fundo: {ajuste.fundo}
+                    - Serviço: {ajuste.servico}
+                    - Percentual: {ajuste.percentual}%
+                    - Período waiver: {original['data_inicio']} a {original['data_fim']}
+                    - Registros afetados: {ajuste.registros}
+                    - Forma: {original.get('forma_aplicacao', 'Provisionado')}
+                    - Datas: {', '.join(datas_str[:5])}{'...' if len(datas_str) > 5 else ''}
+                    - Valores antes: {[f'R$ {v:,.2f}' for v in ajuste.valores_antes[:3]]}
+                    """)
                 
-                valor = ajuste.get('valor', 0)
-                tipo_desconto = ajuste.get('tipo_desconto', 'Fixo')
-                percentual = ajuste.get('percentual_desconto', 0)
-                forma_aplicacao = ajuste.get('forma_aplicacao', 'Provisionado')
-                categoria = ajuste.get('categoria', 'waiver')
-                servico = ajuste.get('servico')
-                
-                if valor > 0 or percentual > 0:
-                    # Filtrar registros do fundo
-                    mask_fundo = (df_filtrado[mask_campo] == fund_identifier)
-                    
-                    # Filtrar por período se disponível
-                    if 'date_ref' in df_filtrado.columns:
-                        mask_fundo = mask_fundo & (
-                            (df_filtrado['date_ref'].dt.date >= ajuste['data_inicio']) &
-                            (df_filtrado['date_ref'].dt.date <= ajuste['data_fim'])
-                        )
-                    
-                    # Filtrar por serviço se especificado
-                    if servico and ('Service' in df_filtrado.columns or 'servico' in df_filtrado.columns):
-                        col_servico = 'Service' if 'Service' in df_filtrado.columns else 'servico'
-                        mask_fundo = mask_fundo & (df_filtrado[col_servico] == servico)
-                    
-                    # DEBUG: Mostrar info do ajuste sendo aplicado
-                    if mask_fundo.sum() > 0 and tipo_desconto == 'Percentual' and percentual == 100:
-                        registros_afetados = df_filtrado[mask_fundo]
-                        datas_str = registros_afetados['date_ref'].dt.strftime('%d/%m/%Y').tolist()
-                        valores_antes = registros_afetados[col_acumulado].tolist()
-                        
-                        st.sidebar.warning(f"""
-                        🔍 **Debug Waiver 100%**
-                        - Fundo: {fund_identifier}
-                        - Serviço: {servico}
-                        - Percentual: {percentual}%
-                        - Período waiver: {ajuste['data_inicio']} a {ajuste['data_fim']}
-                        - Registros afetados: {mask_fundo.sum()}
-                        - Forma: {forma_aplicacao}
-                        - Datas: {', '.join(datas_str[:5])}{'...' if len(datas_str) > 5 else ''}
-                        - Valores antes: {[f'R$ {v:,.2f}' for v in valores_antes[:3]]}
-                        """)
-                    
-                    if mask_fundo.sum() > 0:
-                        # Calcular valor do ajuste baseado no tipo
-                        if tipo_desconto == 'Percentual':
-                            # Para percentual, calcular desconto sobre cada taxa
-                            valores_ajuste = df_filtrado.loc[mask_fundo, col_acumulado] * (percentual / 100)
-                            valor_total_aplicado = valores_ajuste.sum()
-                        else:
-                            # Para Fixo, usar valor direto
-                            valor_total_aplicado = valor
-                        
-                        # Aplicar baseado na forma
-                        if forma_aplicacao == "Provisionado":
-                            # Provisionado: distribuir proporcionalmente
-                            qtd_registros = mask_fundo.sum()
-                            
-                            if tipo_desconto == 'Percentual':
-                                # Percentual: aplicar desconto em cada registro individualmente
-                                df_filtrado.loc[mask_fundo, col_acumulado] = (
-                                    df_filtrado.loc[mask_fundo, col_acumulado] * (1 - percentual/100)
-                                )
-                            else:
-                                # Fixo: distribuir valor igualmente
-                                valor_por_registro = valor / qtd_registros if qtd_registros > 0 else 0
-                                df_filtrado.loc[mask_fundo, col_acumulado] = (
-                                    df_filtrado.loc[mask_fundo, col_acumulado] - valor_por_registro
-                                )
-                            
-                            ajustes_aplicados.append(
-                                f"{fund_identifier} ({categoria}): R$ {valor_total_aplicado:,.2f} {tipo_desconto} Provisionado"
-                            )
-                        else:
-                            # Não Provisionado: aplicar no último registro
-                            idx_ultimo = df_filtrado[mask_fundo].index.max()
-                            if pd.notnull(idx_ultimo):
-                                if tipo_desconto == 'Percentual':
-                                    # Percentual: aplicar desconto no último registro
-                                    df_filtrado.at[idx_ultimo, col_acumulado] = (
-                                        df_filtrado.at[idx_ultimo, col_acumulado] * (1 - percentual/100)
-                                    )
-                                else:
-                                    # Fixo: subtrair valor total do último registro
-                                    df_filtrado.at[idx_ultimo, col_acumulado] = (
-                                        df_filtrado.at[idx_ultimo, col_acumulado] - valor
-                                    )
-                                
-                                ajustes_aplicados.append(
-                                    f"{fund_identifier} ({categoria}): R$ {valor_total_aplicado:,.2f} {tipo_desconto} Não Provisionado"
-                                )
+                forma = 'Provisionado' if ajuste.provisionado else 'Não Provisionado'
+                ajustes_aplicados.append(
+                    f"{ajuste.fundo} ({ajuste.categoria}): R$ {ajuste.valor_total_aplicado:,.2f} {ajuste.tipo_desconto} {forma}"
+                )
             
             if ajustes_aplicados:
                 st.success(f"✅ **Ajustes Aplicados ({len(ajustes_aplicados)}):** {' | '.join(ajustes_aplicados)}")
@@ -861,7 +1230,7 @@ if 'df' in st.session_state:
     colunas_existentes = [col for col in colunas_desejadas.keys() if col in df.columns]
     
     # Selecionar apenas as colunas existentes
-    df_exibir = df[colunas_existentes].copy()
+    df_exibir = df[colunas_existentes]
     
     # Aplicar módulo (valor absoluto) na coluna diferenca se existir
     if 'diferenca' in df_exibir.columns:
@@ -873,8 +1242,13 @@ if 'df' in st.session_state:
     # Botões de ação e exportação
     col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
     
-    # VERIFICAÇÃO DUPLA: Re-verificar pendentes imediatamente antes de exportar
-    total_pendente_atual, solicitacoes_pendentes_atual = verificar_alteracoes_pendentes()
+    # VERIFICAÇÃO DUPLA: Re-verificar pendentes imediatamente antes de exportar, com um job
+    # novo (a primeira verificação passa pela chamada_unica e pode ter sido compartilhada)
+    try:
+        total_pendente_atual, solicitacoes_pendentes_atual = reverificar_alteracoes_pendentes()
+    except Exception:
+        total_pendente_atual, solicitacoes_pendentes_atual = total_pendente, solicitacoes_pendentes
+        pendencias_desconhecidas = True
     
     with col1:
         # Verificar se há ajustes aplicados
@@ -884,8 +1258,9 @@ if 'df' in st.session_state:
             st.info(f"📊 Exibindo **{len(df):,}** registros")
     
     with col2:
-        if st.button("🔄 Cache Geral", width='stretch'):
-            st.cache_data.clear()
+        if st.button("🔄 Cache Geral", width='stretch', help="Revalida o frescor das fontes e recarrega waivers e descontos"):
+            # Só metadados e ajustes: caches de fontes inalteradas (e de outros usuários) continuam
+            registro_caches.invalidar(registro_cache.TAG_METADADOS, 'finance.descontos')
             st.success("✅ Cache limpo!")
             st.rerun()
     
@@ -894,10 +1269,10 @@ if 'df' in st.session_state:
             # Limpar todos os caches
             carregar_ajustes_ativos.clear()
             obter_timestamp_ultima_modificacao.clear()
-            executar_query_bigquery.clear()
             
-            # Marcar para executar query novamente
+            # Marcar para executar query novamente (sem reaproveitar o cache em disco)
             st.session_state['execute_query'] = True
+            st.session_state['ignorar_cache_disco'] = True
             st.session_state.force_reload_ajustes = True
             
             st.success("🔄 Recarregando dados...")
@@ -913,6 +1288,14 @@ if 'df' in st.session_state:
                 disabled=True,
                 help=f"⚠️ Exportação bloqueada: {solicitacoes_pendentes_atual} solicitação(ões) pendente(s) de aprovação"
             )
+        elif pendencias_desconhecidas:
+            st.button(
+                label="📥 Exportar CSV",
+                width='stretch',
+                type="primary",
+                disabled=True,
+                help="⚠️ Exportação bloqueada: não foi possível verificar alterações pendentes (tente novamente)"
+            )
         else:
             # Gerar CSV apenas se não houver pendências (camada extra de segurança)
             download_filtrado = df_exibir.to_csv(index=False).encode('utf-8')
@@ -964,7 +1347,7 @@ if 'df' in st.session_state:
     if 'diferenca' in df.columns and 'fund_name' in df.columns and 'Service' in df.columns:
         
         # Filtrar dados onde provisão Sinqia não está vazia/nula
-        df_graficos = df.copy()
+        df_graficos = df
         if 'provisao_carteira' in df_graficos.columns:
             df_graficos = df_graficos[df_graficos['provisao_carteira'].notna() & (df_graficos['provisao_carteira'] != 0)]
         
@@ -974,7 +1357,7 @@ if 'df' in st.session_state:
             st.markdown("### Diferença máxima por fundo")
             
             # Agrupar por fundo e pegar a diferença máxima (em módulo)
-            df_fundo = df_graficos.groupby('fund_name')['diferenca'].apply(lambda x: x.abs().max()).reset_index()
+            df_fundo = df_graficos.groupby('fund_name', observed=True)['diferenca'].apply(lambda x: x.abs().max()).reset_index()
             df_fundo.columns = ['Nome do fundo', 'Valor Diferença (R$)']
             df_fundo = df_fundo.sort_values('Valor Diferença (R$)', ascending=False).head(5)
             
@@ -1013,7 +1396,7 @@ if 'df' in st.session_state:
             st.markdown("### Diferença máxima por tipo de serviço")
             
             # Agrupar por serviço e somar diferenças (em módulo)
-            df_servico = df_graficos.groupby('Service')['diferenca'].apply(lambda x: x.abs().sum()).reset_index()
+            df_servico = df_graficos.groupby('Service', observed=True)['diferenca'].apply(lambda x: x.abs().sum()).reset_index()
             df_servico.columns = ['Serviço', 'Valor Diferença (R$)']
             df_servico = df_servico.sort_values('Valor Diferença (R$)', ascending=False)
             
@@ -0,0 +1,88 @@
+"""
+Download Arrow - Calculadora 5.0
+Baixa o resultado de um job do BigQuery em lotes Arrow: pela Storage Read API (vários
+streams em paralelo) quando `google-cloud-bigquery-storage` está instalado e acessível,
+senão pela API REST paginada. Mede o tempo da query separado do tempo de transferência
+"""
+import time
+import pandas as pd
+import pyarrow as pa
+
+try:
+    from google.cloud import bigquery_storage
+except ImportError:  # Extra [bqstorage] não instalado: download pela API REST
+    bigquery_storage = None
+
+
+def criar_cliente_leitura(client):
+    """Cliente da Storage Read API com as credenciais do cliente BigQuery (None se indisponível)"""
+    if bigquery_storage is None:
+        return None
+    try:
+        return bigquery_storage.BigQueryReadClient(credentials=getattr(client, '_credentials', None))
+    except Exception:
+        return None
+
+
+def _baixar_lotes(linhas, cliente_leitura, progresso):
+    total = linhas.total_rows or 0
+    lotes, baixadas = [], 0
+    for lote in linhas.to_arrow_iterable(bqstorage_client=cliente_leitura):
+        lotes.append(lote)
+        baixadas += lote.num_rows
+        if progresso:
+            progresso(baixadas, total)
+    return lotes
+
+
+def baixar_arrow(query_job, cliente_leitura=None, progresso=None):
+    """Espera o job e baixa o resultado como tabela Arrow
+
+    `query_job` só precisa de `result()` devolvendo um iterador com `schema`, `total_rows`
+    e `to_arrow_iterable(bqstorage_client=...)`, então um cliente falso local que sirva
+    RecordBatches exercita o mesmo caminho.
+
+    Args:
+        cliente_leitura: Cliente da Storage Read API (None = API REST)
+        progresso: Função chamada com (linhas baixadas, total de linhas) a cada lote
+
+    Returns:
+        (pyarrow.Table ou None se vazio, schema do BigQuery, dict de tempos e via usada)
+    """
+    inicio = time.perf_counter()
+    linhas = query_job.result()
+    tempo_query = time.perf_counter() - inicio
+
+    via = 'storage' if cliente_leitura is not None else 'rest'
+    inicio = time.perf_counter()
+    try:
+        lotes = _baixar_lotes(linhas, cliente_leitura, progresso)
+    except Exception:
+        if cliente_leitura is None:
+            raise
+        # Storage Read API recusada (permissão, API desativada): refaz pela API REST
+        via = 'rest'
+        linhas = query_job.result()
+        lotes = _baixar_lotes(linhas, None, progresso)
+    tempo_transferencia = time.perf_counter() - inicio
+
+    tabela = pa.Table.from_batches(lotes) if lotes else None
+    tempos = {
+        'query_s': tempo_query,
+        'transferencia_s': tempo_transferencia,
+        'linhas': tabela.num_rows if tabela is not None else 0,
+        'via': via,
+    }
+    return tabela, linhas.schema, tempos
+
+
+def baixar_dataframe(query_job, cliente_leitura=None, progresso=None):
+    """Como `baixar_arrow`, convertendo para DataFrame (DATE vira datetime64 direto do Arrow)
+
+    Returns:
+        (DataFrame, schema do BigQuery, dict de tempos)
+    """
+    tabela, schema, tempos = baixar_arrow(query_job, cliente_leitura, progresso)
+    if tabela is None:
+        return pd.DataFrame(columns=[campo.name for campo in schema]), schema, tempos
+    return tabela.to_pandas(date_as_object=False), schema, tempos
@@ -0,0 +1,201 @@
+"""
+Faixas Compiladas - Calculadora 5.0
+Compila as faixas de `fee_variavel` / `fee_minimo` de cada (fundo, empresa, serviço)
+em funções por partes (pontos de quebra ordenados), avaliadas com uma busca
+ordenada por PL em vez de cruzar cada dia com todas as faixas
+"""
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+CHAVES = ['fund_id', 'empresa', 'tipo_servico']
+
+# Quantidade de compilações mantidas em memória (uma por conteúdo de tabela de faixas)
+TAMANHO_CACHE = 8
+
+_cache = OrderedDict()
+
+
+class FaixasCompiladas:
+    """Funções por partes de um conjunto de faixas, concatenadas por grupo
+
+    Cada grupo (fund_id, empresa, tipo_servico) ocupa o trecho [inicio[g], fim[g])
+    dos arrays de pontos de quebra `x`, ordenados dentro do grupo.
+
+    - tipo 'linear': taxa = valor[j] + inclinacao[j] * (pl - x[j]), j = último x <= pl
+      (0 abaixo do primeiro ponto)
+    - tipo 'degrau': taxa = valor_ponto[j] se pl == x[j], senão valor_trecho do
+      intervalo aberto que contém pl (NaN se nenhuma faixa contém o PL)
+    """
+
+    def __init__(self, tipo, chaves, grupo_x, x, valor, inclinacao=None, valor_trecho=None):
+        self.tipo = tipo
+        self.chaves = chaves.reset_index(drop=True)
+        self.grupo_x = grupo_x
+        self.x = x
+        self.valor = valor
+        self.inclinacao = inclinacao
+        self.valor_trecho = valor_trecho
+        self.inicio = np.searchsorted(grupo_x, np.arange(len(self.chaves)), side='left')
+        self.fim = np.searchsorted(grupo_x, np.arange(len(self.chaves)), side='right')
+
+    def _posicoes(self, grupos, pl, lado):
+        """Índice global do último ponto de quebra antes de `pl` na ordem (grupo, x)
+
+        Uma única ordenação conjunta de pontos de quebra e consultas: lado 'right'
+        conta pontos <= pl, lado 'left' conta pontos < pl. Valores abaixo de
+        inicio[grupo] significam que nenhum ponto do próprio grupo fica antes de `pl`.
+        """
+        n = len(self.x)
+        desempate_ponto = 0 if lado == 'right' else 1
+        desempate = np.concatenate([
+            np.full(n, desempate_ponto, dtype=np.int8),
+            np.full(len(pl), 1 - desempate_ponto, dtype=np.int8),
+        ])
+        valores = np.concatenate([self.x, pl])
+        ordem = np.lexsort((desempate, valores, np.concatenate([self.grupo_x, grupos])))
+
+        eh_ponto = ordem < n
+        pontos_ate_aqui = np.cumsum(eh_ponto)
+        posicoes = np.empty(len(pl), dtype=np.int64)
+        posicoes[ordem[~eh_ponto] - n] = pontos_ate_aqui[~eh_ponto] - 1
+        return posicoes
+
+    def avaliar(self, pl_util):
+        """Taxa diária de cada (fund_id, dia) para cada grupo de faixas do fundo
+
+        Returns:
+            DataFrame (fund_id, dia, pl_total_diario, empresa, tipo_servico, taxa)
+        """
+        chaves = self.chaves.assign(grupo=np.arange(len(self.chaves)))
+        base = pl_util[['fund_id', 'dia', 'pl_total_diario']].merge(chaves, on='fund_id', how='inner')
+        grupos = base['grupo'].to_numpy()
+        pl = base['pl_total_diario'].to_numpy(dtype=float)
+
+        inicio = self.inicio[grupos]
+        if self.tipo == 'linear':
+            j = self._posicoes(grupos, pl, 'right')  # último ponto <= pl
+            jv = np.clip(j, 0, max(len(self.x) - 1, 0))
+            taxa = np.where(j >= inicio, self.valor[jv] + self.inclinacao[jv] * (pl - self.x[jv]), 0.0)
+        else:
+            j = self._posicoes(grupos, pl, 'left')  # último ponto < pl
+            proximo = np.clip(j + 1, 0, max(len(self.x) - 1, 0))
+            no_ponto = (j + 1 < self.fim[grupos]) & (self.x[proximo] == pl)
+            jv = np.clip(j, 0, max(len(self.x) - 1, 0))
+            taxa = np.where(
+                no_ponto,
+                self.valor[proximo],
+                np.where(j >= inicio, self.valor_trecho[jv], np.nan),
+            )
+
+        return base.drop(columns='grupo').assign(taxa=taxa)
+
+
+def _grupos(faixas):
+    """Ordena as faixas por grupo e devolve (faixas, chaves, código do grupo por linha)
+
+    Faixas sem limite inferior não contribuem na query (comparações com NULL).
+    """
+    faixas = faixas[faixas['limite_inferior'].notna()]
+    faixas = faixas.sort_values(CHAVES + ['limite_inferior'], kind='mergesort', na_position='last')
+    codigos = faixas.groupby(CHAVES, dropna=False, sort=False).ngroup().to_numpy()
+    chaves = faixas[CHAVES].drop_duplicates().reset_index(drop=True)
+    return faixas, chaves, codigos
+
+
+def compilar_linear(faixas, coluna_taxa, divisor=252):
+    """Faixas progressivas: soma de taxa/divisor * parte do PL dentro de cada faixa
+
+    Cada faixa [inferior, superior) soma +taxa à inclinação no limite inferior e
+    -taxa no superior; os valores nos pontos de quebra são a soma acumulada.
+    """
+    faixas, chaves, codigos = _grupos(faixas)
+    inferior = faixas['limite_inferior'].to_numpy(dtype=float)
+    superior = faixas['limite_superior'].to_numpy(dtype=float)
+    taxa = faixas[coluna_taxa].to_numpy(dtype=float) / divisor
+    taxa = np.nan_to_num(taxa)
+
+    limitada = ~np.isnan(superior)
+    grupo_x = np.concatenate([codigos, codigos[limitada]])
+    x = np.concatenate([inferior, superior[limitada]])
+    delta = np.concatenate([taxa, -taxa[limitada]])
+
+    ordem = np.lexsort((x, grupo_x))
+    grupo_x, x, delta = grupo_x[ordem], x[ordem], delta[ordem]
+
+    # Inclinação após cada ponto e valor acumulado em cada ponto, reiniciando por grupo
+    inclinacao = pd.Series(delta).groupby(grupo_x).cumsum().to_numpy()
+    largura = np.diff(x, append=x[-1:] if len(x) else x)
+    mesmo_grupo = np.append(grupo_x[1:] == grupo_x[:-1], False)
+    incremento = np.where(mesmo_grupo, inclinacao * largura, 0.0)
+    valor = pd.Series(incremento).groupby(grupo_x).cumsum().to_numpy() - incremento
+
+    return FaixasCompiladas('linear', chaves, grupo_x, x, valor, inclinacao=inclinacao)
+
+
+def compilar_degrau(faixas, coluna_taxa):
+    """Faixa vigente: soma das taxas distintas (serviço, taxa) das faixas que contêm o PL
+
+    Replica `pl BETWEEN limite_inferior AND COALESCE(limite_superior, pl)` seguido do
+    GROUP BY por serviço e taxa: limites são fechados, então o valor exatamente em um
+    ponto de quebra pode somar duas faixas.
+    """
+    faixas, chaves, codigos = _grupos(faixas)
+    grupos_x, pontos, valores, trechos = [], [], [], []
+
+    for codigo, grupo in faixas.groupby(codigos, sort=True):
+        inferior = grupo['limite_inferior'].to_numpy(dtype=float)
+        superior = grupo['limite_superior'].to_numpy(dtype=float)
+        superior = np.where(np.isnan(superior), np.inf, superior)
+
+        # Pares (serviço, taxa) repetidos contam uma vez (GROUP BY da query)
+        pares = pd.MultiIndex.from_arrays([grupo['servico'].fillna(''), grupo[coluna_taxa].fillna(-1.0)])
+        par = pd.factorize(pares)[0]
+        um_quente = np.zeros((len(grupo), par.max() + 1))
+        um_quente[np.arange(len(grupo)), par] = 1.0
+        taxa_par = np.zeros(par.max() + 1)
+        taxa_par[par] = np.nan_to_num(grupo[coluna_taxa].to_numpy(dtype=float))
+
+        x = np.unique(np.concatenate([inferior, superior[np.isfinite(superior)]]))
+        meio = np.append((x[:-1] + x[1:]) / 2, x[-1] + 1.0)
+
+        def somar(amostras):
+            contem = (amostras[:, None] >= inferior) & (amostras[:, None] <= superior)
+            contem_par = (contem @ um_quente) > 0
+            return np.where(contem.any(axis=1), contem_par @ taxa_par, np.nan)
+
+        grupos_x.append(np.full(len(x), codigo))
+        pontos.append(x)
+        valores.append(somar(x))
+        trechos.append(somar(meio))
+
+    concat = (lambda partes: np.concatenate(partes) if partes else np.array([]))
+    return FaixasCompiladas(
+        'degrau', chaves, concat(grupos_x).astype(np.int64), concat(pontos),
+        concat(valores), valor_trecho=concat(trechos),
+    )
+
+
+def obter_faixas_compiladas(faixas, tipo, coluna_taxa):
+    """Compilação em cache, reaproveitada enquanto o conteúdo das faixas não mudar
+
+    A chave é o hash do conteúdo (`finance.fee_variavel` / `finance.fee_minimo` já com
+    limites), então alterar as tabelas de taxas invalida a compilação automaticamente.
+    """
+    colunas = CHAVES + ['servico', 'limite_inferior', 'limite_superior', coluna_taxa]
+    assinatura = (tipo, coluna_taxa, int(pd.util.hash_pandas_object(faixas[colunas], index=False).sum()))
+    if assinatura in _cache:
+        _cache.move_to_end(assinatura)
+        return _cache[assinatura]
+
+    compilar = compilar_linear if tipo == 'linear' else compilar_degrau
+    compiladas = compilar(faixas[colunas], coluna_taxa)
+    _cache[assinatura] = compiladas
+    while len(_cache) > TAMANHO_CACHE:
+        _cache.popitem(last=False)
+    return compiladas
+
+
+def limpar_cache():
+    """Descarta as compilações em memória"""
+    _cache.clear()
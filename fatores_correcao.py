@@ -0,0 +1,149 @@
+"""
+Fatores de Correção - Calculadora 5.0
+Mantém `finance.fatores_correcao` (fator por fundo e mês) a partir de
+finance.correcao_aux_v3 e finance.indices_v3, recalculando só os fundos
+cujo aniversário cai em um índice recém-publicado
+"""
+from google.cloud import bigquery
+
+TABELA_FATORES = 'kanastra-live.finance.fatores_correcao'
+
+# Cadeia indices → multiplicadores da query original, reduzida a um fator por (fund_id, mes).
+# {filtro_fundos} restringe os fundos recalculados
+QUERY_CALCULO_FATORES = """
+WITH indices AS (
+SELECT
+    f.fund_id,
+    f.inicio_fundo,
+    f.indice_correcao,
+    i.ref_date,
+    DATE_DIFF(i.ref_date, DATE_TRUNC(f.inicio_fundo, month), MONTH) AS dif_meses,
+    DIV(DATE_DIFF(i.ref_date, DATE_TRUNC(f.inicio_fundo, month), MONTH), 12) * 12 AS mes_corretor,
+    CASE
+        WHEN f.indice_correcao = 'igpm'
+            THEN EXP(SUM(LOG(1 + COALESCE(i.igpm, 0) / 100))
+                     OVER (PARTITION BY f.fund_id, DIV(DATE_DIFF(i.ref_date, DATE_TRUNC( DATE_ADD(f.inicio_fundo, INTERVAL 1 MONTH) , month), MONTH), 12)
+                           ORDER BY i.ref_date))
+        WHEN f.indice_correcao = 'ipca'
+            THEN EXP(SUM(LOG(1 + COALESCE(i.ipca, 0) / 100))
+                     OVER (PARTITION BY f.fund_id, DIV(DATE_DIFF(i.ref_date, DATE_TRUNC( DATE_ADD(f.inicio_fundo, INTERVAL 1 MONTH) , month), MONTH), 12)
+                           ORDER BY i.ref_date))
+        WHEN f.indice_correcao = 'ipc_fipe'
+            THEN EXP(SUM(LOG(1 + COALESCE(i.ipc_fipe, 0) / 100))
+                     OVER (PARTITION BY f.fund_id, DIV(DATE_DIFF(i.ref_date, DATE_TRUNC( DATE_ADD(f.inicio_fundo, INTERVAL 1 MONTH) , month), MONTH), 12)
+                           ORDER BY i.ref_date))
+    END AS fator_correcao_mes
+FROM `kanastra-live.finance.correcao_aux_v3` f
+LEFT JOIN `kanastra-live.finance.indices_v3` i
+    ON i.ref_date >= DATE_TRUNC( DATE_ADD(f.inicio_fundo, INTERVAL 1 MONTH) , month)
+WHERE {filtro_fundos}
+)
+, fatores_marco AS (
+SELECT
+    fund_id,
+    mes_corretor,
+    CASE WHEN fator_correcao_mes < 1 THEN 1 ELSE fator_correcao_mes END AS fator_correcao_marco
+FROM indices
+WHERE dif_meses IN (12,24,36,48,60,72,84)
+)
+, multiplicadores1 AS (
+SELECT
+    i.fund_id,
+    i.inicio_fundo,
+    i.indice_correcao,
+    i.dif_meses,
+    DATE_ADD(i.ref_date, INTERVAL 1 MONTH) AS mes_seguinte,
+    GREATEST(COALESCE(f.fator_correcao_marco, 1), 1) AS fator_correcao1
+FROM indices i
+LEFT JOIN fatores_marco f
+  ON f.fund_id = i.fund_id
+ AND f.mes_corretor = i.mes_corretor
+)
+SELECT
+    fund_id,
+    DATE_TRUNC(mes_seguinte, MONTH) AS mes,
+    EXP(SUM(LN(CASE WHEN MOD(dif_meses,12)=0 THEN fator_correcao1 ELSE 1 END))
+        OVER (PARTITION BY fund_id ORDER BY dif_meses ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+       ) AS fator_correcao,
+    inicio_fundo,
+    indice_correcao
+FROM multiplicadores1
+WHERE mes_seguinte IS NOT NULL
+"""
+
+QUERY_ATUALIZACAO = f"""
+DECLARE ultimo_processado DATE DEFAULT (
+    SELECT DATE_SUB(MAX(mes), INTERVAL 1 MONTH) FROM `{TABELA_FATORES}`
+);
+
+-- Fundos a recalcular: reconstrução, fundo novo, cadastro alterado ou aniversário
+-- (dif_meses múltiplo de 12) em um mês de índice ainda não processado
+CREATE TEMP TABLE fundos_recalculo AS
+SELECT f.fund_id
+FROM `kanastra-live.finance.correcao_aux_v3` f
+LEFT JOIN (
+    SELECT DISTINCT fund_id, inicio_fundo, indice_correcao FROM `{TABELA_FATORES}`
+) t ON t.fund_id = f.fund_id
+WHERE @reconstruir
+   OR ultimo_processado IS NULL
+   OR t.fund_id IS NULL
+   OR t.inicio_fundo IS DISTINCT FROM f.inicio_fundo
+   OR t.indice_correcao IS DISTINCT FROM f.indice_correcao
+   OR EXISTS (
+       SELECT 1
+       FROM `kanastra-live.finance.indices_v3` i
+       WHERE i.ref_date > ultimo_processado
+         AND MOD(DATE_DIFF(i.ref_date, DATE_TRUNC(f.inicio_fundo, month), MONTH), 12) = 0
+   );
+
+BEGIN TRANSACTION;
+
+DELETE FROM `{TABELA_FATORES}`
+WHERE @reconstruir
+   OR fund_id IN (SELECT fund_id FROM fundos_recalculo)
+   OR fund_id NOT IN (SELECT fund_id FROM `kanastra-live.finance.correcao_aux_v3`);
+
+INSERT INTO `{TABELA_FATORES}` (fund_id, mes, fator_correcao, inicio_fundo, indice_correcao, atualizado_em)
+SELECT fund_id, mes, fator_correcao, inicio_fundo, indice_correcao, CURRENT_TIMESTAMP()
+FROM ({QUERY_CALCULO_FATORES.format(filtro_fundos='f.fund_id IN (SELECT fund_id FROM fundos_recalculo)')});
+
+-- Demais fundos: sem aniversário nos meses novos, o fator acumulado se repete
+INSERT INTO `{TABELA_FATORES}` (fund_id, mes, fator_correcao, inicio_fundo, indice_correcao, atualizado_em)
+SELECT
+    t.fund_id,
+    DATE_TRUNC(DATE_ADD(i.ref_date, INTERVAL 1 MONTH), MONTH) AS mes,
+    t.fator_correcao,
+    t.inicio_fundo,
+    t.indice_correcao,
+    CURRENT_TIMESTAMP()
+FROM (
+    SELECT *
+    FROM `{TABELA_FATORES}`
+    WHERE fund_id NOT IN (SELECT fund_id FROM fundos_recalculo)
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY fund_id ORDER BY mes DESC) = 1
+) t
+INNER JOIN `kanastra-live.finance.indices_v3` i ON i.ref_date > ultimo_processado;
+
+COMMIT TRANSACTION;
+
+SELECT COUNT(*) AS fundos_recalculados FROM fundos_recalculo;
+"""
+
+
+def atualizar_fatores(client, reconstruir=False):
+    """Atualiza `finance.fatores_correcao` com os índices recém-publicados
+
+    Args:
+        reconstruir: True para recalcular todos os fundos (ex: índice revisado)
+
+    Returns:
+        Dict com o resumo da atualização (modo, fundos recalculados)
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter('reconstruir', 'BOOL', reconstruir)]
+    )
+    linhas = list(client.query(QUERY_ATUALIZACAO, job_config=job_config).result())
+    return {
+        'modo': 'completo' if reconstruir else 'incremental',
+        'fundos_recalculados': linhas[0]['fundos_recalculados'] if linhas else 0,
+    }
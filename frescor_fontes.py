@@ -0,0 +1,76 @@
+"""
+Frescor das Fontes - Calculadora 5.0
+Lê o horário da última modificação (metadado da tabela, sem job de query) das fontes da
+calculadora e monta um token de frescor: os caches que incluem o token na chave valem
+enquanto as fontes não mudam e são invalidados logo após uma carga
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+# Fontes lidas pela calculadora, direta ou indiretamente. As tabelas intermediárias
+# (pl_diario, fatores_correcao) ficam de fora: são derivadas destas e atualizadas antes
+# de cada execução, então mudariam o token depois de a chave ter sido calculada
+TABELAS_CALCULADORA = (
+    'kanastra-live.investment.quotas',
+    'kanastra-live.investment.wallet',
+    'kanastra-live.investment.calendar',
+    'kanastra-live.finance.fee_variavel',
+    'kanastra-live.finance.fee_minimo',
+    'kanastra-live.finance.gross_up',
+    'kanastra-live.finance.correcao_aux_v3',
+    'kanastra-live.finance.indices_v3',
+    'kanastra-live.hub.funds',
+    'kanastra-live.hub.fund_quotas',
+)
+
+# Fontes de finance.pl_diario e finance.fatores_correcao
+TABELAS_INTERMEDIARIAS = (
+    'kanastra-live.investment.quotas',
+    'kanastra-live.investment.wallet',
+    'kanastra-live.finance.correcao_aux_v3',
+    'kanastra-live.finance.indices_v3',
+)
+
+# Intervalo entre leituras dos metadados (segundos): atraso máximo para perceber uma carga
+INTERVALO_VERIFICACAO = 30
+
+# Leituras de metadados simultâneas
+MAX_TRABALHADORES = 8
+
+
+def _ultima_modificacao(client, tabela):
+    """`modified` da tabela (None se indisponível: view, permissão, tabela inexistente)"""
+    try:
+        return client.get_table(tabela).modified
+    except Exception:
+        return None
+
+
+def ultimas_modificacoes(client, tabelas=TABELAS_CALCULADORA):
+    """{tabela: datetime da última modificação ou None}, lidas em paralelo"""
+    with ThreadPoolExecutor(max_workers=min(MAX_TRABALHADORES, len(tabelas))) as executor:
+        modificacoes = executor.map(lambda tabela: _ultima_modificacao(client, tabela), tabelas)
+        return dict(zip(tabelas, modificacoes))
+
+
+def verificar_frescor(client, tabelas=TABELAS_CALCULADORA):
+    """Token de frescor das tabelas
+
+    Tabelas sem metadado entram com a data do dia (o mesmo frescor diário usado antes),
+    e o resultado indica que o token não é completo.
+
+    Returns:
+        dict com 'token' (hash curto), 'modificacoes' ({tabela: datetime ou None}) e
+        'completo' (True se todas as tabelas tinham metadado)
+    """
+    modificacoes = ultimas_modificacoes(client, tabelas)
+    partes = [
+        f"{tabela}={modificado.isoformat() if modificado else date.today().isoformat()}"
+        for tabela, modificado in sorted(modificacoes.items())
+    ]
+    return {
+        'token': hashlib.sha256('|'.join(partes).encode('utf-8')).hexdigest()[:16],
+        'modificacoes': modificacoes,
+        'completo': all(modificado is not None for modificado in modificacoes.values()),
+    }
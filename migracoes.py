@@ -0,0 +1,123 @@
+"""
+Migrações - Calculadora 5.0
+Aplica uma única vez, em ordem, os arquivos create_table_*.sql / add_*_columns.sql e
+registra a versão em `finance.migracoes_aplicadas`. Os dashboards consultam um mapa de
+colunas por tabela (lido uma vez por processo) em vez de rodar DDL nos carregamentos
+"""
+import os
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+
+DIRETORIO_SQL = os.path.dirname(os.path.abspath(__file__))
+
+TABELA_MIGRACOES = 'kanastra-live.finance.migracoes_aplicadas'
+ARQUIVO_TABELA_MIGRACOES = 'create_table_migracoes_aplicadas.sql'
+
+DATASET = 'kanastra-live.finance'
+
+# (versão, arquivo) em ordem de aplicação; migrações novas entram sempre no final.
+# create_table_historico_alteracoes.sql e criar_tabela_waivers.sql são tabelas antigas,
+# fora de uso
+MIGRACOES = [
+    (1, 'create_table_alteracoes_pendentes.sql'),
+    (2, 'add_tipo_origem_columns.sql'),
+    (3, 'add_aprovador_por_column.sql'),
+    (4, 'create_table_descontos.sql'),
+    (5, 'add_data_vigencia_columns.sql'),
+    (6, 'create_table_pl_diario.sql'),
+    (7, 'create_table_fatores_correcao.sql'),
+    (8, 'create_table_provisao_calculadora.sql'),
+    (9, 'create_table_versao_alteracoes.sql'),
+]
+
+VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+QUERY_VERSOES_APLICADAS = f"SELECT DISTINCT versao FROM `{TABELA_MIGRACOES}`"
+
+QUERY_REGISTRAR = f"""
+MERGE `{TABELA_MIGRACOES}` T
+USING (SELECT @versao AS versao, @arquivo AS arquivo) S
+ON T.versao = S.versao
+WHEN NOT MATCHED THEN
+    INSERT (versao, arquivo, aplicada_em) VALUES (S.versao, S.arquivo, CURRENT_TIMESTAMP())
+"""
+
+QUERY_COLUNAS = f"""
+SELECT table_name, column_name
+FROM `{DATASET}.INFORMATION_SCHEMA.COLUMNS`
+"""
+
+
+def _ler_sql(arquivo):
+    with open(os.path.join(DIRETORIO_SQL, arquivo), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def versoes_aplicadas(client):
+    """Versões já registradas (vazio se a tabela de migrações ainda não existe)"""
+    try:
+        df = client.query(QUERY_VERSOES_APLICADAS).to_dataframe()
+    except NotFound:
+        return set()
+    return set(int(v) for v in df['versao'])
+
+
+def aplicar_migracoes(client):
+    """Aplica as migrações pendentes (cada arquivo como um script) e registra as versões
+
+    Returns:
+        Lista dos arquivos aplicados nesta chamada
+    """
+    aplicadas = versoes_aplicadas(client)
+    pendentes = [(versao, arquivo) for versao, arquivo in MIGRACOES if versao not in aplicadas]
+    if not pendentes:
+        return []
+
+    client.query(_ler_sql(ARQUIVO_TABELA_MIGRACOES)).result()
+    for versao, arquivo in pendentes:
+        client.query(_ler_sql(arquivo)).result()
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter('versao', 'INT64', versao),
+                bigquery.ScalarQueryParameter('arquivo', 'STRING', arquivo),
+            ]
+        )
+        client.query(QUERY_REGISTRAR, job_config=job_config).result()
+    return [arquivo for _, arquivo in pendentes]
+
+
+def mapa_capacidades(client):
+    """{tabela: frozenset de colunas} do dataset finance (uma consulta ao INFORMATION_SCHEMA)"""
+    df = client.query(QUERY_COLUNAS).to_dataframe()
+    return {
+        tabela: frozenset(grupo['column_name'])
+        for tabela, grupo in df.groupby('table_name')
+    }
+
+
+def preparar_esquema(client):
+    """Aplica as migrações pendentes e lê o mapa de colunas; para guardar por processo
+
+    Sem permissão de DDL as migrações falham, mas o mapa de colunas ainda é lido: os
+    carregadores decidem pelo esquema que existe.
+
+    Returns:
+        dict com 'versao' (esperada), 'aplicadas' (arquivos aplicados agora),
+        'colunas' ({tabela: colunas}) e 'erro' (None se tudo foi aplicado)
+    """
+    aplicadas, erro = [], None
+    try:
+        aplicadas = aplicar_migracoes(client)
+    except Exception as e:
+        erro = str(e)
+    return {
+        'versao': VERSAO_ESQUEMA,
+        'aplicadas': aplicadas,
+        'colunas': mapa_capacidades(client),
+        'erro': erro,
+    }
+
+
+def tem_coluna(esquema, tabela, coluna):
+    """True se a coluna existe na tabela segundo o mapa de `preparar_esquema`"""
+    return coluna in esquema['colunas'].get(tabela, ())
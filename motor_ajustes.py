@@ -0,0 +1,220 @@
+"""
+Motor de Ajustes - Waivers e Descontos
+Aplica de uma vez todos os ajustes ativos (finance.descontos) sobre o resultado da
+calculadora: junção por intervalo (fundo/serviço + faixa de datas ordenada) em vez
+de uma máscara booleana por ajuste
+"""
+import numpy as np
+import pandas as pd
+
+# Bits da chave composta (fundo, serviço, dia) usada na busca ordenada
+_BITS_DIA = 20
+_BITS_SERVICO = 10
+
+COLUNAS_RESUMO = ['indice_ajuste', 'fundo', 'categoria', 'tipo_desconto', 'provisionado',
+                  'percentual', 'servico', 'registros', 'valor_total_aplicado', 'datas', 'valores_antes']
+
+
+def _codigos(valores_df, valores_ajuste):
+    """Códigos inteiros comuns para os valores do DataFrame e dos ajustes (-1 = sem par)"""
+    codigos_df, unicos = pd.factorize(valores_df, use_na_sentinel=True)
+    codigos_ajuste = pd.Index(unicos).get_indexer(valores_ajuste)
+    return codigos_df, codigos_ajuste
+
+
+def _dias(serie):
+    """Datas como inteiro de dias desde 1970 (NaT/None -> -1)"""
+    datas = pd.to_datetime(pd.Series(serie), errors='coerce')
+    dias = datas.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    return np.where(datas.isna().to_numpy(), -1, dias)
+
+
+def _parametros(ajustes):
+    """Normaliza os campos dos ajustes com a mesma leitura do loop original (`ajuste.get`)"""
+    n = len(ajustes)
+    coluna = lambda nome, padrao: ajustes[nome] if nome in ajustes.columns else pd.Series([padrao] * n, index=ajustes.index)
+
+    valor = pd.to_numeric(coluna('valor', 0), errors='coerce').to_numpy(dtype=float)
+    percentual = pd.to_numeric(coluna('percentual_desconto', 0), errors='coerce').to_numpy(dtype=float)
+    return pd.DataFrame({
+        'valor': valor,
+        'percentual': percentual,
+        'percentual_tipo': (coluna('tipo_desconto', 'Fixo') == 'Percentual').to_numpy(),
+        'provisionado': (coluna('forma_aplicacao', 'Provisionado') == 'Provisionado').to_numpy(),
+        'categoria': coluna('categoria', 'waiver').to_numpy(),
+        'servico': coluna('servico', None).to_numpy(),
+        'ativo': (valor > 0) | (percentual > 0),
+    })
+
+
+def _pares_ajuste_registro(df, ajustes, col_servico):
+    """Junção por intervalo: pares (ajuste, linha) com fundo, serviço e período compatíveis
+
+    As linhas são ordenadas por chave composta (fundo[, serviço], dia) e cada ajuste
+    vira um intervalo [início, fim) nessa ordem, achado com duas buscas binárias.
+    """
+    n = len(df)
+    por_nome = (ajustes['fund_name'].notna().to_numpy() if 'fund_name' in ajustes.columns
+                else np.zeros(len(ajustes), dtype=bool))
+
+    # Código do fundo de cada ajuste: por nome (waivers) ou por ID (descontos)
+    fundo_df_nome, fundo_aj_nome = _codigos(df['fund_name'], ajustes['fund_name'] if 'fund_name' in ajustes.columns else pd.Series([None] * len(ajustes)))
+    fundo_df_id, fundo_aj_id = _codigos(df['fund_id'], ajustes['fund_id'] if 'fund_id' in ajustes.columns else pd.Series([None] * len(ajustes)))
+
+    # Período: sem date_ref, todas as linhas do fundo entram
+    if 'date_ref' in df.columns:
+        dia_df = _dias(df['date_ref'])
+        inicio = _dias(ajustes['data_inicio'])
+        fim = _dias(ajustes['data_fim'])
+        periodo_valido = (inicio >= 0) & (fim >= 0)
+    else:
+        dia_df = np.zeros(n, dtype=np.int64)
+        inicio = np.zeros(len(ajustes), dtype=np.int64)
+        fim = np.zeros(len(ajustes), dtype=np.int64)
+        periodo_valido = np.ones(len(ajustes), dtype=bool)
+    dia_df = np.maximum(dia_df, 0)
+    inicio, fim = np.maximum(inicio, 0), np.maximum(fim, 0)
+
+    # Serviço: None/'' = todos os serviços; demais valores exigem igualdade
+    servico = ajustes['servico'].to_numpy() if 'servico' in ajustes.columns else np.full(len(ajustes), None)
+    todos_servicos = np.array([s is None or (isinstance(s, str) and s == '') for s in servico], dtype=bool)
+    if col_servico is None:
+        todos_servicos[:] = True
+        servico_df, servico_aj = np.zeros(n, dtype=np.int64), np.zeros(len(ajustes), dtype=np.int64)
+    else:
+        servico_df, servico_aj = _codigos(df[col_servico], pd.Series(servico, dtype=object))
+
+    indices_ajuste, linhas = [], []
+    for fundo_df, fundo_aj, selecao in ((fundo_df_nome, fundo_aj_nome, por_nome), (fundo_df_id, fundo_aj_id, ~por_nome)):
+        for com_servico in (False, True):
+            alvo = selecao & (todos_servicos != com_servico) & (fundo_aj >= 0) & periodo_valido
+            if com_servico:
+                alvo &= servico_aj >= 0
+            if not alvo.any():
+                continue
+
+            chave_df = fundo_df.astype(np.int64) << (_BITS_DIA + (_BITS_SERVICO if com_servico else 0))
+            base_aj = fundo_aj[alvo].astype(np.int64) << (_BITS_DIA + (_BITS_SERVICO if com_servico else 0))
+            if com_servico:
+                chave_df = chave_df | (servico_df.astype(np.int64) << _BITS_DIA)
+                base_aj = base_aj | (servico_aj[alvo].astype(np.int64) << _BITS_DIA)
+            chave_df = np.where((fundo_df >= 0) & ((servico_df >= 0) if com_servico else True), chave_df | dia_df, -1)
+
+            ordem = np.argsort(chave_df, kind='stable')
+            chave_ordenada = chave_df[ordem]
+            lo = np.searchsorted(chave_ordenada, base_aj | inicio[alvo], side='left')
+            hi = np.searchsorted(chave_ordenada, base_aj | fim[alvo], side='right')
+            tamanhos = np.maximum(hi - lo, 0)
+
+            posicoes = np.repeat(lo - np.cumsum(tamanhos) + tamanhos, tamanhos) + np.arange(tamanhos.sum())
+            indices_ajuste.append(np.repeat(np.flatnonzero(alvo), tamanhos))
+            linhas.append(ordem[posicoes])
+
+    if not indices_ajuste:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(indices_ajuste), np.concatenate(linhas)
+
+
+def aplicar_ajustes(df, ajustes, col_acumulado, col_servico=None):
+    """Aplica waivers e descontos ativos sobre `col_acumulado`
+
+    Mantém a semântica do loop original, ajuste a ajuste e na ordem de `ajustes`:
+    - Percentual: multiplica por (1 - percentual/100)
+    - Fixo: subtrai `valor` (Provisionado: valor / quantidade de registros)
+    - Provisionado: todos os registros do fundo/serviço no período
+    - Não Provisionado: apenas o último registro (maior índice)
+
+    Ajustes que atingem a mesma linha são aplicados em rodadas (1º ajuste de cada
+    linha, depois o 2º, ...), preservando a ordem e o resultado do loop.
+
+    Returns:
+        (DataFrame ajustado, DataFrame com um resumo por ajuste aplicado)
+    """
+    df = df.copy()
+    if ajustes.empty or df.empty:
+        return df, pd.DataFrame(columns=COLUNAS_RESUMO)
+
+    ajustes = ajustes.reset_index(drop=True)
+    params = _parametros(ajustes)
+    indice_ajuste, linhas = _pares_ajuste_registro(df, ajustes, col_servico)
+
+    pares = pd.DataFrame({'ajuste': indice_ajuste, 'linha': linhas})
+    pares = pares[params['ativo'].to_numpy()[pares['ajuste'].to_numpy()]]
+    if pares.empty:
+        return df, pd.DataFrame(columns=COLUNAS_RESUMO)
+
+    # Alvo de cada par: Provisionado -> todas as linhas; Não Provisionado -> maior índice
+    rotulos = df.index.to_numpy()
+    pares['rotulo'] = rotulos[pares['linha'].to_numpy()]
+    registros = pares.groupby('ajuste')['linha'].transform('size').to_numpy()
+    ultimo = pares.groupby('ajuste')['rotulo'].transform('max').to_numpy()
+
+    aj = pares['ajuste'].to_numpy()
+    provisionado = params['provisionado'].to_numpy()[aj]
+    percentual_tipo = params['percentual_tipo'].to_numpy()[aj]
+    percentual = params['percentual'].to_numpy()[aj]
+    valor = params['valor'].to_numpy()[aj]
+    afeta = provisionado | (pares['rotulo'].to_numpy() == ultimo)
+
+    # Rodadas: posição do par entre os ajustes da mesma linha (na ordem dos ajustes)
+    pares = pares.assign(afeta=afeta, provisionado=provisionado, percentual_tipo=percentual_tipo,
+                         percentual=percentual, valor=valor, registros=registros)
+    pares = pares.sort_values(['linha', 'ajuste'], kind='stable')
+    pares['rodada'] = pares.groupby('linha').cumcount()
+
+    valores = df[col_acumulado].to_numpy(dtype=float, copy=True)
+    contribuicao = np.zeros(len(pares))
+    valores_antes = np.zeros(len(pares))
+    rodada = pares['rodada'].to_numpy()
+    linha = pares['linha'].to_numpy()
+    for r in range(rodada.max() + 1):
+        na_rodada = np.flatnonzero(rodada == r)
+        linhas_r = linha[na_rodada]
+        antes = valores[linhas_r]
+        valores_antes[na_rodada] = antes
+
+        perc = pares['percentual'].to_numpy()[na_rodada]
+        eh_perc = pares['percentual_tipo'].to_numpy()[na_rodada]
+        contribuicao[na_rodada] = np.where(eh_perc, antes * (perc / 100), 0.0)
+
+        afeta_r = pares['afeta'].to_numpy()[na_rodada]
+        valor_r = pares['valor'].to_numpy()[na_rodada]
+        desconto_fixo = np.where(pares['provisionado'].to_numpy()[na_rodada],
+                                 valor_r / pares['registros'].to_numpy()[na_rodada], valor_r)
+        novos = np.where(eh_perc, antes * (1 - perc / 100), antes - desconto_fixo)
+        valores[linhas_r[afeta_r]] = novos[afeta_r]
+
+    df[col_acumulado] = valores
+
+    # Resumo por ajuste (mensagem exibida no dashboard)
+    pares['contribuicao'] = contribuicao
+    pares['antes'] = valores_antes
+    por_ajuste = pares.sort_values(['ajuste', 'linha']).groupby('ajuste')
+    indices = np.array(sorted(por_ajuste.groups))
+
+    coluna = lambda nome, padrao: ajustes[nome] if nome in ajustes.columns else pd.Series([padrao] * len(ajustes))
+    fund_name = coluna('fund_name', None)
+    fundo = fund_name.where(fund_name.notna(), coluna('fund_id', None))
+
+    resumo = params.loc[indices, ['categoria', 'provisionado', 'percentual', 'servico']].copy()
+    resumo['indice_ajuste'] = indices
+    resumo['fundo'] = fundo.to_numpy()[indices]
+    resumo['tipo_desconto'] = coluna('tipo_desconto', 'Fixo').to_numpy()[indices]
+    resumo['registros'] = por_ajuste.size().to_numpy()
+    resumo['valor_total_aplicado'] = np.where(
+        params['percentual_tipo'].to_numpy()[indices],
+        por_ajuste['contribuicao'].sum().to_numpy(),
+        params['valor'].to_numpy()[indices],
+    )
+
+    # Detalhe dos waivers de 100% (datas e valores antes do ajuste), exibido para conferência
+    total = params['percentual_tipo'].to_numpy()[indices] & (params['percentual'].to_numpy()[indices] == 100)
+    resumo['datas'] = None
+    resumo['valores_antes'] = None
+    if total.any() and 'date_ref' in df.columns:
+        detalhe = pares[pares['ajuste'].isin(indices[total])].sort_values(['ajuste', 'linha'])
+        detalhe = detalhe.assign(data=df['date_ref'].to_numpy()[detalhe['linha'].to_numpy()])
+        resumo.loc[total, 'datas'] = detalhe.groupby('ajuste')['data'].agg(list).to_numpy()
+        resumo.loc[total, 'valores_antes'] = detalhe.groupby('ajuste')['antes'].agg(list).to_numpy()
+
+    return df, resumo[COLUNAS_RESUMO].reset_index(drop=True)
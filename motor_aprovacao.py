@@ -0,0 +1,260 @@
+"""
+Motor de Aprovação - Calculadora 5.0
+Compila uma solicitação (linhas de finance.alteracoes_pendentes com o mesmo
+solicitacao_id) em poucos comandos set-based — um INSERT em finance.descontos, um MERGE
+por tabela de taxas e um UPDATE de status, cada um lendo um parâmetro ARRAY<STRUCT> — e
+os executa numa única transação: ou a solicitação inteira é aplicada, ou nada muda
+"""
+import os
+import time
+import uuid
+from datetime import date, datetime
+from google.cloud import bigquery
+
+TABELA_PENDENTES = 'kanastra-live.finance.alteracoes_pendentes'
+TABELA_DESCONTOS = 'kanastra-live.finance.descontos'
+
+# Coluna de valor de cada tabela de taxas
+COLUNA_VALOR = {'fee_minimo': 'fee_min', 'fee_variavel': 'fee_variavel'}
+
+# Tempo máximo esperado de uma aprovação, do envio à confirmação (segundos)
+ORCAMENTO_APROVACAO_S = float(os.environ.get('CALCULADORA_ORCAMENTO_APROVACAO_S', '20'))
+
+QUERY_INSERIR_DESCONTOS = f"""
+INSERT INTO `{TABELA_DESCONTOS}`
+(id, data_aplicacao, usuario, fund_id, fund_name, categoria,
+ valor_desconto, tipo_desconto, percentual_desconto, forma_aplicacao, origem,
+ data_inicio, data_fim, servico, observacao, documento_referencia)
+SELECT
+    id, data_aplicacao, usuario, fund_id, fund_name, categoria,
+    valor_desconto, tipo_desconto, percentual_desconto, forma_aplicacao, origem,
+    data_inicio, data_fim, servico, observacao, documento_referencia
+FROM UNNEST(@descontos);
+"""
+
+# Antes do MERGE: sem estas conferências, um UPDATE cuja faixa original não existe mais é
+# descartado em silêncio e faixas originais repetidas só geram o erro genérico do MERGE
+QUERY_CONFERIR_TAXAS = """
+ASSERT NOT EXISTS (
+    SELECT 1 FROM UNNEST(@{tabela}) S
+    WHERE S.tipo = 'UPDATE'
+    GROUP BY S.fund_id, S.servico, S.faixa_original
+    HAVING COUNT(*) > 1
+) AS '{tabela}: a solicitação altera a mesma faixa mais de uma vez (fund_id, servico e faixa original repetidos)';
+ASSERT NOT EXISTS (
+    SELECT 1 FROM UNNEST(@{tabela}) S
+    LEFT JOIN `kanastra-live.finance.{tabela}` T
+      ON T.`fund id` = S.fund_id
+     AND T.servico = S.servico
+     AND T.faixa = S.faixa_original
+    WHERE S.tipo = 'UPDATE'
+    GROUP BY S.fund_id, S.servico, S.faixa_original
+    HAVING COUNT(T.faixa) != 1
+) AS '{tabela}: faixa original de uma alteração não encontrada (ou repetida) na tabela; recarregue a tabela e refaça a solicitação';
+"""
+
+# INSERT das linhas novas e UPDATE das existentes (localizadas pela faixa original)
+QUERY_MERGE_TAXAS = """
+MERGE `kanastra-live.finance.{tabela}` T
+USING (SELECT * FROM UNNEST(@{tabela})) S
+ON S.tipo = 'UPDATE'
+   AND T.`fund id` = S.fund_id
+   AND T.servico = S.servico
+   AND T.faixa = S.faixa_original
+WHEN MATCHED THEN
+    UPDATE SET faixa = S.faixa, {coluna} = S.valor
+WHEN NOT MATCHED BY TARGET AND S.tipo = 'INSERT' THEN
+    INSERT (empresa, `fund id`, cliente, servico, faixa, {coluna})
+    VALUES (S.empresa, S.fund_id, S.cliente, S.servico, S.faixa, S.valor);
+"""
+
+# Outro aprovador pode ter processado a solicitação desde que a tela foi carregada
+QUERY_CONFERIR_PENDENTES = f"""
+ASSERT (
+    SELECT COUNT(*) FROM `{TABELA_PENDENTES}`
+    WHERE id IN UNNEST(@ids) AND status = 'PENDENTE'
+) = ARRAY_LENGTH(@ids) AS 'Solicitação já processada por outro aprovador';
+"""
+
+QUERY_ATUALIZAR_STATUS = f"""
+UPDATE `{TABELA_PENDENTES}`
+SET status = @status, aprovador_por = @aprovador
+WHERE id IN UNNEST(@ids) AND status = 'PENDENTE';
+"""
+
+
+def _texto(nome, valor):
+    return bigquery.ScalarQueryParameter(nome, 'STRING', None if valor is None else str(valor))
+
+
+def _numero(nome, valor):
+    return bigquery.ScalarQueryParameter(nome, 'FLOAT64', None if valor is None else float(valor))
+
+
+def _inteiro(nome, valor):
+    return bigquery.ScalarQueryParameter(nome, 'INT64', None if valor is None else int(float(valor)))
+
+
+def _data(nome, valor):
+    return bigquery.ScalarQueryParameter(nome, 'DATE', date.fromisoformat(str(valor)[:10]) if valor else None)
+
+
+def _linha_desconto(alteracao, aprovador, agora):
+    """Linha de finance.descontos de um waiver ou desconto (mesmos valores do INSERT linha a linha)"""
+    dados = alteracao['dados']
+    if alteracao['tabela'] == 'waiver':
+        campos = [
+            _texto('usuario', alteracao.get('usuario', 'usuario_kanastra')),
+            _inteiro('fund_id', None),
+            _texto('fund_name', dados['fund_name']),
+            _texto('categoria', 'waiver'),
+            _numero('valor_desconto', dados.get('valor_waiver', 0.0)),
+            _texto('tipo_desconto', dados.get('tipo_desconto', 'Fixo')),
+            _numero('percentual_desconto', dados.get('percentual_desconto')),
+            _texto('forma_aplicacao', dados['tipo_waiver']),
+            _texto('origem', None),
+            _data('data_inicio', dados['data_inicio']),
+            _data('data_fim', dados['data_fim']),
+            _texto('servico', dados.get('servico') or None),
+            _texto('observacao', dados.get('observacao', 'Aprovado via Dashboard')),
+            _texto('documento_referencia', None),
+        ]
+    else:
+        origem = alteracao.get('origem', 'comercial')
+        campos = [
+            _texto('usuario', aprovador),
+            _inteiro('fund_id', dados.get('fund_id', 0)),
+            _texto('fund_name', dados.get('fund_name', '')),
+            _texto('categoria', f'desconto_{origem}'),
+            _numero('valor_desconto', dados.get('valor_desconto', 0)),
+            _texto('tipo_desconto', dados.get('tipo_desconto', 'Fixo')),
+            _numero('percentual_desconto', dados.get('percentual_desconto') or None),
+            _texto('forma_aplicacao', dados.get('forma_aplicacao', 'Nao_Provisionado')),
+            _texto('origem', origem),
+            _data('data_inicio', dados['data_inicio']),
+            _data('data_fim', dados.get('data_fim')),
+            _texto('servico', dados.get('servico') or None),
+            _texto('observacao', dados.get('observacao', 'Aprovado via Dashboard')),
+            _texto('documento_referencia', dados.get('documento_referencia', '')),
+        ]
+    return bigquery.StructQueryParameter(
+        None,
+        _texto('id', uuid.uuid4()),
+        bigquery.ScalarQueryParameter('data_aplicacao', 'TIMESTAMP', agora),
+        *campos,
+    )
+
+
+def _linha_taxa(alteracao):
+    """Linha do MERGE de fee_minimo / fee_variavel"""
+    dados = alteracao['dados']
+    tabela = alteracao['tabela']
+    if tabela == 'fee_minimo':
+        faixa_original = dados.get('original_lower', dados['faixa'])
+    else:
+        faixa_original = dados.get('original_faixa', dados.get('original_lower', dados['faixa']))
+    return bigquery.StructQueryParameter(
+        None,
+        _texto('tipo', 'INSERT' if alteracao['tipo_alteracao'] == 'INSERT' else 'UPDATE'),
+        _texto('empresa', dados.get('empresa')),
+        _inteiro('fund_id', dados['fund_id']),
+        _texto('cliente', dados.get('cliente')),
+        _texto('servico', dados['servico']),
+        _numero('faixa', dados['faixa']),
+        _numero('faixa_original', faixa_original),
+        _numero('valor', dados[COLUNA_VALOR[tabela]]),
+    )
+
+
+def compilar_aprovacao(solicitacao, aprovador):
+    """Script e parâmetros que aplicam a solicitação e a marcam como APROVADO
+
+    Returns:
+        (script SQL, lista de parâmetros, {tabela de destino: linhas})
+    """
+    agora = datetime.now()
+    descontos, taxas = [], {tabela: [] for tabela in COLUNA_VALOR}
+    for alteracao in solicitacao:
+        if alteracao['tabela'] in ('waiver', 'desconto'):
+            descontos.append(_linha_desconto(alteracao, aprovador, agora))
+        elif alteracao['tabela'] in taxas:
+            taxas[alteracao['tabela']].append(_linha_taxa(alteracao))
+        else:
+            raise ValueError(f"Tabela não suportada na aprovação: {alteracao['tabela']}")
+
+    comandos = [QUERY_CONFERIR_PENDENTES]
+    parametros = [
+        bigquery.ArrayQueryParameter('ids', 'STRING', [alteracao['id'] for alteracao in solicitacao]),
+        _texto('status', 'APROVADO'),
+        _texto('aprovador', aprovador),
+    ]
+    linhas = {}
+    if descontos:
+        comandos.append(QUERY_INSERIR_DESCONTOS)
+        parametros.append(bigquery.ArrayQueryParameter('descontos', 'STRUCT', descontos))
+        linhas['descontos'] = len(descontos)
+    for tabela, linhas_tabela in taxas.items():
+        if linhas_tabela:
+            comandos.append(QUERY_CONFERIR_TAXAS.format(tabela=tabela))
+            comandos.append(QUERY_MERGE_TAXAS.format(tabela=tabela, coluna=COLUNA_VALOR[tabela]))
+            parametros.append(bigquery.ArrayQueryParameter(tabela, 'STRUCT', linhas_tabela))
+            linhas[tabela] = len(linhas_tabela)
+    comandos.append(QUERY_ATUALIZAR_STATUS)
+
+    # aprovador_por vem das migrações (add_aprovador_por_column.sql)
+    script = "BEGIN\nBEGIN TRANSACTION;\n" + "".join(comandos) + """
+COMMIT TRANSACTION;
+EXCEPTION WHEN ERROR THEN
+    ROLLBACK TRANSACTION;
+    RAISE USING MESSAGE = @@error.message;
+END;
+"""
+    return script, parametros, linhas
+
+
+def _executar(client, script, parametros, orcamento_s):
+    inicio = time.perf_counter()
+    job = client.query(script, job_config=bigquery.QueryJobConfig(query_parameters=parametros))
+    job.result()
+    tempo = time.perf_counter() - inicio
+    tempo_servidor = (job.ended - job.started).total_seconds() if job.started and job.ended else None
+    return {
+        'tempo_s': tempo,
+        'tempo_servidor_s': tempo_servidor,
+        'orcamento_s': orcamento_s,
+        'dentro_orcamento': tempo <= orcamento_s,
+    }
+
+
+def aprovar_solicitacao(client, solicitacao, aprovador, orcamento_s=ORCAMENTO_APROVACAO_S):
+    """Aplica a solicitação inteira numa única transação (um job)
+
+    Levanta exceção se qualquer comando falhar (nada é aplicado), inclusive quando outra
+    sessão já aprovou ou rejeitou alguma das linhas, e ValueError se a solicitação estiver vazia.
+
+    Returns:
+        dict com 'linhas' ({tabela: linhas aplicadas}), 'sql', tempo de ponta a ponta
+        ('tempo_s'), tempo no BigQuery ('tempo_servidor_s'), 'orcamento_s' e 'dentro_orcamento'
+    """
+    if not solicitacao:
+        raise ValueError("Solicitação sem linhas pendentes")
+    script, parametros, linhas = compilar_aprovacao(solicitacao, aprovador)
+    resultado = _executar(client, script, parametros, orcamento_s)
+    resultado.update(linhas=linhas, sql=script)
+    return resultado
+
+
+def rejeitar_solicitacao(client, solicitacao, aprovador, orcamento_s=ORCAMENTO_APROVACAO_S):
+    """Marca todas as linhas da solicitação como REJEITADO com um único UPDATE (ValueError se vazia)
+
+    Returns:
+        dict de tempos (mesmas chaves de `aprovar_solicitacao`, sem 'linhas' e 'sql')
+    """
+    if not solicitacao:
+        raise ValueError("Solicitação sem linhas pendentes")
+    parametros = [
+        bigquery.ArrayQueryParameter('ids', 'STRING', [alteracao['id'] for alteracao in solicitacao]),
+        _texto('status', 'REJEITADO'),
+        _texto('aprovador', aprovador),
+    ]
+    return _executar(client, QUERY_ATUALIZAR_STATUS, parametros, orcamento_s)
@@ -0,0 +1,433 @@
+"""
+Motor de Taxas - Calculadora 5.0 em pandas/NumPy
+Reproduz localmente o resultado `y` da query `Calculadora 5.0.sql`
+a partir dos insumos colunares (PL diário, faixas, calendário e gross up)
+"""
+import numpy as np
+import pandas as pd
+from google.cloud import bigquery
+import calendario as calendario_uteis
+import faixas_compiladas
+
+# Fundos com offset de sequência igual (seq = seq1); os demais usam seq = seq1 - 1
+FUNDOS_SEQ_MESMO_DIA = {41, 6, 62, 40, 36, 98, 96, 161, 178, 187, 232, 247, 245, 164, 268, 179, 295, 274, 322, 291}
+
+# Fundo com cálculo de faixa única (taxa da faixa vigente aplicada sobre todo o PL)
+FUNDO_FAIXA_UNICA = 150
+
+# Fundos cujo PL vem de investment.wallet (external_id = 11301) em vez de investment.quotas
+FUNDOS_PL_WALLET = (302, 76)
+
+# Serviços da saída final: (Service, sufixo das colunas, coluna da carteira, aplica gross up)
+SERVICOS = [
+    ('Administração', 'adm', 'taxa_adm', True),
+    ('Gestão', 'gestao', 'taxa_gestao', True),
+    ('Custódia', 'custodia', 'taxa_custodia', True),
+    ('Custódia Kanastra', 'custodia_kanastra', 'taxa_custodia_dc', False),
+]
+
+# Rótulos usados no `Gross Up` (STRING_AGG da query original)
+NOMES_GROSS_UP = {
+    'Administração': 'Adm',
+    'Gestão': 'Gestão',
+    'Custódia': 'Custódia',
+    'Custódia Kanastra': 'Consultoria',
+}
+
+COLUNAS_Y = [
+    'date_ref', 'fund_id', 'fund_name', 'cnpj', 'net_worth', 'Service',
+    'business_days_in_month', 'Gross Up', 'taxa_variavel', 'fee_min',
+    'fee_variavel_diario', 'fee_min_diario', 'acumulado', 'provisao_carteira',
+    'diferenca', 'is_missing'
+]
+
+# =======================
+# QUERIES DE INSUMOS
+# =======================
+
+# PL já agregado por (fund_id, reference_dt) em finance.pl_diario (ver pl_diario.py)
+QUERY_PL = """
+SELECT fund_id, reference_dt, net_worth, net_worth_positivo
+FROM `kanastra-live.finance.pl_diario`
+"""
+
+QUERY_FEE_VARIAVEL = """
+SELECT empresa, `fund id` AS fund_id, cliente, servico, faixa, fee_variavel
+FROM `kanastra-live.finance.fee_variavel`
+"""
+
+QUERY_FEE_MINIMO = """
+SELECT empresa, `fund id` AS fund_id, cliente, servico, faixa, fee_min
+FROM `kanastra-live.finance.fee_minimo`
+"""
+
+QUERY_FUNDOS = """
+SELECT id AS fund_id, name AS fund_name, government_id AS cnpj
+FROM `kanastra-live.hub.funds`
+"""
+
+QUERY_GROSS_UP = """
+SELECT fund_id, servico, gross
+FROM `kanastra-live.finance.gross_up`
+"""
+
+QUERY_CARTEIRA = """
+SELECT
+    reference_dt,
+    fund_id,
+    MAX(CASE WHEN LOWER(external_name_group1) = 'txadm' THEN - market_value END) AS taxa_adm,
+    MAX(CASE WHEN LOWER(external_name_group1) = 'txgestao' THEN - market_value END) AS taxa_gestao,
+    MAX(CASE WHEN LOWER(external_name_group1) = 'txcust' THEN - market_value END) AS taxa_custodia,
+    MAX(CASE WHEN LOWER(external_name_group1) like '%txcust%dc%' THEN - market_value END) AS taxa_custodia_dc
+FROM `kanastra-live.investment.wallet`
+WHERE account_name_1 = 'passivo'
+  AND account_name_2 = 'provisao'
+GROUP BY reference_dt, fund_id
+"""
+
+# Fator de correção por (fund_id, mes) materializado em finance.fatores_correcao (ver fatores_correcao.py)
+QUERY_FATORES = """
+SELECT fund_id, mes, fator_correcao
+FROM `kanastra-live.finance.fatores_correcao`
+"""
+
+
+def carregar_insumos(client, data_inicio=None):
+    """Carrega do BigQuery todos os insumos colunares usados pelo motor
+
+    Args:
+        data_inicio: Se informado, PL e carteira são lidos apenas a partir desta data
+
+    Returns:
+        Dict com os DataFrames esperados por `calcular_provisoes`
+    """
+    consultas = {
+        'pl': QUERY_PL,
+        'fee_variavel': QUERY_FEE_VARIAVEL,
+        'fee_minimo': QUERY_FEE_MINIMO,
+        'fundos': QUERY_FUNDOS,
+        'gross_up': QUERY_GROSS_UP,
+        'carteira': QUERY_CARTEIRA,
+        'fatores': QUERY_FATORES,
+    }
+    job_config = None
+    if data_inicio is not None:
+        for nome in ('pl', 'carteira'):
+            consultas[nome] = f"SELECT * FROM ({consultas[nome]}) WHERE reference_dt >= @data_inicio"
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter('data_inicio', 'DATE', data_inicio)]
+        )
+
+    insumos = {}
+    for nome, sql in consultas.items():
+        config = job_config if nome in ('pl', 'carteira') else None
+        insumos[nome] = client.query(sql, job_config=config).to_dataframe()
+    # Dias úteis do calendário em cache (janela estendida automaticamente)
+    insumos['dias_uteis'] = pd.Series(calendario_uteis.obter_calendario(client).dias)
+    return insumos
+
+
+def recortar_janela(insumos, data_inicio, data_fim):
+    """Insumos restritos ao que a Calculadora 5.0 lê para o período
+
+    PL e dias úteis vão do início do mês anterior a data_inicio ao fim do mês de data_fim
+    (`calendario.janela_calculadora`, o mesmo limite nos dois); carteira fica em
+    [data_inicio, data_fim]. Com `filtrar_periodo`, o resultado deve ser igual ao do
+    histórico completo recortado ao período.
+    """
+    inicio, fim = (pd.Timestamp(d) for d in calendario_uteis.janela_calculadora(data_inicio, data_fim))
+    recortados = dict(insumos)
+    pl = _datas(insumos['pl']['reference_dt'])
+    recortados['pl'] = insumos['pl'][(pl >= inicio) & (pl <= fim)]
+    dias = pd.Series(insumos['dias_uteis'])
+    datas_dias = _datas(dias)
+    recortados['dias_uteis'] = dias[(datas_dias >= inicio) & (datas_dias <= fim)]
+    if insumos.get('carteira') is not None:
+        datas_carteira = _datas(insumos['carteira']['reference_dt'])
+        recortados['carteira'] = insumos['carteira'][
+            (datas_carteira >= pd.Timestamp(data_inicio)) & (datas_carteira <= pd.Timestamp(data_fim))
+        ]
+    return recortados
+
+
+def filtrar_periodo(df, data_inicio, data_fim):
+    """Filtro final da query: `acumulado > 0` e date_ref em [data_inicio, data_fim]"""
+    datas = _datas(df['date_ref'])
+    manter = (df['acumulado'] > 0) & (datas >= pd.Timestamp(data_inicio)) & (datas <= pd.Timestamp(data_fim))
+    return df[manter].reset_index(drop=True)
+
+# =======================
+# ETAPAS DO CÁLCULO
+# =======================
+
+def _datas(serie):
+    """Normaliza uma coluna de datas (date, dbdate ou string) para datetime64"""
+    return pd.to_datetime(serie).dt.normalize()
+
+
+def normalizar_servico(serie):
+    """Replica `CASE WHEN tipo_servico LIKE '%Admini%' THEN 'Administração'`"""
+    return serie.where(~serie.fillna('').str.contains('Admini', regex=False), 'Administração')
+
+
+def calcular_limites_faixas(df_faixas):
+    """Replica `faixas_com_limites`: limite superior = próxima faixa do mesmo cliente/serviço"""
+    faixas = df_faixas.copy()
+    if 'empresa' not in faixas.columns:
+        faixas['empresa'] = None
+    if 'cliente' not in faixas.columns:
+        faixas['cliente'] = faixas['fund_id']
+    faixas = faixas.sort_values(['cliente', 'servico', 'faixa'], kind='mergesort')
+    faixas['limite_inferior'] = faixas['faixa'].astype(float)
+    faixas['limite_superior'] = faixas.groupby(['cliente', 'servico'], dropna=False)['limite_inferior'].shift(-1)
+    faixas['tipo_servico'] = normalizar_servico(faixas['servico'])
+    return faixas.reset_index(drop=True)
+
+
+def calcular_pl_diario(df_pl):
+    """Agrega o PL por (fund_id, dia)
+
+    Retorna as duas somas usadas pela query original:
+    - pl_total_diario: soma de todas as linhas (soma_diaria_pl / x_minimo)
+    - net_worth: soma apenas das linhas positivas (quotas / x_variavel)
+
+    Aceita tanto as linhas brutas de quotas/wallet quanto `finance.pl_diario`
+    (que já traz `net_worth_positivo`).
+    """
+    pl = df_pl.copy()
+    pl['dia'] = _datas(pl['reference_dt'])
+    pl['net_worth'] = pl['net_worth'].astype(float)
+    if 'net_worth_positivo' in pl.columns:
+        pl['net_worth_positivo'] = pl['net_worth_positivo'].astype(float)
+    else:
+        pl['net_worth_positivo'] = pl['net_worth'].where(pl['net_worth'] > 0)
+
+    agrupado = pl.groupby(['fund_id', 'dia'], sort=False)
+    return pd.DataFrame({
+        'pl_total_diario': agrupado['net_worth'].sum(min_count=1),
+        'net_worth': agrupado['net_worth_positivo'].sum(min_count=1),
+    }).reset_index()
+
+
+def calcular_calendario(dias_uteis):
+    """Replica `dias_uteis`: dia útil + quantidade de dias úteis do mês"""
+    uteis = calendario_uteis.CalendarioUteis(dias_uteis)
+    return pd.DataFrame({
+        'dia': pd.to_datetime(uteis.dias).astype('datetime64[ns]'),
+        'business_days_in_month': uteis.dias_uteis_no_mes(uteis.dias),
+    })
+
+
+def _pivotar_servicos(base, coluna_valor, prefixo):
+    """Consolida por (fund_id, dia, serviço) e pivota serviços em colunas
+
+    Empresas diferentes geram grupos distintos na query original, que depois
+    são reduzidos com MAX em x_variavel / x_minimo.
+    """
+    por_empresa = base.groupby(['fund_id', 'dia', 'tipo_servico', 'empresa'], dropna=False)[coluna_valor].sum(min_count=1)
+    por_servico = por_empresa.groupby(level=['fund_id', 'dia', 'tipo_servico'], dropna=False).max()
+
+    tabela = por_servico.unstack('tipo_servico')
+    nomes = [nome for nome, _, _, _ in SERVICOS]
+    tabela = tabela.reindex(columns=nomes)
+    tabela.columns = [f'{prefixo}_{sufixo}' for _, sufixo, _, _ in SERVICOS]
+    return tabela.reset_index()
+
+
+def calcular_taxas_variaveis(pl_util, faixas_variavel):
+    """Replica `faixa_variavel` + `taxas` (tipo 'variavel') com faixas compiladas
+
+    Para cada banda: fee_variavel / 252 * (parte do PL dentro da banda), avaliado como
+    função linear por partes (uma busca ordenada por PL).
+    O fundo 150 usa somente a banda que contém o PL, aplicada sobre o PL inteiro.
+    """
+    faixa_unica = faixas_variavel['fund_id'] == FUNDO_FAIXA_UNICA
+
+    progressivas = faixas_compiladas.obter_faixas_compiladas(faixas_variavel[~faixa_unica], 'linear', 'fee_variavel')
+    base = progressivas.avaliar(pl_util)
+
+    if faixa_unica.any():
+        vigente = faixas_compiladas.obter_faixas_compiladas(faixas_variavel[faixa_unica], 'degrau', 'fee_variavel')
+        especial = vigente.avaliar(pl_util[pl_util['fund_id'] == FUNDO_FAIXA_UNICA])
+        especial['taxa'] = especial['taxa'] / 252 * especial['pl_total_diario']
+        base = pd.concat([base, especial], ignore_index=True)
+
+    return _pivotar_servicos(base, 'taxa', 'var')
+
+
+def calcular_taxas_minimas(pl_util, faixas_minimo):
+    """Replica `faixa_minimo` + `taxas` (tipo 'minimo'): fee_min da banda que contém o PL"""
+    vigente = faixas_compiladas.obter_faixas_compiladas(faixas_minimo, 'degrau', 'fee_min')
+    base = vigente.avaliar(pl_util[pl_util['pl_total_diario'] > 0])
+    return _pivotar_servicos(base, 'taxa', 'min')
+
+
+def _sequenciar(df):
+    """ROW_NUMBER() OVER (PARTITION BY fund_id ORDER BY dia DESC)"""
+    return df.groupby('fund_id')['dia'].rank(method='first', ascending=False).astype(int)
+
+
+def _gross_up_por_fundo(gross_up):
+    """Replica o pivot de `finance.gross_up` usado em `comparacao`"""
+    colunas = ['fund_id', 'Gross Up'] + [f'gross_{sufixo}' for _, sufixo, _, gross in SERVICOS if gross]
+    if gross_up is None or gross_up.empty:
+        return pd.DataFrame(columns=colunas)
+
+    g = gross_up[['fund_id', 'servico', 'gross']].copy()
+    g['gross'] = g['gross'].astype(float)
+    g['serv_name'] = g['servico'].map(NOMES_GROSS_UP).where(g['gross'].fillna(0) > 0)
+
+    resultado = g.groupby('fund_id')['serv_name'].agg(lambda nomes: ' / '.join(nomes.dropna()) or None).rename('Gross Up').to_frame()
+    for nome, sufixo, _, gross in SERVICOS:
+        if gross:
+            resultado[f'gross_{sufixo}'] = g[g['servico'] == nome].groupby('fund_id')['gross'].max()
+    return resultado.reset_index()[colunas]
+
+
+def _soma_acumulada_mes(df, coluna):
+    """SUM(...) OVER (PARTITION BY fund_id, mês ORDER BY date_ref) ignorando NULLs como no SQL"""
+    grupos = [df['fund_id'], df['date_ref'].dt.to_period('M')]
+    soma = df[coluna].fillna(0).groupby(grupos).cumsum()
+    preenchidos = df[coluna].notna().astype(int).groupby(grupos).cumsum()
+    return soma.where(preenchidos > 0)
+
+
+def calcular_provisoes(pl, fee_variavel, fee_minimo, dias_uteis, fundos,
+                       gross_up=None, carteira=None, fatores=None):
+    """Calcula o resultado `y` da Calculadora 5.0 localmente
+
+    Args:
+        pl: DataFrame (fund_id, reference_dt, net_worth) com a união quotas + wallet
+        fee_variavel: DataFrame (fund_id, cliente, servico, faixa, fee_variavel[, empresa])
+        fee_minimo: DataFrame (fund_id, cliente, servico, faixa, fee_min[, empresa])
+        dias_uteis: Datas com is_business_day_br = TRUE
+        fundos: DataFrame (fund_id, fund_name, cnpj) de hub.funds
+        gross_up: DataFrame (fund_id, servico, gross) - opcional
+        carteira: DataFrame (reference_dt, fund_id, taxa_adm, taxa_gestao, taxa_custodia, taxa_custodia_dc) - opcional
+        fatores: DataFrame (fund_id, mes, fator_correcao) com o fator do mês de referência - opcional
+
+    Returns:
+        DataFrame com as colunas de `y` (uma linha por date_ref, fund_id e Service)
+    """
+    calendario = calcular_calendario(dias_uteis)
+    fundos = fundos[['fund_id', 'fund_name', 'cnpj']].drop_duplicates('fund_id')
+
+    pl_dia = calcular_pl_diario(pl)
+    pl_dia = pl_dia[pl_dia['fund_id'].isin(fundos['fund_id'])]
+
+    # Apenas dias úteis entram em taxas / x_variavel / x_minimo
+    pl_util = pl_dia.merge(calendario[['dia']], on='dia', how='inner')
+
+    taxas_var = calcular_taxas_variaveis(pl_util, calcular_limites_faixas(fee_variavel))
+    taxas_min = calcular_taxas_minimas(pl_util, calcular_limites_faixas(fee_minimo))
+
+    # x_minimo: todos os dias úteis com PL | x_variavel: apenas dias com net_worth > 0
+    x_minimo = pl_util[['fund_id', 'dia']].merge(taxas_min, on=['fund_id', 'dia'], how='left')
+    x_minimo['seq1'] = _sequenciar(x_minimo)
+
+    x_variavel = pl_util.loc[pl_util['net_worth'] > 0, ['fund_id', 'dia', 'net_worth']]
+    x_variavel = x_variavel.merge(taxas_var, on=['fund_id', 'dia'], how='left')
+    x_variavel['seq1'] = _sequenciar(x_variavel)
+
+    # quotas: todos os dias com PL positivo, usados como data de referência
+    quotas = pl_dia.loc[pl_dia['net_worth'].notna(), ['fund_id', 'dia']].rename(columns={'dia': 'date_ref'})
+    quotas['seq'] = quotas.groupby('fund_id')['date_ref'].rank(method='first', ascending=False).astype(int)
+    mesmo_dia = quotas['fund_id'].isin(FUNDOS_SEQ_MESMO_DIA)
+    quotas['seq1'] = np.where(mesmo_dia, quotas['seq'], quotas['seq'] + 1)
+
+    # ufa2 / ufa2_completa: só sobrevivem datas com match em x_variavel
+    ufa2 = quotas.merge(x_variavel.drop(columns='dia'), on=['fund_id', 'seq1'], how='inner')
+    ufa2 = ufa2.merge(x_minimo.drop(columns='dia'), on=['fund_id', 'seq1'], how='left')
+    ufa2 = ufa2.merge(fundos, on='fund_id', how='inner')
+    ufa2 = ufa2.merge(calendario.rename(columns={'dia': 'date_ref'}), on='date_ref', how='left')
+
+    if fatores is not None and not fatores.empty:
+        f = fatores[['fund_id', 'mes', 'fator_correcao']].copy()
+        f['mes'] = _datas(f['mes']).dt.to_period('M')
+        f = f.drop_duplicates(['fund_id', 'mes'], keep='last')
+        ufa2['mes'] = ufa2['date_ref'].dt.to_period('M')
+        ufa2 = ufa2.merge(f, on=['fund_id', 'mes'], how='left').drop(columns='mes')
+        ufa2['fator_correcao'] = ufa2['fator_correcao'].astype(float).fillna(1.0)
+    else:
+        ufa2['fator_correcao'] = 1.0
+
+    ufa2 = ufa2.merge(_gross_up_por_fundo(gross_up), on='fund_id', how='left')
+    ufa2['Gross Up'] = ufa2['Gross Up'].fillna('Sem Gross Up')
+
+    if carteira is not None and not carteira.empty:
+        cart = carteira.copy()
+        cart['date_ref'] = _datas(cart['reference_dt'])
+        colunas_carteira = [col for _, _, col, _ in SERVICOS]
+        ufa2 = ufa2.merge(cart[['fund_id', 'date_ref'] + colunas_carteira], on=['fund_id', 'date_ref'], how='left')
+
+    ufa2 = ufa2.sort_values(['fund_id', 'date_ref'], kind='mergesort').reset_index(drop=True)
+
+    dias_mes = ufa2['business_days_in_month'].astype(float)
+    fator = ufa2['fator_correcao']
+    net_worth = ufa2['net_worth']
+
+    partes = []
+    for nome, sufixo, col_carteira, aplica_gross in SERVICOS:
+        var_diario = ufa2[f'var_{sufixo}'].astype(float)
+        min_mensal = ufa2[f'min_{sufixo}'].astype(float)
+        min_diario = min_mensal / dias_mes * fator
+
+        if aplica_gross:
+            divisor = (1 - ufa2[f'gross_{sufixo}'].astype(float).fillna(0)).replace(0, np.nan)
+        else:
+            divisor = pd.Series(1.0, index=ufa2.index)
+
+        servico = pd.DataFrame({
+            'date_ref': ufa2['date_ref'],
+            'fund_id': ufa2['fund_id'],
+            'fund_name': ufa2['fund_name'],
+            'cnpj': ufa2['cnpj'],
+            'net_worth': net_worth,
+            'Service': nome,
+            'business_days_in_month': ufa2['business_days_in_month'],
+            'Gross Up': ufa2['Gross Up'],
+            'taxa_variavel': var_diario * 252 / net_worth,
+            'fee_min': min_mensal * fator,
+            'fee_variavel_diario': var_diario / divisor,
+            'fee_min_diario': min_diario / divisor,
+            'acumulado_dia': np.maximum(var_diario.fillna(0), min_diario.fillna(0)) / divisor,
+        })
+        servico['acumulado'] = _soma_acumulada_mes(servico, 'acumulado_dia')
+        servico['provisao_carteira'] = ufa2[col_carteira] if col_carteira in ufa2.columns else np.nan
+        servico['diferenca'] = servico['provisao_carteira'].fillna(0) - servico['acumulado'].fillna(0)
+        servico['is_missing'] = None
+        partes.append(servico.drop(columns='acumulado_dia'))
+
+    return pd.concat(partes, ignore_index=True)[COLUNAS_Y]
+
+# =======================
+# VALIDAÇÃO CONTRA O SQL
+# =======================
+
+def comparar_com_sql(df_motor, df_sql, tolerancia=0.01,
+                     colunas=('fee_variavel_diario', 'fee_min_diario', 'acumulado', 'diferenca')):
+    """Compara o resultado do motor com o resultado da query SQL (dataset de referência)
+
+    Args:
+        df_motor: Saída de `calcular_provisoes`
+        df_sql: Saída de `Calculadora 5.0.sql` (mesmas colunas de `y`)
+        tolerancia: Diferença absoluta máxima aceita em R$ por coluna
+
+    Returns:
+        DataFrame com as linhas divergentes (vazio quando os resultados batem)
+    """
+    chaves = ['date_ref', 'fund_id', 'Service']
+    # A query final mantém apenas `acumulado > 0`
+    df_motor = df_motor[df_motor['acumulado'] > 0]
+    motor = df_motor[chaves + list(colunas)].assign(date_ref=lambda d: _datas(d['date_ref']))
+    sql = df_sql[chaves + list(colunas)].assign(date_ref=lambda d: _datas(d['date_ref']))
+
+    comparado = motor.merge(sql, on=chaves, how='outer', suffixes=('_motor', '_sql'), indicator=True)
+    divergente = comparado['_merge'] != 'both'
+    for coluna in colunas:
+        a = comparado[f'{coluna}_motor'].astype(float)
+        b = comparado[f'{coluna}_sql'].astype(float)
+        diferenca = (a.fillna(0) - b.fillna(0)).abs()
+        divergente |= (diferenca > tolerancia) | (a.isna() != b.isna())
+
+    return comparado[divergente].reset_index(drop=True)
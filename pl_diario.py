@@ -0,0 +1,191 @@
+"""
+PL Diário - Calculadora 5.0
+Mantém `finance.pl_diario` (PL por fundo e dia) a partir de investment.quotas e
+investment.wallet, para que a calculadora leia as fontes de PL uma única vez
+"""
+from datetime import timedelta
+from google.cloud import bigquery
+import calendario
+
+TABELA_PL_DIARIO = 'kanastra-live.finance.pl_diario'
+
+# Dias reprocessados antes da marca d'água (cotas podem ser republicadas)
+DIAS_REPROCESSAMENTO = 7
+
+# PL por (fund_id, reference_dt) com o tratamento especial dos fundos 302 e 76.
+# net_worth_positivo replica o `WHERE net_worth > 0` aplicado linha a linha em quotas / x_variavel
+QUERY_FONTE_PL = """
+SELECT
+    fund_id,
+    reference_dt,
+    SUM(net_worth) AS net_worth,
+    SUM(IF(net_worth > 0, net_worth, NULL)) AS net_worth_positivo
+FROM (
+    SELECT fund_id, reference_dt, net_worth
+    FROM `kanastra-live.investment.quotas`
+    WHERE fund_id NOT IN (302, 76)
+      AND (@data_corte IS NULL OR reference_dt >= @data_corte)
+    UNION ALL
+    SELECT fund_id, reference_dt, SUM(market_value) AS net_worth
+    FROM `kanastra-live.investment.wallet`
+    WHERE external_id = 11301
+      AND fund_id IN (302, 76)
+      AND (@data_corte IS NULL OR reference_dt >= @data_corte)
+    GROUP BY 1, 2
+)
+GROUP BY fund_id, reference_dt
+"""
+
+# Subconsulta de PL que a Calculadora 5.0 repetia em cada etapa antes de finance.pl_diario
+# (texto original, mantido só para medir os bytes de antes em `comparar_bytes_processados`).
+# Recebe o mesmo limite superior da CTE atual, para que a comparação meça só o efeito
+# de finance.pl_diario e não o do corte em @data_fim
+QUERY_PL_ETAPA_ANTIGA = """
+    ( SELECT fund_id, reference_dt, net_worth
+    from investment.quotas WHERE  fund_id NOT in (302,76)
+    AND reference_dt >= DATE_SUB(DATE_TRUNC(@data_inicio, MONTH), INTERVAL 1 MONTH)
+    AND reference_dt <= LAST_DAY(@data_fim, MONTH)
+    AND (ARRAY_LENGTH(@fund_ids) = 0 OR fund_id IN UNNEST(@fund_ids))
+    UNION ALL
+    select 
+fund_id,
+reference_dt,
+sum(market_value) as pl
+from investment.wallet
+where external_id = 11301
+and fund_id in (302,76)
+and reference_dt >= DATE_SUB(DATE_TRUNC(@data_inicio, MONTH), INTERVAL 1 MONTH)
+and reference_dt <= LAST_DAY(@data_fim, MONTH)
+and (ARRAY_LENGTH(@fund_ids) = 0 OR fund_id IN UNNEST(@fund_ids))
+group by 1,2
+    )
+"""
+
+# As quatro leituras de PL da calculadora antiga, com a mesma agregação de cada etapa
+QUERY_PL_ANTES = f"""
+WITH soma_diaria_pl AS (
+    SELECT q.fund_id, q.reference_dt, SUM(q.net_worth) AS pl_total_diario
+    FROM {QUERY_PL_ETAPA_ANTIGA} q
+    GROUP BY 1, 2
+)
+, quotas AS (
+    SELECT fund_id, reference_dt, SUM(net_worth) AS pl
+    FROM {QUERY_PL_ETAPA_ANTIGA}
+    WHERE net_worth > 0
+    GROUP BY fund_id, reference_dt
+)
+, pl_x_variavel AS (
+    SELECT fund_id, reference_dt, sum(net_worth) net_worth
+    FROM {QUERY_PL_ETAPA_ANTIGA}
+    where net_worth > 0 group by 1,2
+)
+, pl_x_minimo AS (
+    SELECT fund_id, reference_dt, sum(net_worth) net_worth
+    FROM {QUERY_PL_ETAPA_ANTIGA}
+    group by 1,2
+)
+SELECT 'soma_diaria_pl' AS etapa, COUNT(*) AS linhas FROM soma_diaria_pl
+UNION ALL SELECT 'quotas', COUNT(*) FROM quotas
+UNION ALL SELECT 'x_variavel', COUNT(*) FROM pl_x_variavel
+UNION ALL SELECT 'x_minimo', COUNT(*) FROM pl_x_minimo
+"""
+
+# Leitura de PL da calculadora atual (CTE pl_diario de Calculadora 5.0.sql)
+QUERY_PL_DEPOIS = f"""
+SELECT fund_id, reference_dt, net_worth, net_worth_positivo
+FROM `{TABELA_PL_DIARIO}`
+WHERE reference_dt >= DATE_SUB(DATE_TRUNC(@data_inicio, MONTH), INTERVAL 1 MONTH)
+AND reference_dt <= LAST_DAY(@data_fim, MONTH)
+AND (ARRAY_LENGTH(@fund_ids) = 0 OR fund_id IN UNNEST(@fund_ids))
+"""
+
+QUERY_MERGE = f"""
+MERGE `{TABELA_PL_DIARIO}` T
+USING ({QUERY_FONTE_PL}) S
+ON T.fund_id = S.fund_id AND T.reference_dt = S.reference_dt
+WHEN MATCHED AND (
+    T.net_worth IS DISTINCT FROM S.net_worth
+    OR T.net_worth_positivo IS DISTINCT FROM S.net_worth_positivo
+) THEN
+    UPDATE SET
+        net_worth = S.net_worth,
+        net_worth_positivo = S.net_worth_positivo,
+        atualizado_em = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED BY TARGET THEN
+    INSERT (fund_id, reference_dt, net_worth, net_worth_positivo, atualizado_em)
+    VALUES (S.fund_id, S.reference_dt, S.net_worth, S.net_worth_positivo, CURRENT_TIMESTAMP())
+WHEN NOT MATCHED BY SOURCE AND (@data_corte IS NULL OR T.reference_dt >= @data_corte) THEN
+    DELETE
+"""
+
+
+def obter_marca_dagua(client):
+    """Retorna a maior reference_dt já persistida (None se a tabela estiver vazia)"""
+    query = f"SELECT MAX(reference_dt) AS marca_dagua FROM `{TABELA_PL_DIARIO}`"
+    linhas = list(client.query(query).result())
+    return linhas[0]['marca_dagua'] if linhas else None
+
+
+def atualizar_pl_diario(client, reconstruir=False):
+    """Atualiza `finance.pl_diario` reprocessando apenas os dias recentes
+
+    Args:
+        reconstruir: True para reprocessar todo o histórico das fontes
+
+    Returns:
+        Dict com o resumo da atualização (modo, data de corte, linhas afetadas)
+    """
+    marca = None if reconstruir else obter_marca_dagua(client)
+    data_corte = marca - timedelta(days=DIAS_REPROCESSAMENTO) if marca else None
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter('data_corte', 'DATE', data_corte)]
+    )
+    query_job = client.query(QUERY_MERGE, job_config=job_config)
+    query_job.result()
+    return {
+        'modo': 'incremental' if data_corte else 'completo',
+        'data_corte': data_corte,
+        'linhas': query_job.num_dml_affected_rows or 0,
+    }
+
+
+def estimar_bytes(client, query, query_parameters=None):
+    """Bytes que a query processaria (dry run, sem custo)"""
+    job_config = bigquery.QueryJobConfig(
+        dry_run=True,
+        use_query_cache=False,
+        query_parameters=query_parameters or [],
+    )
+    return client.query(query, job_config=job_config).total_bytes_processed
+
+
+def comparar_bytes_processados(client, query_calculadora, data_inicio, data_fim, fund_ids=()):
+    """Bytes de PL lidos pela calculadora antes e depois de `finance.pl_diario` (dry run)
+
+    "Antes" é medido sobre o texto da subconsulta antiga (`QUERY_PL_ETAPA_ANTIGA`) nas
+    quatro etapas que a repetiam; "depois" sobre a CTE `pl_diario` atual. Os dois usam
+    os mesmos parâmetros da calculadora.
+
+    Returns:
+        Dict com 'pl_antes', 'pl_depois', 'reducao' (fração de bytes de PL economizada)
+        e 'calculadora' (bytes da query atual completa)
+    """
+    parametros = [
+        bigquery.ScalarQueryParameter('data_inicio', 'DATE', data_inicio),
+        bigquery.ScalarQueryParameter('data_fim', 'DATE', data_fim),
+        bigquery.ArrayQueryParameter('fund_ids', 'INT64', list(fund_ids)),
+    ]
+    pl_antes = estimar_bytes(client, QUERY_PL_ANTES, parametros)
+    pl_depois = estimar_bytes(client, QUERY_PL_DEPOIS, parametros)
+
+    parametros_calculadora = parametros + [
+        bigquery.ScalarQueryParameter('servico', 'STRING', None),
+        calendario.parametro_dias_uteis(client, data_inicio, data_fim),
+    ]
+    return {
+        'pl_antes': pl_antes,
+        'pl_depois': pl_depois,
+        'reducao': 1 - pl_depois / pl_antes if pl_antes else None,
+        'calculadora': estimar_bytes(client, query_calculadora, parametros_calculadora),
+    }
@@ -0,0 +1,223 @@
+"""
+Provisões Incrementais - Calculadora 5.0
+Mantém `finance.provisao_calculadora` atualizada recalculando apenas os dias novos
+de cada fundo, a partir do início do mês da sua marca d'água
+"""
+import uuid
+from datetime import datetime, timedelta
+import pandas as pd
+from google.cloud import bigquery
+import fatores_correcao
+import motor_taxas
+import pl_diario
+
+TABELA_PROVISAO = 'kanastra-live.finance.provisao_calculadora'
+# Prefixo das tabelas de staging: uma por execução, para que atualizações simultâneas
+# (sessões ou processos diferentes) não sobrescrevam o staging uma da outra
+TABELA_PROVISAO_STAGE = 'kanastra-live.finance.provisao_calculadora_stage'
+
+# Dias de PL anteriores à janela, necessários para o deslocamento seq = seq1 - 1
+DIAS_LOOKBACK_PL = 10
+
+# Fundos sem dados novos há mais tempo que isso (ex: encerrados) não puxam a janela para trás
+DIAS_FUNDO_INATIVO = 90
+
+SCHEMA_PROVISAO = [
+    bigquery.SchemaField('date_ref', 'DATE'),
+    bigquery.SchemaField('fund_id', 'INT64'),
+    bigquery.SchemaField('Service', 'STRING'),
+    bigquery.SchemaField('fund_name', 'STRING'),
+    bigquery.SchemaField('cnpj', 'STRING'),
+    bigquery.SchemaField('net_worth', 'FLOAT64'),
+    bigquery.SchemaField('business_days_in_month', 'INT64'),
+    bigquery.SchemaField('gross_up', 'STRING'),
+    bigquery.SchemaField('taxa_variavel', 'FLOAT64'),
+    bigquery.SchemaField('fee_min', 'FLOAT64'),
+    bigquery.SchemaField('fee_variavel_diario', 'FLOAT64'),
+    bigquery.SchemaField('fee_min_diario', 'FLOAT64'),
+    bigquery.SchemaField('acumulado', 'FLOAT64'),
+    bigquery.SchemaField('provisao_carteira', 'FLOAT64'),
+    bigquery.SchemaField('diferenca', 'FLOAT64'),
+    bigquery.SchemaField('calculado_em', 'TIMESTAMP'),
+]
+
+# Mesmo formato da saída final de `Calculadora 5.0.sql`
+QUERY_LEITURA = f"""
+WITH sinqia AS (
+    SELECT
+        fund_id,
+        fq.type,
+        MIN(quota_external_id) AS quota_external_id
+    FROM `kanastra-live.hub.funds` f
+    INNER JOIN `kanastra-live.hub.fund_quotas` fq ON fq.fund_id = f.id
+    WHERE fq.type IN ('Sub', 'Classe única')
+      AND fq.is_active IS TRUE
+    GROUP BY 1, 2
+)
+SELECT
+    p.date_ref,
+    p.fund_id,
+    p.fund_name,
+    p.cnpj,
+    p.net_worth,
+    p.Service,
+    p.business_days_in_month,
+    p.gross_up AS `Gross Up`,
+    p.taxa_variavel,
+    p.fee_min,
+    p.fee_variavel_diario,
+    p.fee_min_diario,
+    p.acumulado,
+    p.provisao_carteira,
+    p.diferenca,
+    CAST(NULL AS INT64) AS is_missing,
+    f.type,
+    s.quota_external_id AS fund_type
+FROM `{TABELA_PROVISAO}` p
+INNER JOIN `kanastra-live.hub.funds` f ON f.id = p.fund_id
+LEFT JOIN sinqia s ON s.fund_id = p.fund_id
+WHERE p.acumulado > 0
+  AND p.date_ref BETWEEN @data_inicio AND @data_fim
+  AND (ARRAY_LENGTH(@fund_ids) = 0 OR p.fund_id IN UNNEST(@fund_ids))
+  AND (@servico IS NULL OR p.Service = @servico)
+"""
+
+
+def obter_marcas_dagua(client):
+    """Retorna a última date_ref persistida de cada fundo (fund_id, marca_dagua)"""
+    query = f"""
+    SELECT fund_id, MAX(date_ref) AS marca_dagua
+    FROM `{TABELA_PROVISAO}`
+    GROUP BY fund_id
+    """
+    df = client.query(query).to_dataframe()
+    df['marca_dagua'] = pd.to_datetime(df['marca_dagua'])
+    return df
+
+
+def calcular_janela_recalculo(marcas):
+    """Define a partir de quando cada fundo precisa ser recalculado
+
+    O recálculo começa no primeiro dia do mês da marca d'água, porque o
+    acumulado mensal reinicia a cada mês e depende de todos os dias anteriores.
+
+    Returns:
+        (DataFrame fund_id/inicio_recalculo, data de início global da janela)
+    """
+    marcas = marcas.copy()
+    marcas['inicio_recalculo'] = marcas['marca_dagua'].dt.to_period('M').dt.to_timestamp()
+
+    limite_ativo = marcas['marca_dagua'].max() - timedelta(days=DIAS_FUNDO_INATIVO)
+    ativos = marcas[marcas['marca_dagua'] >= limite_ativo]
+    inicio_global = ativos['inicio_recalculo'].min()
+
+    # Fundos inativos voltam a ser recalculados só dentro da janela global
+    marcas['inicio_recalculo'] = marcas['inicio_recalculo'].clip(lower=inicio_global)
+    return marcas[['fund_id', 'inicio_recalculo']], inicio_global
+
+
+def recortar_recalculo(y, janelas, inicio_global):
+    """Mantém, de cada fundo, só os dias a partir do seu início de recálculo
+
+    Fundos sem marca d'água (novos) entram a partir do início global.
+    """
+    y = y.merge(janelas, on='fund_id', how='left')
+    y['inicio_recalculo'] = y['inicio_recalculo'].fillna(inicio_global)
+    return y[y['date_ref'] >= y['inicio_recalculo']].drop(columns='inicio_recalculo')
+
+
+def _preparar_para_carga(df):
+    """Ajusta nomes e tipos do resultado `y` para o schema da tabela de provisões"""
+    df = df.rename(columns={'Gross Up': 'gross_up'}).drop(columns=['is_missing'])
+    df['date_ref'] = pd.to_datetime(df['date_ref']).dt.date
+    df['business_days_in_month'] = df['business_days_in_month'].astype('Int64')
+    df['calculado_em'] = pd.Timestamp(datetime.now())
+    return df[[campo.name for campo in SCHEMA_PROVISAO]]
+
+
+def _carregar_tabela(client, df, tabela):
+    """Sobrescreve `tabela` com o DataFrame (load job)"""
+    job_config = bigquery.LoadJobConfig(
+        schema=SCHEMA_PROVISAO,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+    )
+    client.load_table_from_dataframe(df, tabela, job_config=job_config).result()
+
+
+def atualizar_provisoes(client, reconstruir=False):
+    """Atualiza a tabela de provisões de forma incremental
+
+    Args:
+        reconstruir: True para recalcular todo o histórico (ex: taxa alterada retroativamente)
+
+    Returns:
+        Dict com o resumo da atualização (modo, linhas gravadas, início da janela)
+    """
+    pl_diario.atualizar_pl_diario(client)
+    fatores_correcao.atualizar_fatores(client)
+    marcas = pd.DataFrame() if reconstruir else obter_marcas_dagua(client)
+
+    if marcas.empty:
+        insumos = motor_taxas.carregar_insumos(client)
+        y = motor_taxas.calcular_provisoes(**insumos)
+        _carregar_tabela(client, _preparar_para_carga(y), TABELA_PROVISAO)
+        return {'modo': 'completo', 'linhas': len(y), 'inicio': None}
+
+    janelas, inicio_global = calcular_janela_recalculo(marcas)
+    data_corte = (inicio_global - timedelta(days=DIAS_LOOKBACK_PL)).date()
+
+    insumos = motor_taxas.carregar_insumos(client, data_inicio=data_corte)
+    y = motor_taxas.calcular_provisoes(**insumos)
+
+    y = recortar_recalculo(y, janelas, inicio_global)
+
+    if y.empty:
+        return {'modo': 'incremental', 'linhas': 0, 'inicio': inicio_global.date()}
+
+    tabela_stage = f"{TABELA_PROVISAO_STAGE}_{uuid.uuid4().hex}"
+    _carregar_tabela(client, _preparar_para_carga(y), tabela_stage)
+
+    # Substitui, em uma transação, os dias recalculados de cada fundo
+    query = f"""
+    BEGIN TRANSACTION;
+
+    DELETE FROM `{TABELA_PROVISAO}` p
+    WHERE p.date_ref >= (
+        SELECT MIN(s.date_ref)
+        FROM `{tabela_stage}` s
+        WHERE s.fund_id = p.fund_id
+    );
+
+    INSERT INTO `{TABELA_PROVISAO}`
+    SELECT * FROM `{tabela_stage}`;
+
+    COMMIT TRANSACTION;
+    """
+    try:
+        client.query(query).result()
+    finally:
+        client.delete_table(tabela_stage, not_found_ok=True)
+    return {'modo': 'incremental', 'linhas': len(y), 'inicio': inicio_global.date()}
+
+
+def ler_provisoes(client, data_inicio, data_fim, fund_ids=(), servico=None):
+    """Lê as provisões persistidas no formato da saída da Calculadora 5.0
+
+    Args:
+        fund_ids: IDs dos fundos (vazio = todos); a tabela é clusterizada por fund_id, Service
+        servico: Nome do serviço (None = todos)
+
+    Returns:
+        (DataFrame, bytes processados)
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter('data_inicio', 'DATE', data_inicio),
+            bigquery.ScalarQueryParameter('data_fim', 'DATE', data_fim),
+            bigquery.ArrayQueryParameter('fund_ids', 'INT64', list(fund_ids)),
+            bigquery.ScalarQueryParameter('servico', 'STRING', servico),
+        ]
+    )
+    query_job = client.query(QUERY_LEITURA, job_config=job_config)
+    df = query_job.to_dataframe()
+    return df, query_job.total_bytes_processed
@@ -0,0 +1,175 @@
+"""
+Registro de Cache - Calculadora 5.0
+`st.cache_data` com tags: cada função em cache declara as tabelas de que depende e uma
+escrita invalida só as funções daquela tabela, em vez de `st.cache_data.clear()` apagar
+todos os caches do processo (de todos os usuários). Mantém também entradas, tamanhos e
+taxa de acerto de cada função para o painel de administração
+"""
+import functools
+import inspect
+import pickle
+import threading
+import time
+import pandas as pd
+import streamlit as st
+
+# Tag das funções que só leem metadados (tokens de frescor, versão de alterações)
+TAG_METADADOS = 'metadados'
+
+
+class RegistroCache:
+    """Funções em cache por nome, com tags, contadores e entradas conhecidas
+
+    As entradas são acompanhadas pelo registro (o Streamlit não as expõe): cada miss
+    grava os argumentos, o tamanho serializado (o mesmo pickle que o `st.cache_data`
+    guarda) e o horário; TTL e `max_entries` são aplicados também aqui, então a lista
+    é uma aproximação do que o Streamlit mantém.
+    """
+
+    def __init__(self):
+        self._funcoes = {}
+        self._trava = threading.Lock()
+
+    def cache_data(self, *tags, **opcoes):
+        """Decorador equivalente a `st.cache_data(**opcoes)`, registrado com as tags
+
+        A função decorada mantém `.clear()` (limpa só ela). Funções redefinidas a cada
+        rerun (dentro de abas) reaproveitam o registro pelo nome.
+        """
+        def decorador(funcao):
+            nome = funcao.__name__
+            assinatura = inspect.signature(funcao)
+
+            @functools.wraps(funcao)
+            def carregar(*args, **kwargs):
+                valor = funcao(*args, **kwargs)
+                self._registrar_entrada(nome, assinatura, args, kwargs, valor)
+                return valor
+
+            em_cache = st.cache_data(**opcoes)(carregar)
+
+            @functools.wraps(funcao)
+            def chamar(*args, **kwargs):
+                with self._trava:
+                    self._funcoes[nome]['chamadas'] += 1
+                return em_cache(*args, **kwargs)
+
+            chamar.clear = lambda: self._limpar(nome)
+
+            with self._trava:
+                registro = self._funcoes.setdefault(
+                    nome, {'tags': set(), 'chamadas': 0, 'misses': 0, 'entradas': {}}
+                )
+                registro.update(
+                    funcao=em_cache, tags=set(tags),
+                    ttl=opcoes.get('ttl'), max_entradas=opcoes.get('max_entries'),
+                )
+            return chamar
+        return decorador
+
+    def _registrar_entrada(self, nome, assinatura, args, kwargs, valor):
+        try:
+            argumentos = assinatura.bind(*args, **kwargs).arguments
+            # Mesma regra do Streamlit: parâmetros com "_" não entram na chave
+            chave = repr({k: v for k, v in argumentos.items() if not k.startswith('_')})
+        except TypeError:
+            chave = repr((args, kwargs))
+        try:
+            tamanho = len(pickle.dumps(valor))
+        except Exception:
+            tamanho = 0
+        with self._trava:
+            registro = self._funcoes[nome]
+            registro['misses'] += 1
+            entradas = registro['entradas']
+            entradas.pop(chave, None)
+            entradas[chave] = {'bytes': tamanho, 'criado_em': time.time()}
+            max_entradas = registro['max_entradas']
+            while max_entradas and len(entradas) > max_entradas:
+                entradas.pop(next(iter(entradas)))
+
+    def _limpar(self, nome):
+        with self._trava:
+            registro = self._funcoes.get(nome)
+            if registro is None:
+                return
+            registro['entradas'].clear()
+            funcao = registro['funcao']
+        funcao.clear()
+
+    def invalidar(self, *tags):
+        """Limpa as funções que dependem de alguma das tags
+
+        Returns:
+            Nomes das funções limpas
+        """
+        with self._trava:
+            nomes = [nome for nome, registro in self._funcoes.items() if registro['tags'] & set(tags)]
+        for nome in nomes:
+            self._limpar(nome)
+        return nomes
+
+    def tags(self):
+        with self._trava:
+            return sorted(set().union(*(registro['tags'] for registro in self._funcoes.values())))
+
+    def estatisticas(self):
+        """Uma linha por função: tags, entradas, tamanho, chamadas, acertos e taxa de acerto"""
+        agora = time.time()
+        linhas = []
+        with self._trava:
+            for nome, registro in sorted(self._funcoes.items()):
+                ttl = _segundos(registro['ttl'])
+                entradas = [
+                    entrada for entrada in registro['entradas'].values()
+                    if ttl is None or agora - entrada['criado_em'] <= ttl
+                ]
+                acertos = max(registro['chamadas'] - registro['misses'], 0)
+                linhas.append({
+                    'funcao': nome,
+                    'tags': ', '.join(sorted(registro['tags'])),
+                    'entradas': len(entradas),
+                    'mb': sum(entrada['bytes'] for entrada in entradas) / 1024 / 1024,
+                    'chamadas': registro['chamadas'],
+                    'acertos': acertos,
+                    'taxa_acerto': acertos / registro['chamadas'] if registro['chamadas'] else None,
+                })
+        return pd.DataFrame(linhas)
+
+
+def _segundos(ttl):
+    """TTL do `st.cache_data` (segundos, timedelta ou texto) em segundos"""
+    if ttl is None:
+        return None
+    if isinstance(ttl, (int, float)):
+        return ttl
+    return pd.Timedelta(ttl).total_seconds()
+
+
+_registro = RegistroCache()
+
+
+def obter_registro():
+    """Registro do processo (o mesmo para todas as sessões, como o `st.cache_data`)"""
+    return _registro
+
+
+def mostrar_painel(registro=None):
+    """Painel de administração: entradas, tamanhos, taxa de acerto e invalidação por tag"""
+    registro = registro or _registro
+    estatisticas = registro.estatisticas()
+    if estatisticas.empty:
+        st.caption("Nenhuma função em cache registrada")
+        return
+    st.dataframe(
+        estatisticas,
+        hide_index=True,
+        column_config={
+            'mb': st.column_config.NumberColumn('MB', format='%.2f'),
+            'taxa_acerto': st.column_config.ProgressColumn('Taxa de acerto', min_value=0, max_value=1),
+        },
+    )
+    tag = st.selectbox("Tag", registro.tags(), key='registro_cache_tag')
+    if st.button("🧹 Invalidar tag", key='registro_cache_invalidar'):
+        limpas = registro.invalidar(tag)
+        st.success(f"✅ {len(limpas)} cache(s) limpo(s): {', '.join(limpas)}")
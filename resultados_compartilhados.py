@@ -0,0 +1,115 @@
+"""
+Resultados Compartilhados - Calculadora 5.0
+Mantém uma única cópia de cada resultado da calculadora por processo, compartilhada por
+todas as sessões do Streamlit. Cada sessão guarda apenas a chave do resultado e trabalha
+sobre visões filtradas: com o copy-on-write do pandas ativo, alterações em uma visão
+copiam apenas as colunas alteradas e nunca chegam ao resultado compartilhado
+"""
+import os
+import threading
+import time
+
+# Orçamento de memória para os resultados compartilhados (MB)
+LIMITE_MB_PADRAO = int(os.environ.get('CALCULADORA_MEMORIA_MB', '4096'))
+
+# Sessões sem acesso há mais que isso deixam de segurar resultados (segundos)
+INATIVIDADE_SESSAO = 3600
+
+
+def tamanho_bytes(df):
+    """Memória ocupada pelo DataFrame (inclui strings de colunas object)"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class ResultadosCompartilhados:
+    """Resultados por chave com contagem de sessões e remoção por orçamento de memória
+
+    Resultados sem sessões ativas são removidos primeiro (do menos usado recentemente
+    ao mais recente); se ainda faltar espaço, os demais seguem a mesma ordem. Uma sessão
+    cujo resultado foi removido recebe None em `obter` e recarrega (cache em disco ou query).
+
+    Args:
+        limite_bytes: Orçamento de memória (padrão: CALCULADORA_MEMORIA_MB)
+    """
+
+    def __init__(self, limite_bytes=None):
+        self.limite_bytes = limite_bytes if limite_bytes is not None else LIMITE_MB_PADRAO * 1024 * 1024
+        self._resultados = {}  # chave -> {'df', 'bytes', 'versao', 'ultimo_acesso'}
+        self._sessoes = {}  # id da sessão -> {'chave', 'ultimo_acesso'}
+        self._trava = threading.Lock()
+
+    def publicar(self, chave, df, id_sessao, versao=None):
+        """Registra o resultado da chave (substitui o anterior) e associa a sessão a ele
+
+        Args:
+            versao: Versão do arquivo no cache em disco de onde o DataFrame foi mapeado
+        """
+        with self._trava:
+            agora = time.time()
+            self._resultados[chave] = {
+                'df': df, 'bytes': tamanho_bytes(df), 'versao': versao, 'ultimo_acesso': agora,
+            }
+            self._sessoes[id_sessao] = {'chave': chave, 'ultimo_acesso': agora}
+            self._aplicar_limite(preservar=chave)
+        return df
+
+    def obter(self, chave, id_sessao, versao=None):
+        """Resultado compartilhado da chave (não alterar no lugar)
+
+        Retorna None se o resultado foi removido ou se `versao` indica que outro processo
+        publicou uma versão mais nova no cache em disco.
+        """
+        with self._trava:
+            entrada = self._resultados.get(chave)
+            agora = time.time()
+            self._sessoes[id_sessao] = {'chave': chave, 'ultimo_acesso': agora}
+            if entrada is None or (versao is not None and entrada['versao'] != versao):
+                return None
+            entrada['ultimo_acesso'] = agora
+            return entrada['df']
+
+    def _chaves_em_uso(self):
+        limite = time.time() - INATIVIDADE_SESSAO
+        for id_sessao in [s for s, info in self._sessoes.items() if info['ultimo_acesso'] < limite]:
+            del self._sessoes[id_sessao]
+        return {info['chave'] for info in self._sessoes.values()}
+
+    def _aplicar_limite(self, preservar=None):
+        total = sum(entrada['bytes'] for entrada in self._resultados.values())
+        em_uso = self._chaves_em_uso()
+        ordem = sorted(
+            self._resultados,
+            key=lambda chave: (chave in em_uso, self._resultados[chave]['ultimo_acesso'])
+        )
+        for chave in ordem:
+            if total <= self.limite_bytes:
+                break
+            if chave == preservar:
+                continue
+            total -= self._resultados.pop(chave)['bytes']
+
+    def memoria_por_sessao(self):
+        """Bytes referenciados por sessão (o resultado é compartilhado, não duplicado)"""
+        with self._trava:
+            return {
+                id_sessao: self._resultados[info['chave']]['bytes']
+                for id_sessao, info in self._sessoes.items()
+                if info['chave'] in self._resultados
+            }
+
+    def estatisticas(self):
+        """Resultados em memória, sessões ativas e bytes ocupados"""
+        with self._trava:
+            em_uso = self._chaves_em_uso()
+            return {
+                'resultados': len(self._resultados),
+                'sessoes': len(self._sessoes),
+                'resultados_em_uso': len(em_uso & set(self._resultados)),
+                'bytes': sum(entrada['bytes'] for entrada in self._resultados.values()),
+                'limite_bytes': self.limite_bytes,
+            }
+
+    def limpar(self):
+        """Descarta todos os resultados (as sessões recarregam no próximo acesso)"""
+        with self._trava:
+            self._resultados.clear()
@@ -0,0 +1,101 @@
+"""
+Tabelas de Taxas - Calculadora 5.0
+Mantém uma cópia de fee_minimo e fee_variavel por processo, compartilhada por todas as
+sessões do dashboard de gestão e indexada por (fund_id, servico, faixa). A tabela só é
+relida quando o token de frescor (modified) muda ou quando uma aprovação que a altera é
+confirmada; as sessões recebem a mesma visão, somente leitura
+"""
+import threading
+
+# Chave de uma linha de taxa (ordem da tabela compartilhada)
+CHAVE = ['fund_id', 'servico', 'faixa']
+
+
+class TabelaTaxas:
+    """Tabela de taxas ordenada pela chave, com índices para os formulários
+
+    `df` é compartilhado entre sessões: não alterar no lugar (com o copy-on-write do
+    pandas ativo, filtros e atribuições em cópias nunca chegam até ele).
+    """
+
+    def __init__(self, tabela, df, token_frescor=None):
+        self.tabela = tabela
+        self.token_frescor = token_frescor
+        self.df = df.sort_values(CHAVE, kind='stable').reset_index(drop=True)
+        self._por_chave = {chave: posicao for posicao, chave in enumerate(zip(*(self.df[c] for c in CHAVE)))}
+        self._por_cliente = self.df.groupby(['cliente', 'servico'], sort=False, dropna=False).indices
+        self._clientes = sorted(self.df['cliente'].dropna().unique().tolist())
+
+    @property
+    def vazia(self):
+        return self.df.empty
+
+    def clientes(self):
+        """Clientes distintos, em ordem alfabética"""
+        return self._clientes
+
+    def registros(self, cliente, servico):
+        """Linhas do cliente no serviço, ordenadas por fundo e faixa (DataFrame vazio se não houver)"""
+        return self.df.iloc[self._por_cliente.get((cliente, servico), [])]
+
+    def localizar(self, fund_id, servico, faixa):
+        """Linha da chave (fund_id, servico, faixa) ou None"""
+        posicao = self._por_chave.get((fund_id, servico, faixa))
+        return None if posicao is None else self.df.iloc[posicao]
+
+
+class RepositorioTaxas:
+    """Tabelas de taxas do processo, relidas por token de frescor ou invalidação
+
+    Sessões simultâneas que encontram a tabela desatualizada aguardam uma única leitura.
+    Se a leitura falhar, a versão anterior continua sendo servida.
+    """
+
+    def __init__(self):
+        self._tabelas = {}
+        self._invalidadas = set()
+        self._travas = {}
+        self._trava = threading.Lock()
+
+    def _trava_tabela(self, tabela):
+        with self._trava:
+            return self._travas.setdefault(tabela, threading.Lock())
+
+    def _atual(self, tabela, token_frescor):
+        with self._trava:
+            visao = self._tabelas.get(tabela)
+            if visao is not None and visao.token_frescor == token_frescor and tabela not in self._invalidadas:
+                return visao
+        return None
+
+    def obter(self, tabela, token_frescor, carregar):
+        """Visão da tabela para o token; relê com `carregar(tabela)` se estiver desatualizada
+
+        Args:
+            carregar: Função que devolve o DataFrame da tabela (None em caso de erro)
+
+        Returns:
+            `TabelaTaxas` ou None se a tabela nunca pôde ser carregada
+        """
+        visao = self._atual(tabela, token_frescor)
+        if visao is not None:
+            return visao
+        with self._trava_tabela(tabela):
+            # Outra sessão pode ter recarregado enquanto esta aguardava
+            visao = self._atual(tabela, token_frescor)
+            if visao is not None:
+                return visao
+            df = carregar(tabela)
+            if df is None:
+                with self._trava:
+                    return self._tabelas.get(tabela)
+            visao = TabelaTaxas(tabela, df, token_frescor)
+            with self._trava:
+                self._tabelas[tabela] = visao
+                self._invalidadas.discard(tabela)
+            return visao
+
+    def invalidar(self, *tabelas):
+        """Marca as tabelas para releitura no próximo acesso (ex.: após uma aprovação)"""
+        with self._trava:
+            self._invalidadas.update(tabela for tabela in tabelas if tabela in self._tabelas)
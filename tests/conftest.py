@@ -0,0 +1,15 @@
+"""Configuração dos testes: módulos da raiz do repositório importáveis e fixtures em CSV"""
+import os
+import sys
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRETORIO_FIXTURES = os.path.join(RAIZ, 'tests', 'fixtures')
+
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+
+def ler_fixture(*partes, **opcoes):
+    """Lê um CSV de tests/fixtures"""
+    return pd.read_csv(os.path.join(DIRETORIO_FIXTURES, *partes), **opcoes)
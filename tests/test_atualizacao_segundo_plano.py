@@ -0,0 +1,76 @@
+"""Trava de atualização entre processos: arquivo apagado ao liberar, sem corrida com quem já o abriu"""
+import fcntl
+import os
+import threading
+import pandas as pd
+import atualizacao_segundo_plano
+from atualizacao_segundo_plano import AtualizadorResultados
+from cache_resultados import CacheResultados
+
+
+def arquivos_trava(diretorio):
+    return [nome for nome in os.listdir(diretorio) if nome.endswith('.atualizacao.lock')]
+
+
+def test_recalculo_apaga_o_arquivo_da_trava(tmp_path):
+    atualizador = AtualizadorResultados(CacheResultados(str(tmp_path)))
+    liberar = threading.Event()
+
+    def calcular():
+        liberar.wait(5)
+        return pd.DataFrame({'valor': [1.0]}), {}
+
+    assert atualizador.agendar('a', calcular)
+    assert arquivos_trava(tmp_path) == ['a.atualizacao.lock']
+    # Outro processo (outra instância) não obtém a trava enquanto o recálculo roda
+    assert AtualizadorResultados(atualizador.cache)._travar_arquivo('a') is None
+
+    liberar.set()
+    while atualizador.em_andamento('a'):
+        threading.Event().wait(0.01)
+    assert arquivos_trava(tmp_path) == []
+    assert atualizador.cache.versao_atual('a') is not None
+
+
+def test_trava_em_arquivo_apagado_nao_vale(tmp_path):
+    """Quem abriu o arquivo antes de ele ser apagado não pode ficar com uma trava órfã"""
+    primeiro = AtualizadorResultados(CacheResultados(str(tmp_path)))
+    segundo = AtualizadorResultados(primeiro.cache)
+
+    trava = primeiro._travar_arquivo('a')
+    antigo = open(primeiro._caminho_trava('a'), 'a')  # aberto antes da liberação
+    primeiro._liberar_arquivo('a', trava)
+
+    # O arquivo antigo pode ser travado, mas não exclui mais ninguém
+    fcntl.flock(antigo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    nova = segundo._travar_arquivo('a')
+    assert nova is not None
+    assert os.fstat(nova.fileno()).st_ino == os.stat(segundo._caminho_trava('a')).st_ino
+    assert primeiro._travar_arquivo('a') is None
+
+    fcntl.flock(antigo, fcntl.LOCK_UN)
+    antigo.close()
+    segundo._liberar_arquivo('a', nova)
+    assert arquivos_trava(tmp_path) == []
+
+
+def test_tentativa_com_arquivo_antigo_refaz_a_trava(tmp_path, monkeypatch):
+    """Corrida: a abertura acontece antes da liberação e o `flock` depois; a trava é refeita"""
+    primeiro = AtualizadorResultados(CacheResultados(str(tmp_path)))
+    trava = primeiro._travar_arquivo('a')
+    antigo = open(primeiro._caminho_trava('a'), 'a')
+    primeiro._liberar_arquivo('a', trava)
+
+    aberturas = []
+
+    def abrir(caminho, modo):
+        aberturas.append(caminho)
+        return antigo if len(aberturas) == 1 else open(caminho, modo)
+
+    monkeypatch.setattr(atualizacao_segundo_plano, 'open', abrir, raising=False)
+    nova = AtualizadorResultados(primeiro.cache)._travar_arquivo('a')
+
+    assert len(aberturas) == 2
+    assert antigo.closed
+    assert os.fstat(nova.fileno()).st_ino == os.stat(primeiro._caminho_trava('a')).st_ino
+    nova.close()
@@ -0,0 +1,77 @@
+"""Manifesto do cache em disco: leituras com trava compartilhada, sem regravação"""
+import fcntl
+import os
+import threading
+import pandas as pd
+from cache_resultados import CacheResultados
+
+
+def resultado(n=1000):
+    return pd.DataFrame({'fund_id': range(n), 'valor': [float(i) for i in range(n)]})
+
+
+def estado_manifesto(cache):
+    info = os.stat(cache._caminho_manifesto)
+    return info.st_ino, info.st_mtime_ns
+
+
+def test_consultas_nao_regravam_o_manifesto(tmp_path):
+    cache = CacheResultados(str(tmp_path))
+    cache.gravar('a', resultado())
+    antes = estado_manifesto(cache)
+
+    df, _ = cache.ler('a')
+    assert len(df) == 1000
+    assert cache.ler('ausente') is None
+    cache.versao_atual('a')
+    cache.informacoes('a')
+    cache.estatisticas()
+
+    assert estado_manifesto(cache) == antes
+
+
+def test_leitores_simultaneos(tmp_path):
+    """Um leitor segurando a trava compartilhada não bloqueia outro"""
+    cache = CacheResultados(str(tmp_path))
+    cache.gravar('a', resultado())
+
+    with open(cache._caminho_trava, 'a') as trava:
+        fcntl.flock(trava, fcntl.LOCK_SH)
+        try:
+            leitura = threading.Thread(target=cache.ler, args=('a',))
+            leitura.start()
+            leitura.join(timeout=5)
+            assert not leitura.is_alive()
+        finally:
+            fcntl.flock(trava, fcntl.LOCK_UN)
+
+
+def test_lru_pelo_ultimo_acesso(tmp_path):
+    cache = CacheResultados(str(tmp_path))
+    cache.gravar('a', resultado())
+    cache.gravar('b', resultado())
+    # Gravações "antigas"; a leitura de 'a' renova o acesso sem tocar no manifesto
+    for chave, idade in (('a', 200), ('b', 100)):
+        os.utime(cache._caminho(cache.informacoes(chave)['arquivo']), (0, os.path.getmtime(cache._caminho_manifesto) - idade))
+    cache.ler('a')
+    assert cache.informacoes('a')['ultimo_acesso'] > cache.informacoes('b')['ultimo_acesso']
+
+    cache.limite_bytes = cache.estatisticas()['bytes']
+    cache.gravar('c', resultado())
+
+    assert cache.versao_atual('a') is not None
+    assert cache.versao_atual('b') is None
+    assert cache.versao_atual('c') is not None
+
+
+def test_arquivo_ausente_remove_so_a_versao_lida(tmp_path):
+    cache = CacheResultados(str(tmp_path))
+    cache.gravar('a', resultado())
+    os.remove(cache._caminho(cache.informacoes('a')['arquivo']))
+
+    assert cache.ler('a') is None
+    assert cache.versao_atual('a') is None
+
+    versao = cache.gravar('a', resultado())
+    cache._remover_versao('a', 'outra')
+    assert cache.versao_atual('a') == versao
@@ -0,0 +1,144 @@
+"""Download Arrow com um cliente falso que serve RecordBatches (Storage Read API e REST)"""
+from collections import namedtuple
+from datetime import date
+import pandas as pd
+import pyarrow as pa
+import pytest
+import download_arrow
+import tipos_compactos
+
+CampoFalso = namedtuple('CampoFalso', ['name', 'field_type'])
+
+SCHEMA = [
+    CampoFalso('date_ref', 'DATE'),
+    CampoFalso('fund_id', 'INTEGER'),
+    CampoFalso('fund_name', 'STRING'),
+    CampoFalso('Service', 'STRING'),
+    CampoFalso('acumulado', 'FLOAT64'),
+]
+
+
+def lotes(n_lotes=3, por_lote=40):
+    """Resultado da calculadora em RecordBatches (poucos fundos/serviços, muitas linhas)"""
+    resultado = []
+    for i in range(n_lotes):
+        linhas = range(i * por_lote, (i + 1) * por_lote)
+        resultado.append(pa.record_batch({
+            'date_ref': pa.array([date(2025, 1, 1 + k % 28) for k in linhas], pa.date32()),
+            'fund_id': pa.array([10 + k % 3 for k in linhas], pa.int64()),
+            'fund_name': pa.array([f'Fundo {k % 3}' for k in linhas], pa.string()),
+            'Service': pa.array(['Administração' if k % 2 else 'Gestão' for k in linhas], pa.string()),
+            'acumulado': pa.array([k * 1.5 for k in linhas], pa.float64()),
+        }))
+    return resultado
+
+
+class StorageRecusada(Exception):
+    pass
+
+
+class LinhasFalsas:
+    """RowIterator falso: `to_arrow_iterable` devolve os lotes; a via Storage pode falhar no meio"""
+
+    def __init__(self, job):
+        self._job = job
+        self.schema = SCHEMA
+        self.total_rows = sum(lote.num_rows for lote in job.lotes)
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        self._job.vias.append('storage' if bqstorage_client is not None else 'rest')
+        for posicao, lote in enumerate(self._job.lotes):
+            if bqstorage_client is not None and self._job.falhar_storage_no_lote == posicao:
+                raise StorageRecusada('403 bigquery.readsessions.create')
+            yield lote
+
+
+class JobFalso:
+    def __init__(self, lotes, falhar_storage_no_lote=None):
+        self.lotes = lotes
+        self.falhar_storage_no_lote = falhar_storage_no_lote
+        self.chamadas_result = 0
+        self.vias = []
+
+    def result(self):
+        self.chamadas_result += 1
+        return LinhasFalsas(self)
+
+
+CLIENTE_LEITURA = object()
+
+
+def referencia():
+    """Resultado esperado montado direto pelo pandas, sem o download"""
+    return pa.Table.from_batches(lotes()).to_pandas(date_as_object=False)
+
+
+def test_api_rest():
+    progresso = []
+    tabela, schema, tempos = download_arrow.baixar_arrow(JobFalso(lotes()), progresso=lambda b, t: progresso.append((b, t)))
+
+    assert tempos['via'] == 'rest'
+    assert tempos['linhas'] == 120
+    assert schema == SCHEMA
+    assert progresso == [(40, 120), (80, 120), (120, 120)]
+    assert tabela.equals(pa.Table.from_batches(lotes()))
+
+
+def test_storage_read_api():
+    job = JobFalso(lotes())
+    tabela, _, tempos = download_arrow.baixar_arrow(job, cliente_leitura=CLIENTE_LEITURA)
+
+    assert tempos['via'] == 'storage'
+    assert job.vias == ['storage']
+    assert tabela.num_rows == 120
+
+
+@pytest.mark.parametrize('lote_com_falha', [0, 2])
+def test_falha_da_storage_refaz_pela_api_rest(lote_com_falha):
+    """Recusa no início ou no meio do download: lotes já baixados são descartados"""
+    job = JobFalso(lotes(), falhar_storage_no_lote=lote_com_falha)
+    tabela, _, tempos = download_arrow.baixar_arrow(job, cliente_leitura=CLIENTE_LEITURA)
+
+    assert tempos['via'] == 'rest'
+    assert job.vias == ['storage', 'rest']
+    assert job.chamadas_result == 2
+    assert tabela.equals(pa.Table.from_batches(lotes()))
+
+
+def test_falha_sem_storage_propaga():
+    class LinhasComErro(LinhasFalsas):
+        def to_arrow_iterable(self, bqstorage_client=None):
+            raise RuntimeError('falha de rede')
+            yield
+
+    job = JobFalso(lotes())
+    job.result = lambda: LinhasComErro(job)
+    with pytest.raises(RuntimeError):
+        download_arrow.baixar_arrow(job)
+
+
+def test_resultado_vazio():
+    df, schema, tempos = download_arrow.baixar_dataframe(JobFalso([]))
+
+    assert df.empty
+    assert list(df.columns) == [campo.name for campo in SCHEMA]
+    assert tempos['linhas'] == 0
+
+
+@pytest.mark.parametrize('falhar_storage_no_lote', [None, 1])
+def test_tipos_iguais_a_tipos_compactos(falhar_storage_no_lote):
+    """Pelas duas vias, o DataFrame baixado tem os mesmos dtypes de `compactar` aplicado ao resultado"""
+    job = JobFalso(lotes(), falhar_storage_no_lote=falhar_storage_no_lote)
+    df, economia, tempos = tipos_compactos.carregar_compacto(job, cliente_leitura=CLIENTE_LEITURA)
+    esperado, _ = tipos_compactos.compactar(referencia(), schema=SCHEMA)
+
+    assert tempos['via'] == ('storage' if falhar_storage_no_lote is None else 'rest')
+    assert df.dtypes.to_dict() == esperado.dtypes.to_dict()
+    pd.testing.assert_frame_equal(df, esperado)
+
+    assert pd.api.types.is_datetime64_any_dtype(df['date_ref'])
+    assert df['fund_id'].dtype == 'int8'
+    assert isinstance(df['fund_name'].dtype, pd.CategoricalDtype)
+    assert isinstance(df['Service'].dtype, pd.CategoricalDtype)
+    assert df['acumulado'].dtype == 'float64'
+    assert economia['bytes_depois'] <= economia['bytes_antes']
@@ -0,0 +1,67 @@
+"""
+Período passado x histórico completo: com PL e dias úteis cortados na mesma data
+(`motor_taxas.recortar_janela`, os limites de Calculadora 5.0.sql), as linhas do período
+devem ser as mesmas do histórico completo recortado
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import ler_fixture
+import motor_taxas
+
+# PL diário de dez/2024 a abr/2025: o histórico continua depois dos períodos testados
+DIAS = pd.bdate_range('2024-12-02', '2025-04-30')
+
+
+def insumos_historico():
+    fundos = ler_fixture('calculadora', 'fundos.csv')
+    pl = pd.DataFrame([
+        {'fund_id': fund_id, 'reference_dt': dia.date(), 'net_worth': valor, 'net_worth_positivo': valor}
+        for fund_id, base in ((10, 1_000_000.0), (41, 150_000.0))
+        for i, dia in enumerate(DIAS)
+        for valor in [base * (1 + 0.5 * np.sin(i / 3))]
+    ])
+    return {
+        'pl': pl,
+        'fee_variavel': ler_fixture('calculadora', 'fee_variavel.csv'),
+        'fee_minimo': ler_fixture('calculadora', 'fee_minimo.csv'),
+        'dias_uteis': pd.Series(DIAS.date),
+        'fundos': fundos,
+        'gross_up': ler_fixture('calculadora', 'gross_up.csv'),
+        'carteira': ler_fixture('calculadora', 'carteira.csv'),
+        'fatores': ler_fixture('calculadora', 'fatores.csv'),
+    }
+
+
+@pytest.mark.parametrize('data_inicio, data_fim', [
+    ('2025-01-01', '2025-01-31'),  # mês passado
+    ('2025-01-15', '2025-02-12'),  # período personalizado, fim no meio do mês
+    ('2025-03-03', '2025-03-03'),  # um único dia
+])
+def test_periodo_passado_igual_ao_historico_recortado(data_inicio, data_fim):
+    insumos = insumos_historico()
+    completo = motor_taxas.filtrar_periodo(motor_taxas.calcular_provisoes(**insumos), data_inicio, data_fim)
+    periodo = motor_taxas.filtrar_periodo(
+        motor_taxas.calcular_provisoes(**motor_taxas.recortar_janela(insumos, data_inicio, data_fim)),
+        data_inicio, data_fim,
+    )
+
+    assert not completo.empty
+    divergencias = motor_taxas.comparar_com_sql(
+        periodo, completo, tolerancia=1e-9,
+        colunas=('net_worth', 'fee_variavel_diario', 'fee_min_diario', 'acumulado', 'diferenca'),
+    )
+    assert divergencias.empty, divergencias.to_string()
+
+
+def test_calendario_cortado_sem_cortar_pl_desalinha_seq():
+    # Regressão: PL sem limite superior e calendário cortado no fim do mês de data_fim
+    data_inicio, data_fim = '2025-01-01', '2025-01-31'
+    insumos = insumos_historico()
+    completo = motor_taxas.filtrar_periodo(motor_taxas.calcular_provisoes(**insumos), data_inicio, data_fim)
+    recortados = motor_taxas.recortar_janela(insumos, data_inicio, data_fim)
+    recortados['pl'] = insumos['pl'][pd.to_datetime(insumos['pl']['reference_dt']) >= pd.Timestamp('2024-12-01')]
+    periodo = motor_taxas.filtrar_periodo(motor_taxas.calcular_provisoes(**recortados), data_inicio, data_fim)
+
+    divergencias = motor_taxas.comparar_com_sql(periodo, completo, colunas=('net_worth', 'acumulado'))
+    assert not divergencias.empty
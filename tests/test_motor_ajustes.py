@@ -0,0 +1,181 @@
+"""Junção por intervalo de motor_ajustes contra o loop original (um ajuste por vez)"""
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+import motor_ajustes
+
+COL = 'acumulado'
+
+
+def loop_original(df, ajustes_ativos, col_acumulado):
+    """Loop por ajuste do dashboard antes da vetorização (sem os avisos de debug)"""
+    df = df.copy()
+    ajustes_aplicados = []
+    for _, ajuste in ajustes_ativos.iterrows():
+        # Compatibilidade: waivers usam fund_name, descontos usam fund_id
+        if 'fund_name' in ajuste and pd.notnull(ajuste.get('fund_name')):
+            fund_identifier = ajuste['fund_name']
+            mask_campo = 'fund_name'
+        else:
+            fund_identifier = ajuste.get('fund_id')
+            mask_campo = 'fund_id'
+
+        valor = ajuste.get('valor', 0)
+        tipo_desconto = ajuste.get('tipo_desconto', 'Fixo')
+        percentual = ajuste.get('percentual_desconto', 0)
+        forma_aplicacao = ajuste.get('forma_aplicacao', 'Provisionado')
+        categoria = ajuste.get('categoria', 'waiver')
+        servico = ajuste.get('servico')
+
+        if valor > 0 or percentual > 0:
+            mask_fundo = (df[mask_campo] == fund_identifier)
+            if 'date_ref' in df.columns:
+                mask_fundo = mask_fundo & (
+                    (df['date_ref'].dt.date >= ajuste['data_inicio']) &
+                    (df['date_ref'].dt.date <= ajuste['data_fim'])
+                )
+            if servico and ('Service' in df.columns or 'servico' in df.columns):
+                col_servico = 'Service' if 'Service' in df.columns else 'servico'
+                mask_fundo = mask_fundo & (df[col_servico] == servico)
+
+            if mask_fundo.sum() > 0:
+                if tipo_desconto == 'Percentual':
+                    valor_total_aplicado = (df.loc[mask_fundo, col_acumulado] * (percentual / 100)).sum()
+                else:
+                    valor_total_aplicado = valor
+
+                if forma_aplicacao == "Provisionado":
+                    qtd_registros = mask_fundo.sum()
+                    if tipo_desconto == 'Percentual':
+                        df.loc[mask_fundo, col_acumulado] = df.loc[mask_fundo, col_acumulado] * (1 - percentual/100)
+                    else:
+                        valor_por_registro = valor / qtd_registros if qtd_registros > 0 else 0
+                        df.loc[mask_fundo, col_acumulado] = df.loc[mask_fundo, col_acumulado] - valor_por_registro
+                    ajustes_aplicados.append(
+                        f"{fund_identifier} ({categoria}): R$ {valor_total_aplicado:,.2f} {tipo_desconto} Provisionado"
+                    )
+                else:
+                    idx_ultimo = df[mask_fundo].index.max()
+                    if pd.notnull(idx_ultimo):
+                        if tipo_desconto == 'Percentual':
+                            df.at[idx_ultimo, col_acumulado] = df.at[idx_ultimo, col_acumulado] * (1 - percentual/100)
+                        else:
+                            df.at[idx_ultimo, col_acumulado] = df.at[idx_ultimo, col_acumulado] - valor
+                        ajustes_aplicados.append(
+                            f"{fund_identifier} ({categoria}): R$ {valor_total_aplicado:,.2f} {tipo_desconto} Não Provisionado"
+                        )
+    return df, ajustes_aplicados
+
+
+def mensagens(resumo):
+    """Mensagens montadas pelo dashboard a partir do resumo vetorizado"""
+    return [
+        f"{a.fundo} ({a.categoria}): R$ {a.valor_total_aplicado:,.2f} {a.tipo_desconto} "
+        f"{'Provisionado' if a.provisionado else 'Não Provisionado'}"
+        for a in resumo.itertuples(index=False)
+    ]
+
+
+def resultado_calculadora():
+    """Dois fundos, dois serviços, dias úteis de jan-fev/2025 (índice embaralhado)"""
+    dias = pd.bdate_range('2025-01-02', '2025-02-28')
+    fundos = [(10, 'Fundo A'), (41, 'Fundo B')]
+    linhas = [
+        {'date_ref': dia, 'fund_id': fund_id, 'fund_name': nome, 'Service': servico,
+         COL: 100.0 + 10 * fund_id + i + (5 if servico == 'Gestão' else 0)}
+        for fund_id, nome in fundos for servico in ('Administração', 'Gestão') for i, dia in enumerate(dias)
+    ]
+    df = pd.DataFrame(linhas)
+    # Índice fora de ordem: "último registro" do Não Provisionado é o maior rótulo, não a última data
+    return df.set_index(np.random.default_rng(7).permutation(len(df)) * 3)
+
+
+def ajuste(fund_name=None, fund_id=None, data_inicio=date(2025, 1, 1), data_fim=date(2025, 1, 31), **campos):
+    base = {'fund_id': fund_id, 'fund_name': fund_name, 'categoria': 'waiver', 'tipo_desconto': 'Percentual',
+            'valor': 0.0, 'percentual_desconto': 0.0, 'forma_aplicacao': 'Provisionado', 'servico': None,
+            'data_inicio': data_inicio, 'data_fim': data_fim}
+    base.update(campos)
+    return base
+
+
+CORPUS = {
+    'percentual_vs_fixo': [
+        ajuste('Fundo A', percentual_desconto=50, servico='Administração'),
+        ajuste(fund_id=41, categoria='desconto', tipo_desconto='Fixo', valor=900.0, servico='Gestão'),
+        ajuste('Fundo A', tipo_desconto='Fixo', valor=120.0, forma_aplicacao='Nao_Provisionado'),
+        ajuste(fund_id=41, percentual_desconto=10, forma_aplicacao='Nao_Provisionado', servico=''),
+    ],
+    'periodos_sobrepostos': [
+        ajuste('Fundo A', percentual_desconto=20, data_inicio=date(2025, 1, 10), data_fim=date(2025, 2, 10)),
+        ajuste('Fundo A', percentual_desconto=30, data_inicio=date(2025, 1, 20), data_fim=date(2025, 2, 20),
+               servico='Gestão'),
+        ajuste('Fundo A', tipo_desconto='Fixo', valor=250.0, data_inicio=date(2025, 2, 1), data_fim=date(2025, 2, 28)),
+        ajuste('Fundo A', percentual_desconto=100, forma_aplicacao='Nao_Provisionado',
+               data_inicio=date(2025, 2, 5), data_fim=date(2025, 2, 5)),
+        ajuste(fund_id=41, percentual_desconto=15, data_inicio=date(2025, 1, 15), data_fim=date(2025, 1, 31)),
+        ajuste(fund_id=41, tipo_desconto='Fixo', valor=60.0, forma_aplicacao='Nao_Provisionado',
+               data_inicio=date(2025, 1, 1), data_fim=date(2025, 1, 20)),
+    ],
+    # data_fim NULL: a comparação `<= None` do loop não casa nenhuma linha, e a junção mantém isso
+    'data_fim_aberta': [
+        ajuste('Fundo A', percentual_desconto=40, data_fim=None),
+        ajuste(fund_id=41, tipo_desconto='Fixo', valor=500.0, data_fim=None, servico='Administração'),
+        ajuste('Fundo B', percentual_desconto=5, data_inicio=date(2025, 2, 1), data_fim=date(2025, 2, 28)),
+    ],
+    'inativos_e_sem_par': [
+        ajuste('Fundo A'),  # valor e percentual zerados
+        ajuste('Fundo Z', percentual_desconto=50),
+        ajuste(fund_id=99, tipo_desconto='Fixo', valor=10.0),
+        ajuste('Fundo B', percentual_desconto=50, servico='Custódia'),
+        ajuste('Fundo A', percentual_desconto=50, data_inicio=date(2024, 1, 1), data_fim=date(2024, 12, 31)),
+    ],
+}
+
+
+def corpus_aleatorio(n=60, semente=11):
+    """Ajustes sorteados (sempre os mesmos) misturando todos os casos acima"""
+    rng = np.random.default_rng(semente)
+    dias = pd.date_range('2024-12-15', '2025-03-15').date
+    ajustes = []
+    for _ in range(n):
+        inicio = dias[rng.integers(len(dias))]
+        fim = None if rng.random() < 0.15 else dias[rng.integers(len(dias))]
+        percentual = rng.random() < 0.5
+        por_nome = rng.random() < 0.5
+        fund_id = int(rng.choice([10, 41]))
+        ajustes.append(ajuste(
+            fund_name={10: 'Fundo A', 41: 'Fundo B'}[fund_id] if por_nome else None,
+            fund_id=fund_id,
+            data_inicio=inicio,
+            data_fim=fim,
+            categoria='waiver' if por_nome else 'desconto',
+            tipo_desconto='Percentual' if percentual else 'Fixo',
+            percentual_desconto=float(rng.choice([0, 10, 25, 100])) if percentual else 0.0,
+            valor=0.0 if percentual else float(rng.choice([0, 50, 333.33])),
+            forma_aplicacao=str(rng.choice(['Provisionado', 'Nao_Provisionado'])),
+            servico=rng.choice([None, '', 'Administração', 'Gestão']),
+        ))
+    return ajustes
+
+
+@pytest.mark.parametrize('nome', [*CORPUS, 'aleatorio'])
+def test_juncao_igual_ao_loop_original(nome):
+    df = resultado_calculadora()
+    ajustes = pd.DataFrame(corpus_aleatorio() if nome == 'aleatorio' else CORPUS[nome])
+
+    esperado, mensagens_esperadas = loop_original(df, ajustes, COL)
+    obtido, resumo = motor_ajustes.aplicar_ajustes(df, ajustes, COL, 'Service')
+
+    pd.testing.assert_frame_equal(obtido, esperado, check_exact=False, rtol=1e-12)
+    assert mensagens(resumo) == mensagens_esperadas
+
+
+def test_corpus_altera_o_resultado():
+    """Garante que os cenários não são vazios: cada um ajusta ao menos uma linha"""
+    df = resultado_calculadora()
+    for ajustes in [*CORPUS.values(), corpus_aleatorio()]:
+        obtido, resumo = motor_ajustes.aplicar_ajustes(df, pd.DataFrame(ajustes), COL, 'Service')
+        if ajustes is not CORPUS['inativos_e_sem_par']:
+            assert not resumo.empty
+            assert not np.allclose(obtido[COL], df[COL])
@@ -0,0 +1,94 @@
+"""Script de aprovação: conferências das faixas originais antes de cada MERGE"""
+import pytest
+import motor_aprovacao
+
+
+def alteracao(id_, tabela, tipo, **dados):
+    base = {'fund_id': 10, 'servico': 'Administração', 'cliente': 'Cliente A', 'empresa': 'Kanastra'}
+    base.update(dados)
+    return {'id': id_, 'tabela': tabela, 'tipo_alteracao': tipo, 'dados': base}
+
+
+SOLICITACAO = [
+    alteracao('1', 'fee_variavel', 'UPDATE', faixa=0, original_faixa=0, fee_variavel=0.01),
+    alteracao('2', 'fee_variavel', 'INSERT', faixa=1_000_000, fee_variavel=0.005),
+    alteracao('3', 'fee_minimo', 'UPDATE', faixa=0, original_lower=0, fee_min=1500),
+]
+
+
+def test_conferencias_antes_de_cada_merge():
+    script, parametros, linhas = motor_aprovacao.compilar_aprovacao(SOLICITACAO, 'aprovador')
+
+    assert linhas == {'fee_minimo': 1, 'fee_variavel': 2}
+    assert script.index('BEGIN TRANSACTION;') < script.index('ASSERT')
+    for tabela in ('fee_minimo', 'fee_variavel'):
+        merge = script.index(f"MERGE `kanastra-live.finance.{tabela}`")
+        repetidas = script.index(f"'{tabela}: a solicitação altera a mesma faixa mais de uma vez")
+        ausentes = script.index(f"'{tabela}: faixa original de uma alteração não encontrada")
+        assert repetidas < ausentes < merge
+        assert f"LEFT JOIN `kanastra-live.finance.{tabela}` T" in script
+    assert script.index('ASSERT NOT EXISTS') > script.index('Solicitação já processada')
+    assert script.rindex('ASSERT') < script.index('COMMIT TRANSACTION;')
+    assert {p.name for p in parametros} >= {'fee_minimo', 'fee_variavel', 'ids'}
+
+
+def test_sem_taxas_sem_conferencias():
+    desconto = {'id': '9', 'tabela': 'desconto', 'tipo_alteracao': 'INSERT',
+                'dados': {'fund_id': 10, 'data_inicio': '2025-01-01', 'valor_desconto': 100}}
+    script, _, linhas = motor_aprovacao.compilar_aprovacao([desconto], 'aprovador')
+
+    assert linhas == {'descontos': 1}
+    assert 'MERGE' not in script
+    assert 'ASSERT NOT EXISTS' not in script
+
+
+def test_solicitacao_vazia_nao_executa():
+    for funcao in (motor_aprovacao.aprovar_solicitacao, motor_aprovacao.rejeitar_solicitacao):
+        with pytest.raises(ValueError, match='sem linhas pendentes'):
+            funcao(None, [], 'aprovador')
+
+
+def linhas_merge(parametros, tabela):
+    """Valores de cada STRUCT do parâmetro ARRAY da tabela, na ordem da solicitação"""
+    array = next(p for p in parametros if p.name == tabela)
+    assert array.array_type == 'STRUCT'
+    return [struct.struct_values for struct in array.values]
+
+
+def test_parametros_das_linhas_de_taxa():
+    solicitacao = [
+        # fee_minimo: faixa original vem de original_lower (original_faixa é ignorado)
+        alteracao('1', 'fee_minimo', 'UPDATE', faixa=500_000, original_lower=250_000, original_faixa=1, fee_min=1500),
+        alteracao('2', 'fee_minimo', 'INSERT', faixa=0, fee_min=900, fee_variavel=0.5),
+        # fee_variavel: original_faixa tem precedência sobre original_lower
+        alteracao('3', 'fee_variavel', 'UPDATE', faixa=2_000_000, original_faixa=1_000_000, original_lower=7,
+                  fee_variavel=0.004, fee_min=99),
+        alteracao('4', 'fee_variavel', 'UPDATE', faixa=3_000_000, original_lower=2_500_000, fee_variavel=0.003),
+        alteracao('5', 'fee_variavel', 'INSERT', faixa=0, fee_variavel=0.01),
+        # DELETE não tem ramo próprio no MERGE: entra como UPDATE (localizado pela faixa original)
+        alteracao('6', 'fee_variavel', 'DELETE', faixa=4_000_000, fee_variavel=0.002),
+    ]
+    _, parametros, linhas = motor_aprovacao.compilar_aprovacao(solicitacao, 'aprovador')
+
+    assert linhas == {'fee_minimo': 2, 'fee_variavel': 4}
+    campos = lambda valores: {c: valores[c] for c in ('tipo', 'fund_id', 'faixa', 'faixa_original', 'valor')}
+    assert [campos(v) for v in linhas_merge(parametros, 'fee_minimo')] == [
+        {'tipo': 'UPDATE', 'fund_id': 10, 'faixa': 500_000.0, 'faixa_original': 250_000.0, 'valor': 1500.0},
+        {'tipo': 'INSERT', 'fund_id': 10, 'faixa': 0.0, 'faixa_original': 0.0, 'valor': 900.0},
+    ]
+    assert [campos(v) for v in linhas_merge(parametros, 'fee_variavel')] == [
+        {'tipo': 'UPDATE', 'fund_id': 10, 'faixa': 2_000_000.0, 'faixa_original': 1_000_000.0, 'valor': 0.004},
+        {'tipo': 'UPDATE', 'fund_id': 10, 'faixa': 3_000_000.0, 'faixa_original': 2_500_000.0, 'valor': 0.003},
+        {'tipo': 'INSERT', 'fund_id': 10, 'faixa': 0.0, 'faixa_original': 0.0, 'valor': 0.01},
+        {'tipo': 'UPDATE', 'fund_id': 10, 'faixa': 4_000_000.0, 'faixa_original': 4_000_000.0, 'valor': 0.002},
+    ]
+    primeira = linhas_merge(parametros, 'fee_minimo')[0]
+    assert (primeira['empresa'], primeira['cliente'], primeira['servico']) == ('Kanastra', 'Cliente A', 'Administração')
+
+    ids = next(p for p in parametros if p.name == 'ids')
+    assert ids.values == ['1', '2', '3', '4', '5', '6']
+
+
+def test_tabela_desconhecida():
+    with pytest.raises(ValueError, match='fee_maximo'):
+        motor_aprovacao.compilar_aprovacao([alteracao('1', 'fee_maximo', 'INSERT', faixa=0)], 'aprovador')
@@ -0,0 +1,57 @@
+"""
+Motor local x Calculadora 5.0.sql sobre o dataset de referência em
+tests/fixtures/calculadora (saida_sql.csv = saída `y` esperada da query para os insumos)
+
+Dataset: fundo 10 (seq = seq1 - 1, duas faixas variáveis, gross up de 10% em
+Administração e provisão em carteira) e fundo 41 (seq = seq1, fator de correção 1,05)
+"""
+import pandas as pd
+from conftest import ler_fixture
+import motor_taxas
+
+
+def insumos_referencia():
+    """Insumos no formato de `motor_taxas.carregar_insumos`"""
+    return {
+        'pl': ler_fixture('calculadora', 'pl.csv'),
+        'fee_variavel': ler_fixture('calculadora', 'fee_variavel.csv'),
+        'fee_minimo': ler_fixture('calculadora', 'fee_minimo.csv'),
+        'dias_uteis': ler_fixture('calculadora', 'dias_uteis.csv')['date'],
+        'fundos': ler_fixture('calculadora', 'fundos.csv'),
+        'gross_up': ler_fixture('calculadora', 'gross_up.csv'),
+        'carteira': ler_fixture('calculadora', 'carteira.csv'),
+        'fatores': ler_fixture('calculadora', 'fatores.csv'),
+    }
+
+
+def test_motor_reproduz_saida_sql():
+    df_sql = ler_fixture('calculadora', 'saida_sql.csv')
+    df_motor = motor_taxas.calcular_provisoes(**insumos_referencia())
+
+    divergencias = motor_taxas.comparar_com_sql(df_motor, df_sql)
+
+    assert divergencias.empty, divergencias.to_string()
+
+
+def test_motor_reproduz_colunas_de_taxa():
+    df_sql = ler_fixture('calculadora', 'saida_sql.csv')
+    df_motor = motor_taxas.calcular_provisoes(**insumos_referencia())
+
+    divergencias = motor_taxas.comparar_com_sql(
+        df_motor, df_sql, tolerancia=1e-6,
+        colunas=('net_worth', 'business_days_in_month', 'taxa_variavel', 'fee_min'),
+    )
+
+    assert divergencias.empty, divergencias.to_string()
+
+
+def test_comparacao_aponta_divergencia():
+    df_sql = ler_fixture('calculadora', 'saida_sql.csv')
+    df_sql.loc[0, 'acumulado'] += 1.0
+    df_motor = motor_taxas.calcular_provisoes(**insumos_referencia())
+
+    divergencias = motor_taxas.comparar_com_sql(df_motor, df_sql)
+
+    assert len(divergencias) == 1
+    assert divergencias.loc[0, 'fund_id'] == 10
+    assert divergencias.loc[0, 'date_ref'] == pd.Timestamp('2025-01-03')
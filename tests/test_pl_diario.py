@@ -0,0 +1,81 @@
+"""Comparação de bytes de PL antes/depois de finance.pl_diario com um cliente falso (dry run)"""
+import re
+from datetime import date
+import pandas as pd
+import calendario
+import pl_diario
+
+LIMITE_INFERIOR = re.compile(r'reference_dt >= DATE_SUB\(DATE_TRUNC\(@data_inicio, MONTH\), INTERVAL 1 MONTH\)', re.I)
+LIMITE_SUPERIOR = re.compile(r'reference_dt <= LAST_DAY\(@data_fim, MONTH\)', re.I)
+FILTRO_FUNDOS = re.compile(r'ARRAY_LENGTH\(@fund_ids\) = 0 OR fund_id IN UNNEST\(@fund_ids\)', re.I)
+LEITURA_FONTE = re.compile(r'from (?:`kanastra-live\.)?investment\.(?:quotas|wallet)', re.I)
+
+
+class JobFalso:
+    def __init__(self, total_bytes_processed, df=None):
+        self.total_bytes_processed = total_bytes_processed
+        self._df = df
+
+    def to_dataframe(self):
+        return self._df
+
+
+class ClienteFalso:
+    """Dry run com bytes fixos por consulta; guarda SQL e parâmetros de cada chamada"""
+
+    BYTES = {pl_diario.QUERY_PL_ANTES: 4000, pl_diario.QUERY_PL_DEPOIS: 300}
+    BYTES_CALCULADORA = 5000
+
+    def __init__(self):
+        self.consultas = []
+
+    def query(self, sql, job_config=None):
+        if sql == calendario.QUERY_CALENDARIO:
+            return JobFalso(0, pd.DataFrame({'date': pd.bdate_range('2024-01-01', '2027-12-31').date}))
+        assert job_config.dry_run
+        self.consultas.append((sql, job_config))
+        return JobFalso(self.BYTES.get(sql, self.BYTES_CALCULADORA))
+
+    def parametros(self, sql):
+        config = next(config for consulta, config in self.consultas if consulta == sql)
+        return {p.name: getattr(p, 'values', getattr(p, 'value', None)) for p in config.query_parameters}
+
+
+def medir(fund_ids=(10,)):
+    calendario.limpar_cache()
+    client = ClienteFalso()
+    resultado = pl_diario.comparar_bytes_processados(
+        client, 'SELECT 1 -- calculadora', date(2025, 1, 15), date(2025, 2, 10), fund_ids=fund_ids
+    )
+    calendario.limpar_cache()
+    return client, resultado
+
+
+def test_antes_e_depois_recebem_a_mesma_janela_e_fundos():
+    client, _ = medir()
+
+    esperado = {'data_inicio': date(2025, 1, 15), 'data_fim': date(2025, 2, 10), 'fund_ids': [10]}
+    assert client.parametros(pl_diario.QUERY_PL_ANTES) == esperado
+    assert client.parametros(pl_diario.QUERY_PL_DEPOIS) == esperado
+    assert client.parametros('SELECT 1 -- calculadora').items() >= esperado.items()
+
+
+def test_cada_leitura_de_pl_tem_os_dois_limites_e_o_filtro_de_fundos():
+    """Antes: quatro etapas × (quotas + wallet); depois: uma leitura de pl_diario"""
+    leituras_antes = len(LEITURA_FONTE.findall(pl_diario.QUERY_PL_ANTES))
+    assert leituras_antes == 8
+    for sql, leituras in ((pl_diario.QUERY_PL_ANTES, leituras_antes), (pl_diario.QUERY_PL_DEPOIS, 1)):
+        assert len(LIMITE_INFERIOR.findall(sql)) == leituras
+        assert len(LIMITE_SUPERIOR.findall(sql)) == leituras
+        assert len(FILTRO_FUNDOS.findall(sql)) == leituras
+
+
+def test_resultado_usa_os_bytes_de_cada_dry_run():
+    _, resultado = medir(fund_ids=())
+
+    assert resultado == {
+        'pl_antes': 4000,
+        'pl_depois': 300,
+        'reducao': 1 - 300 / 4000,
+        'calculadora': ClienteFalso.BYTES_CALCULADORA,
+    }
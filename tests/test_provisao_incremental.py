@@ -0,0 +1,52 @@
+"""Janela de recálculo das provisões incrementais (marca d'água por fundo)"""
+import pandas as pd
+import provisao_incremental
+
+
+def marcas(**por_fundo):
+    return pd.DataFrame({
+        'fund_id': [int(fundo.removeprefix('f')) for fundo in por_fundo],
+        'marca_dagua': pd.to_datetime(list(por_fundo.values())),
+    })
+
+
+def test_janela_por_fundo():
+    janelas, inicio_global = provisao_incremental.calcular_janela_recalculo(marcas(
+        f10='2025-03-31',  # fundo em dia
+        f41='2025-02-12',  # marca no meio do mês: recomeça no dia 1º (acumulado mensal)
+        f76='2024-10-15',  # inativo (> DIAS_FUNDO_INATIVO sem dados novos)
+    ))
+    inicio = dict(zip(janelas['fund_id'], janelas['inicio_recalculo']))
+
+    assert inicio_global == pd.Timestamp('2025-02-01')
+    assert inicio[10] == pd.Timestamp('2025-03-01')
+    assert inicio[41] == pd.Timestamp('2025-02-01')
+    # O inativo não puxa a janela para outubro: é recortado no início global
+    assert inicio[76] == inicio_global
+
+
+def test_inativo_fora_do_limite_nao_define_o_inicio_global():
+    _, com_inativo = provisao_incremental.calcular_janela_recalculo(marcas(f10='2025-03-31', f76='2024-01-10'))
+    _, sem_inativo = provisao_incremental.calcular_janela_recalculo(marcas(f10='2025-03-31'))
+    assert com_inativo == sem_inativo == pd.Timestamp('2025-03-01')
+
+
+def test_recorte_inclui_fundo_novo_a_partir_do_inicio_global():
+    janelas, inicio_global = provisao_incremental.calcular_janela_recalculo(marcas(f10='2025-03-14', f41='2025-02-12'))
+    dias = pd.date_range('2025-01-20', '2025-03-20', freq='D')
+    y = pd.DataFrame({
+        'date_ref': list(dias) * 3,
+        'fund_id': [10] * len(dias) + [41] * len(dias) + [999] * len(dias),  # 999: sem marca d'água
+        'acumulado': 1.0,
+    })
+
+    recortado = provisao_incremental.recortar_recalculo(y, janelas, inicio_global)
+    primeiro_dia = recortado.groupby('fund_id')['date_ref'].min()
+
+    assert list(recortado.columns) == ['date_ref', 'fund_id', 'acumulado']
+    assert primeiro_dia.to_dict() == {
+        10: pd.Timestamp('2025-03-01'),
+        41: pd.Timestamp('2025-02-01'),
+        999: inicio_global,
+    }
+    assert (recortado.groupby('fund_id')['date_ref'].max() == dias[-1]).all()
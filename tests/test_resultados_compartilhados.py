@@ -0,0 +1,29 @@
+"""Resultados compartilhados: uma cópia por chave, memória referenciada por sessão"""
+import pandas as pd
+from resultados_compartilhados import ResultadosCompartilhados, tamanho_bytes
+
+
+def test_sessoes_compartilham_o_mesmo_resultado():
+    resultados = ResultadosCompartilhados()
+    df = pd.DataFrame({'valor': range(1000)})
+    resultados.publicar('a', df, 's1')
+    assert resultados.obter('a', 's2') is df
+
+    estatisticas = resultados.estatisticas()
+    assert estatisticas['resultados'] == 1
+    assert estatisticas['sessoes'] == 2
+    assert estatisticas['resultados_em_uso'] == 1
+    assert estatisticas['bytes'] == tamanho_bytes(df)
+    assert resultados.memoria_por_sessao() == {'s1': tamanho_bytes(df), 's2': tamanho_bytes(df)}
+
+
+def test_orcamento_remove_primeiro_o_resultado_sem_sessao():
+    df = pd.DataFrame({'valor': range(1000)})
+    resultados = ResultadosCompartilhados(limite_bytes=2 * tamanho_bytes(df))
+    resultados.publicar('a', df, 's1')
+    resultados.publicar('b', df.copy(), 's2')
+    resultados.obter('b', 's1')  # 'a' fica sem sessão
+    resultados.publicar('c', df.copy(), 's3')
+
+    assert resultados.obter('a', 's4') is None
+    assert set(resultados.memoria_por_sessao()) == {'s1', 's2', 's3'}
@@ -0,0 +1,113 @@
+"""
+Tipos Compactos - Calculadora 5.0
+Converte o resultado da calculadora para tipos enxutos guiados pelo schema do BigQuery:
+textos repetidos viram categóricos, inteiros usam o menor tipo que comporta os valores
+e datas viram datetime64. Colunas monetárias (FLOAT64/NUMERIC) não são alteradas
+"""
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+import download_arrow
+
+# Textos com até esta fração de valores distintos (em relação às linhas) viram categóricos
+LIMITE_CARDINALIDADE = 0.5
+
+TIPOS_TEXTO = {'STRING'}
+TIPOS_INTEIRO = {'INTEGER', 'INT64'}
+TIPOS_DATA = {'DATE', 'DATETIME', 'TIMESTAMP'}
+
+_INTEIROS = [(np.int8, 'Int8'), (np.int16, 'Int16'), (np.int32, 'Int32'), (np.int64, 'Int64')]
+
+
+def _tipos_por_coluna(df, schema=None):
+    """Tipo BigQuery de cada coluna; sem schema, inferido pelo dtype do pandas"""
+    if schema is not None:
+        return {campo.name: campo.field_type for campo in schema if campo.name in df.columns}
+
+    tipos = {}
+    for coluna in df.columns:
+        serie = df[coluna]
+        if pd.api.types.is_integer_dtype(serie):
+            tipos[coluna] = 'INTEGER'
+        elif pd.api.types.is_datetime64_any_dtype(serie) or str(serie.dtype) == 'dbdate':
+            tipos[coluna] = 'DATE'
+        elif pd.api.types.is_string_dtype(serie) or serie.dtype == object:
+            # Colunas object podem trazer datetime.date (DATE sem db-dtypes) ou só nulos
+            validos = serie.dropna()
+            if validos.empty:
+                continue
+            primeiro = validos.iloc[0]
+            tipos[coluna] = 'DATE' if isinstance(primeiro, (date, datetime)) else 'STRING'
+    return tipos
+
+
+def _inteiro_compacto(serie):
+    """Menor inteiro (nullable se houver nulos) que comporta os valores"""
+    validos = serie.dropna()
+    if validos.empty:
+        return serie
+    minimo, maximo = int(validos.min()), int(validos.max())
+    for numpy_tipo, nullable_tipo in _INTEIROS:
+        limites = np.iinfo(numpy_tipo)
+        if limites.min <= minimo and maximo <= limites.max:
+            return serie.astype(nullable_tipo if serie.isna().any() else numpy_tipo)
+    return serie
+
+
+def _texto_compacto(serie):
+    """Categórico quando há poucos valores distintos (nomes, CNPJs, serviços)"""
+    if isinstance(serie.dtype, pd.CategoricalDtype) or len(serie) == 0:
+        return serie
+    if serie.nunique(dropna=True) <= LIMITE_CARDINALIDADE * len(serie):
+        return serie.astype('category')
+    return serie
+
+
+def _data_compacta(serie):
+    """datetime64 (sem fuso), dispensando `pd.to_datetime` e `.dt.date` nas telas"""
+    if pd.api.types.is_datetime64_any_dtype(serie) and getattr(serie.dt, 'tz', None) is None:
+        return serie
+    datas = pd.to_datetime(serie)
+    if getattr(datas.dt, 'tz', None) is not None:
+        datas = datas.dt.tz_localize(None)
+    return datas
+
+
+def compactar(df, schema=None):
+    """Converte as colunas para tipos compactos
+
+    Args:
+        df: Resultado da query
+        schema: `RowIterator.schema` do BigQuery (opcional; sem ele, usa os dtypes)
+
+    Returns:
+        (DataFrame compactado, dict com bytes_antes, bytes_depois e bytes_economizados)
+    """
+    bytes_antes = int(df.memory_usage(index=True, deep=True).sum())
+    colunas = {}
+    for coluna, tipo in _tipos_por_coluna(df, schema).items():
+        if tipo in TIPOS_INTEIRO:
+            colunas[coluna] = _inteiro_compacto(df[coluna])
+        elif tipo in TIPOS_TEXTO:
+            colunas[coluna] = _texto_compacto(df[coluna])
+        elif tipo in TIPOS_DATA:
+            colunas[coluna] = _data_compacta(df[coluna])
+
+    compacto = df.assign(**colunas) if colunas else df
+    bytes_depois = int(compacto.memory_usage(index=True, deep=True).sum())
+    return compacto, {
+        'bytes_antes': bytes_antes,
+        'bytes_depois': bytes_depois,
+        'bytes_economizados': bytes_antes - bytes_depois,
+    }
+
+
+def carregar_compacto(query_job, cliente_leitura=None, progresso=None):
+    """Baixa o resultado de um job (download Arrow) já com tipos compactos
+
+    Returns:
+        (DataFrame, dict de economia de memória, dict de tempos de query e transferência)
+    """
+    df, schema, tempos = download_arrow.baixar_dataframe(query_job, cliente_leitura, progresso)
+    df, economia = compactar(df, schema=schema)
+    return df, economia, tempos
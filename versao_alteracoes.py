@@ -0,0 +1,75 @@
+"""
+Versão de Alterações - Calculadora 5.0
+Registro único (`finance.versao_alteracoes`) incrementado por toda escrita do dashboard de
+gestão (alterações pendentes, aprovações, status). Os leitores comparam apenas o
+horário da última modificação dessa tabela (metadado, sem job de query) para saber se
+ajustes e pendências mudaram
+"""
+from datetime import timezone
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+
+TABELA_VERSAO = 'kanastra-live.finance.versao_alteracoes'
+
+# Tabelas observadas quando o registro de versão não existe (fallback por metadado)
+TABELAS_OBSERVADAS = [
+    'kanastra-live.finance.descontos',
+    'kanastra-live.finance.alteracoes_pendentes',
+]
+
+ESCOPO = 'alteracoes'
+
+QUERY_INCREMENTAR = f"""
+MERGE `{TABELA_VERSAO}` T
+USING (SELECT @escopo AS escopo) S
+ON T.escopo = S.escopo
+WHEN MATCHED THEN
+    UPDATE SET versao = T.versao + 1, atualizado_em = CURRENT_TIMESTAMP(), origem = @origem
+WHEN NOT MATCHED THEN
+    INSERT (escopo, versao, atualizado_em, origem)
+    VALUES (S.escopo, 1, CURRENT_TIMESTAMP(), @origem)
+"""
+
+
+def incrementar_versao(client, origem=None):
+    """Incrementa a versão após uma escrita
+
+    Não interrompe o fluxo de quem escreveu: se falhar, os leitores só percebem a
+    mudança quando o cache do timestamp expirar.
+
+    Args:
+        origem: Escrita que gerou a versão (ex.: 'alteracao_pendente', 'aprovacao')
+
+    Returns:
+        True se a versão foi incrementada
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter('escopo', 'STRING', ESCOPO),
+            bigquery.ScalarQueryParameter('origem', 'STRING', origem),
+        ]
+    )
+    try:
+        client.query(QUERY_INCREMENTAR, job_config=job_config).result()
+        return True
+    except Exception:
+        return False
+
+
+def _horario_local(modificado):
+    """Horário do BigQuery (UTC) como datetime local sem fuso, comparável a datetime.now()"""
+    if modificado.tzinfo is None:
+        modificado = modificado.replace(tzinfo=timezone.utc)
+    return modificado.astimezone().replace(tzinfo=None)
+
+
+def obter_ultima_modificacao(client):
+    """Horário da última alteração em ajustes ou pendências
+
+    Lê o `modified` da tabela de versão (chamada de metadados, sem bytes processados);
+    se ela não existir, usa o maior `modified` entre as tabelas observadas.
+    """
+    try:
+        return _horario_local(client.get_table(TABELA_VERSAO).modified)
+    except NotFound:
+        return max(_horario_local(client.get_table(tabela).modified) for tabela in TABELAS_OBSERVADAS)